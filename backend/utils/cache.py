@@ -0,0 +1,91 @@
+import logging
+
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+
+def get_redis_client(alias: str = "default"):
+    """
+    Return the Redis client of a django-redis cache, for the operations the cache API doesn't
+    have (eg. hashes, Lua scripts). Returns None if the cache isn't Redis, eg. in local development.
+    """
+
+    try:
+        from django_redis import get_redis_connection
+
+        return get_redis_connection(alias)
+    except (ImportError, NotImplementedError):
+        return None
+
+
+class CounterBuffer:
+    """
+    Buffer counter increments in a Redis hash, to write them to the database in batches instead
+    of one UPDATE per increment. Subclasses define the `KEY` of the hash and `update`, which adds
+    the counts to the database. `flush` is run periodically by a Celery task.
+
+    Without Redis (eg. local development), or if Redis fails, the increment is written right away.
+    """
+
+    KEY: str
+    BATCH_SIZE = 1000
+
+    # Read and delete the buffered counts atomically, so the increments recorded while flushing aren't lost
+    POP_SCRIPT = """
+    local counts = redis.call("HGETALL", KEYS[1])
+    redis.call("DEL", KEYS[1])
+    return counts
+    """
+
+    def record(self, object_id: int | str, amount: int = 1) -> None:
+        object_id = str(object_id)
+
+        client = get_redis_client()
+        if client is not None:
+            try:
+                client.hincrby(self.KEY, object_id, amount)
+                return
+            except RedisError:
+                logger.warning("Failed to buffer the %s increment of %s", self.KEY, object_id, exc_info=True)
+
+        self.update({object_id: amount})
+
+    def flush(self) -> int:
+        """
+        Write the buffered counts to the database.
+
+        Returns:
+            int: The number of updated objects
+        """
+
+        client = get_redis_client()
+        if client is None:
+            return 0
+
+        counts = client.eval(self.POP_SCRIPT, 1, self.KEY)
+        counts = {object_id.decode(): int(count) for object_id, count in zip(counts[::2], counts[1::2])}
+        if not counts:
+            return 0
+
+        try:
+            self.update(counts)
+        except Exception:
+            # Put the increments back, they are retried on the next flush
+            pipeline = client.pipeline(transaction=False)
+            for object_id, count in counts.items():
+                pipeline.hincrby(self.KEY, object_id, count)
+            pipeline.execute()
+            raise
+
+        return len(counts)
+
+    def update(self, counts: dict[str, int]) -> None:
+        """Add the counts to the database, by object ID"""
+        raise NotImplementedError
+
+    def batches(self, counts: dict[str, int]):
+        """Split the counts into lists of at most `BATCH_SIZE` (object ID, count) pairs"""
+        items = list(counts.items())
+        for i in range(0, len(items), self.BATCH_SIZE):
+            yield items[i : i + self.BATCH_SIZE]
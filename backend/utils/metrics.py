@@ -0,0 +1,35 @@
+import logging
+import os
+
+from prometheus_client import CollectorRegistry, multiprocess, start_http_server
+
+logger = logging.getLogger(__name__)
+
+
+def start_multiprocess_metrics_server(port: int) -> bool:
+    """
+    Serve the Prometheus metrics of all the processes of a prefork server (eg. a celery worker and
+    its pool processes) on the port, from the main process.
+
+    The metrics are shared through the files of `PROMETHEUS_MULTIPROC_DIR`, which must be set (and
+    emptied) before the processes start, since prometheus_client reads it when it's imported.
+
+    Returns:
+        bool: False if the port or `PROMETHEUS_MULTIPROC_DIR` isn't set, and no server was started
+    """
+
+    if not port or not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return False
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(port, registry=registry)
+    logger.info("Serving the Prometheus metrics on port %s", port)
+    return True
+
+
+def mark_process_dead(pid: int) -> None:
+    """Drop the live gauges of a process which exited, when running in multiprocess mode"""
+
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
@@ -1,12 +1,24 @@
+import hashlib
 import logging
+import threading
+import unicodedata
+from collections import OrderedDict
 
 from django.conf import settings
+from django.core.cache import cache
 from openai import OpenAI
+from prometheus_client import Counter
 
 logger = logging.getLogger(__name__)
 
 openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
 
+embedding_cache_requests = Counter(
+    "openai_embedding_cache_requests_total",
+    "Embedding cache lookups, labeled by the tier that answered them",
+    ["result"],
+)
+
 
 def get_embedding(text: str, model: str = "text-embedding-3-small") -> list[float]:
     """
@@ -50,3 +62,94 @@ def get_embeddings_batch(texts: list[str], model: str = "text-embedding-3-small"
     except Exception as e:
         logger.error(f"Failed to get batch embeddings: {e}")
         raise
+
+
+class EmbeddingCache:
+    """
+    Two-tier, content-addressed cache for text embeddings.
+
+    The key is derived from the normalized text and the model name, so the same query
+    typed with different casing or spacing hits the same entry. Lookups go through a
+    small in-process LRU first and fall back to the shared Django cache (Redis in production).
+    """
+
+    KEY_PREFIX = "openai_embedding"
+
+    def __init__(self, maxsize: int = 256, timeout: int = 60 * 60 * 24 * 7):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._local: OrderedDict[str, tuple[float, ...]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+    def make_key(self, text: str, model: str) -> str:
+        digest = hashlib.sha256(self.normalize(text).encode()).hexdigest()
+        return f"{self.KEY_PREFIX}:{model}:{digest}"
+
+    def get(self, text: str, model: str) -> list[float] | None:
+        key = self.make_key(text, model)
+
+        with self._lock:
+            embedding = self._local.get(key)
+            if embedding is not None:
+                self._local.move_to_end(key)
+
+        if embedding is not None:
+            embedding_cache_requests.labels(result="local_hit").inc()
+            return list(embedding)
+
+        embedding = cache.get(key)
+        if embedding is not None:
+            embedding_cache_requests.labels(result="shared_hit").inc()
+            self._set_local(key, embedding)
+            return list(embedding)
+
+        embedding_cache_requests.labels(result="miss").inc()
+        return None
+
+    def set(self, text: str, model: str, embedding: list[float]) -> None:
+        key = self.make_key(text, model)
+        embedding = tuple(embedding)
+        cache.set(key, embedding, timeout=self.timeout)
+        self._set_local(key, embedding)
+
+    def clear_local(self) -> None:
+        with self._lock:
+            self._local.clear()
+
+    def _set_local(self, key: str, embedding: tuple[float, ...]) -> None:
+        with self._lock:
+            self._local[key] = embedding
+            self._local.move_to_end(key)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+
+embedding_cache = EmbeddingCache()
+
+
+def get_cached_embedding(text: str, model: str = "text-embedding-3-small") -> list[float]:
+    """
+    Same as `get_embedding`, but serves repeated texts from the embedding cache
+    instead of calling the OpenAI API again.
+
+    Args:
+        text: The text to embed
+        model: The embedding model to use (default: text-embedding-3-small)
+
+    Returns:
+        List of floats representing the embedding vector
+
+    Raises:
+        Exception: If the API call fails
+    """
+    embedding = embedding_cache.get(text, model)
+    if embedding is not None:
+        return embedding
+
+    embedding = get_embedding(text, model=model)
+    embedding_cache.set(text, model, embedding)
+    return embedding
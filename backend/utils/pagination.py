@@ -0,0 +1,96 @@
+import hashlib
+import uuid
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.core.cache import cache
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _positive_int
+from rest_framework.utils.urls import replace_query_param
+
+
+class SnapshotCursorPagination(CursorPagination):
+    """
+    Cursor pagination for querysets ordered by an expensive computed value (eg. vector distance).
+
+    The first request evaluates the ordered queryset once, keeps the primary keys of the
+    top `max_results` rows as a short-lived snapshot in the cache and returns the cursor of
+    that snapshot. Following pages only slice the snapshot and fetch `page_size` rows by
+    primary key, so they don't repeat the distance computation and sort.
+
+    A snapshot is bound to the request path and query params, so a cursor can't be reused
+    with different filters. An expired or unknown cursor returns 404 like `CursorPagination`.
+    """
+
+    max_results = 1000
+    snapshot_timeout = 60 * 10
+    snapshot_key_prefix = "pagination_snapshot"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            self.snapshot_id = uuid.uuid4().hex
+            self.offset = 0
+            self.snapshot = list(queryset.values_list("pk", flat=True)[: self.max_results])
+            cache.set(self.get_snapshot_key(self.snapshot_id), self.snapshot, timeout=self.snapshot_timeout)
+        else:
+            self.snapshot_id, self.offset = cursor
+            self.snapshot = cache.get(self.get_snapshot_key(self.snapshot_id))
+            if self.snapshot is None:
+                raise NotFound(self.invalid_cursor_message)
+
+        page_pks = self.snapshot[self.offset : self.offset + self.page_size]
+        positions = {pk: index for index, pk in enumerate(page_pks)}
+
+        # Drop the ordering, the page is sorted in Python using the snapshot order
+        page = queryset.filter(pk__in=page_pks).order_by()
+        return sorted(page, key=lambda instance: positions[instance.pk])
+
+    def get_snapshot_key(self, snapshot_id: str) -> str:
+        ignored_params = {self.cursor_query_param, self.page_size_query_param}
+        params = sorted(
+            (key, value)
+            for key, values in self.request.query_params.lists()
+            for value in values
+            if key not in ignored_params
+        )
+        fingerprint = hashlib.sha256(f"{self.request.path}?{parse.urlencode(params)}".encode()).hexdigest()
+        return f"{self.snapshot_key_prefix}:{fingerprint}:{snapshot_id}"
+
+    def get_next_link(self):
+        if self.offset + self.page_size >= len(self.snapshot):
+            return None
+        return self.encode_cursor((self.snapshot_id, self.offset + self.page_size))
+
+    def get_previous_link(self):
+        if self.offset == 0:
+            return None
+        return self.encode_cursor((self.snapshot_id, max(self.offset - self.page_size, 0)))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            querystring = b64decode(encoded.encode("ascii")).decode("ascii")
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+
+            snapshot_id = tokens["s"][0]
+            offset = _positive_int(tokens.get("o", ["0"])[0], cutoff=self.max_results)
+        except (KeyError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return snapshot_id, offset
+
+    def encode_cursor(self, cursor):
+        snapshot_id, offset = cursor
+        querystring = parse.urlencode({"s": snapshot_id, "o": str(offset)})
+        encoded = b64encode(querystring.encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
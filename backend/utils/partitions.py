@@ -0,0 +1,154 @@
+import logging
+from datetime import date, datetime
+
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def add_months(month: date, months: int) -> date:
+    """First day of the month, `months` months after the month of `month`"""
+    year, index = divmod(month.year * 12 + month.month - 1 + months, 12)
+    return date(year, index + 1, 1)
+
+
+class MonthlyPartitions:
+    """
+    Manage the monthly range partitions of a PostgreSQL table partitioned by a timestamp column.
+
+    Partitions are named `<table>_pYYYY_MM` and hold the rows of one month (UTC). Rows outside the
+    existing partitions go to the `<table>_default` partition, so inserts never fail when the
+    partitions haven't been created ahead. Retention drops whole partitions, which takes
+    milliseconds instead of a DELETE scanning and bloating the table.
+
+    Example:
+        partitions = MonthlyPartitions("twitter_downloader_downloadedtweet")
+        partitions.create_ahead()
+        partitions.drop_before(timezone.now() - timedelta(days=30))
+    """
+
+    MONTHS_AHEAD = 3
+
+    def __init__(self, table: str, column: str = "created_at"):
+        self.table = table
+        self.column = column
+
+    @property
+    def default_partition(self) -> str:
+        return f"{self.table}_default"
+
+    def get_partition_name(self, month: date) -> str:
+        return f"{self.table}_p{month:%Y_%m}"
+
+    def is_partitioned(self) -> bool:
+        if connection.vendor != "postgresql":
+            return False
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", [self.table])
+            row = cursor.fetchone()
+        return bool(row and row[0])
+
+    def get_partitions(self) -> list[str]:
+        """Names of the monthly partitions, the default partition excluded, from the oldest"""
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT child.relname
+                FROM pg_inherits
+                JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+                WHERE pg_inherits.inhparent = to_regclass(%s)
+                """,
+                [self.table],
+            )
+            names = [name for (name,) in cursor.fetchall()]
+
+        prefix = f"{self.table}_p"
+        return sorted(name for name in names if name.startswith(prefix))
+
+    def get_month(self, partition: str) -> date:
+        year, month = partition.removeprefix(f"{self.table}_p").split("_")
+        return date(int(year), int(month), 1)
+
+    def create(self, month: date) -> None:
+        start, end = add_months(month, 0), add_months(month, 1)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS "{self.get_partition_name(start)}" PARTITION OF "{self.table}" '
+                f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00')"
+            )
+
+    def create_ahead(self, today: date | None = None) -> list[str]:
+        """Create the partitions of the current month and of the `MONTHS_AHEAD` next months"""
+
+        today = today or timezone.now().date()
+        existing = set(self.get_partitions())
+        created = []
+
+        for months in range(self.MONTHS_AHEAD + 1):
+            month = add_months(today, months)
+            name = self.get_partition_name(month)
+            if name in existing:
+                continue
+
+            try:
+                with transaction.atomic():
+                    self.create(month)
+            except DatabaseError:
+                # The default partition already has rows of that month, they'll expire from it
+                logger.exception("Failed to create the partition %s", name)
+                continue
+            created.append(name)
+
+        return created
+
+    def drop_before(self, cutoff: datetime) -> list[str]:
+        """Drop the partitions whose rows are all older than the cutoff"""
+
+        dropped = []
+
+        for name in self.get_partitions():
+            # The partitions are sorted, the next ones are newer
+            if add_months(self.get_month(name), 1) > cutoff.date():
+                break
+
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS "{name}"')
+            dropped.append(name)
+
+        return dropped
+
+    def delete_from_default(self, cutoff: datetime, chunk_size: int = 5000) -> int:
+        """Delete the rows older than the cutoff from the default partition, in chunks"""
+
+        deleted = 0
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM "{self.default_partition}" WHERE ctid = ANY(ARRAY('
+                    f'SELECT ctid FROM "{self.default_partition}" WHERE "{self.column}" < %s LIMIT %s))',
+                    [cutoff, chunk_size],
+                )
+                count = cursor.rowcount
+            deleted += count
+            if count < chunk_size:
+                return deleted
+
+
+def delete_in_chunks(queryset, chunk_size: int = 5000) -> int:
+    """
+    Delete the rows of the queryset in chunks of primary keys, each in its own transaction, so
+    no single DELETE holds locks or grows the WAL for long. Returns the number of deleted rows.
+    """
+
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list("pk", flat=True)[:chunk_size])
+        if not pks:
+            return deleted
+
+        with transaction.atomic():
+            count, _ = queryset.model._base_manager.filter(pk__in=pks).delete()
+        deleted += count
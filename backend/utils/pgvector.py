@@ -0,0 +1,79 @@
+import logging
+from functools import lru_cache
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# pgvector only accepts hnsw.ef_search values in this range
+HNSW_EF_SEARCH_MIN = 1
+HNSW_EF_SEARCH_MAX = 1000
+
+# Iterative index scans were introduced in pgvector 0.8.0
+HNSW_ITERATIVE_SCAN_MIN_VERSION = (0, 8, 0)
+
+
+def set_hnsw_ef_search(ef_search: int) -> None:
+    """
+    Set `hnsw.ef_search` for the current transaction.
+
+    A higher value makes HNSW index scans more accurate (better recall) at the cost of speed.
+    The value is applied with `set_config(..., is_local => true)`, so it only lives until the
+    end of the current transaction and must be called inside `transaction.atomic()`.
+
+    Args:
+        ef_search: Size of the dynamic candidate list used during the index scan
+
+    Raises:
+        ValueError: If ef_search is outside of the range accepted by pgvector
+    """
+    if not HNSW_EF_SEARCH_MIN <= ef_search <= HNSW_EF_SEARCH_MAX:
+        msg = f"hnsw.ef_search must be between {HNSW_EF_SEARCH_MIN} and {HNSW_EF_SEARCH_MAX}"
+        raise ValueError(msg)
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('hnsw.ef_search', %s, true)", [str(ef_search)])
+
+
+@lru_cache(maxsize=1)
+def get_pgvector_version() -> tuple[int, ...] | None:
+    """
+    Return the installed pgvector extension version (eg. `(0, 8, 0)`), or None if it is not installed.
+    The result is cached for the lifetime of the process.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        row = cursor.fetchone()
+
+    if not row:
+        return None
+
+    return tuple(int(part) for part in row[0].split(".") if part.isdigit())
+
+
+def set_hnsw_iterative_scan(mode: str = "strict_order") -> bool:
+    """
+    Enable `hnsw.iterative_scan` for the current transaction.
+
+    Without iterative scans an HNSW index scan returns at most `ef_search` candidates and the
+    WHERE clause is applied afterwards, so filtered queries can return fewer rows than requested.
+    With iterative scans pgvector keeps walking the graph until enough rows pass the filters.
+
+    Must be called inside `transaction.atomic()`.
+
+    Args:
+        mode: "strict_order" keeps results ordered by distance, "relaxed_order" is faster
+            but may return results slightly out of order
+
+    Returns:
+        bool: False if the installed pgvector is too old to support iterative scans
+    """
+    version = get_pgvector_version()
+    if version is None or version < HNSW_ITERATIVE_SCAN_MIN_VERSION:
+        logger.debug("pgvector %s does not support iterative index scans", version)
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('hnsw.iterative_scan', %s, true)", [mode])
+
+    return True
@@ -1,10 +1,29 @@
 import hashlib
 import hmac
 import json
-from typing import TypedDict
+import logging
+import os
+import threading
+import time
+import uuid
+from collections.abc import Iterable, Iterator
+from functools import cached_property
+from typing import Literal, TypedDict
 from urllib.parse import unquote
 
+import requests
 from django.http import HttpRequest
+from redis.exceptions import RedisError
+from requests.adapters import HTTPAdapter
+
+from backend.utils.cache import get_redis_client
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
 
 
 class TelegramMiniAppData(TypedDict):
@@ -22,45 +41,437 @@ class TelegramUser(TypedDict):
     username: str = ""
 
 
+class TelegramBotAPI:
+    """
+    Client for the Telegram Bot API.
+
+    All clients of the same bot token share one `requests.Session` per process, so the
+    connections to api.telegram.org are kept alive instead of doing a new TLS handshake for
+    every message. Requests have connect/read timeouts, and a 429 (Too Many Requests) is
+    retried after the `retry_after` seconds returned by Telegram.
+
+    Messages are paced by `TelegramRateLimiter`. Use `priority="bulk"` for background traffic
+    like broadcasts, so it gives way to the replies to the users.
+
+    Example:
+        TelegramBotAPI(bot_token).request("sendMessage", {"chat_id": chat_id, "text": "Hello"})
+    """
+
+    BASE_URL = "https://api.telegram.org"
+    # (connect, read) timeouts in seconds. Telegram may download remote media before answering.
+    TIMEOUT = (5, 60)
+    POOL_MAXSIZE = 10
+    MAX_RETRIES = 3
+    # Give up instead of blocking the worker when Telegram asks to wait longer than this
+    MAX_RETRY_AFTER = 30
+
+    _sessions: dict[tuple[int, str], requests.Session] = {}
+    _sessions_lock = threading.Lock()
+
+    def __init__(self, bot_token: str, priority: Literal["interactive", "bulk"] = "interactive"):
+        self.bot_token = bot_token
+        self.priority = priority
+
+    @classmethod
+    def get_session(cls, bot_token: str) -> requests.Session:
+        # Keyed by pid too, forked workers must not share the parent's connections
+        key = (os.getpid(), bot_token)
+        session = cls._sessions.get(key)
+        if session is None:
+            with cls._sessions_lock:
+                session = cls._sessions.get(key)
+                if session is None:
+                    session = requests.Session()
+                    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=cls.POOL_MAXSIZE))
+                    cls._sessions[key] = session
+        return session
+
+    def request(self, method: str, payload: dict | None = None, files: dict | None = None) -> requests.Response:
+        """
+        Call a Bot API method, eg. `sendMessage`.
+
+        Args:
+            method: The Bot API method name
+            payload: The method parameters, sent as JSON (or as form fields when uploading `files`)
+            files: Files to upload as multipart/form-data
+
+        Returns:
+            requests.Response: The last response, check `response.ok`
+        """
+
+        url = f"{self.BASE_URL}/bot{self.bot_token}/{method}"
+        session = self.get_session(self.bot_token)
+
+        if self.is_rate_limited(method):
+            TelegramRateLimiter(self.bot_token, self.priority).acquire((payload or {}).get("chat_id"))
+
+        for attempt in range(self.MAX_RETRIES + 1):
+            if files:
+                response = session.post(url, data=payload, files=files, timeout=self.TIMEOUT)
+            else:
+                response = session.post(url, json=payload, timeout=self.TIMEOUT)
+
+            retry_after = self.get_retry_after(response)
+            if retry_after is None or retry_after > self.MAX_RETRY_AFTER or attempt == self.MAX_RETRIES:
+                return response
+
+            logger.warning("Telegram %s rate limited, retrying in %s seconds", method, retry_after)
+            time.sleep(retry_after)
+
+        return response
+
+    def upload(self, method: str, file: "MultipartStream") -> requests.Response:
+        """
+        Call a Bot API method uploading a file streamed by `MultipartStream`, eg. a video relayed from
+        another server. A stream can only be sent once, so 429 responses aren't retried.
+        """
+
+        url = f"{self.BASE_URL}/bot{self.bot_token}/{method}"
+        session = self.get_session(self.bot_token)
+
+        if self.is_rate_limited(method):
+            TelegramRateLimiter(self.bot_token, self.priority).acquire(file.fields.get("chat_id"))
+
+        return session.post(url, data=file, headers={"Content-Type": file.content_type}, timeout=self.TIMEOUT)
+
+    @staticmethod
+    def is_rate_limited(method: str) -> bool:
+        """Telegram rate limits the messages, not the other methods (eg. `sendChatAction`, `setWebhook`)"""
+
+        return method.startswith(("send", "forward", "copy")) and method != "sendChatAction"
+
+    @staticmethod
+    def get_retry_after(response: requests.Response) -> int | None:
+        """Return the seconds to wait before retrying a rate limited request, or None if it wasn't rate limited."""
+
+        if response.status_code != 429:
+            return None
+
+        try:
+            return int(response.json()["parameters"]["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            return 1
+
+
+class MultipartStream:
+    """
+    A multipart/form-data request body made of form fields and one file, whose content is read from
+    an iterator of chunks while the body is sent, eg. `response.iter_content()` of a download. Only
+    one chunk is held in memory at a time.
+
+    The size of the file must be known: the body has a length, so requests sends it with a
+    Content-Length header instead of the chunked transfer encoding.
+
+    Example:
+        stream = MultipartStream({"chat_id": chat_id}, "video", "video.mp4", response.iter_content(65536), size)
+        TelegramBotAPI(bot_token).upload("sendVideo", stream)
+    """
+
+    def __init__(
+        self,
+        fields: dict,
+        name: str,
+        filename: str,
+        chunks: Iterable[bytes],
+        size: int,
+        content_type: str = "application/octet-stream",
+    ):
+        self.boundary = uuid.uuid4().hex
+        self.fields = fields
+        self.chunks = chunks
+        self.size = size
+
+        parts = []
+        for field, value in fields.items():
+            if value is None:
+                continue
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value)
+            elif isinstance(value, bool):
+                value = str(value).lower()
+            parts.append(
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="{field}"\r\n\r\n{value}\r\n'.encode()
+            )
+        parts.append(
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n".encode()
+        )
+
+        self.head = b"".join(parts)
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode()
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return len(self.head) + self.size + len(self.tail)
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield self.head
+
+        sent = 0
+        for chunk in self.chunks:
+            sent += len(chunk)
+            if sent > self.size:
+                raise ValueError(f"The file is larger than its size of {self.size} bytes")
+            yield chunk
+
+        if sent != self.size:
+            raise ValueError(f"The file is smaller ({sent} bytes) than its size of {self.size} bytes")
+        yield self.tail
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket, refilled at `rate` tokens per second up to `capacity` tokens.
+
+    Example:
+        rate_limiter = TokenBucket(rate=25, capacity=25)
+        rate_limiter.acquire()  # Blocks until a token is available
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """Take a token if one is available. Returns 0 if a token was taken, else the seconds to wait for one."""
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self) -> None:
+        while wait := self.try_acquire():
+            time.sleep(wait)
+
+
+class TelegramRateLimiter:
+    """
+    Rate limiter for the messages sent through the Telegram Bot API, shared by all processes.
+
+    Telegram allows ~30 messages per second per bot, 1 message per second per private chat and
+    20 messages per minute per group or channel. The token buckets of the bots and of the chats
+    are kept in Redis and updated atomically by a Lua script.
+
+    Bulk traffic (eg. broadcasts) can't use the last `INTERACTIVE_RESERVE` tokens of a bot
+    bucket, so the replies to the users are sent first and broadcasts take what is left.
+
+    Without Redis (eg. local development), falls back to a token bucket per bot and process.
+    """
+
+    KEY_PREFIX = "telegram_rate_limit"
+    BOT_RATE = 30
+    BOT_CAPACITY = 30
+    INTERACTIVE_RESERVE = 10
+    PRIVATE_CHAT_RATE = 1
+    GROUP_CHAT_RATE = 20 / 60
+    CHAT_CAPACITY = 3
+    # Send anyway (and rely on the 429 retries) rather than blocking the worker longer than this
+    MAX_WAIT = 30
+
+    # KEYS: bot bucket, [chat bucket]
+    # ARGV: bot rate, bot capacity, reserved bot tokens, [chat rate, chat capacity]
+    # Returns the seconds to wait as a string (Lua numbers are truncated to integers), "0" if the tokens were taken.
+    SCRIPT = """
+    local time = redis.call("TIME")
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+    local buckets = {}
+    local wait = 0
+    for i, key in ipairs(KEYS) do
+        local rate = tonumber(ARGV[i == 1 and 1 or 4])
+        local capacity = tonumber(ARGV[i == 1 and 2 or 5])
+        local required = 1 + (i == 1 and tonumber(ARGV[3]) or 0)
+
+        local bucket = redis.call("HMGET", key, "tokens", "updated_at")
+        local tokens = tonumber(bucket[1]) or capacity
+        local updated_at = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+
+        if tokens < required then
+            wait = math.max(wait, (required - tokens) / rate)
+        end
+        buckets[i] = {key, tokens, math.ceil(capacity / rate * 1000) + 1000}
+    end
+
+    if wait > 0 then
+        return tostring(wait)
+    end
+
+    for _, bucket in ipairs(buckets) do
+        redis.call("HSET", bucket[1], "tokens", tostring(bucket[2] - 1), "updated_at", tostring(now))
+        redis.call("PEXPIRE", bucket[1], bucket[3])
+    end
+    return "0"
+    """
+
+    _local_buckets: dict[str, TokenBucket] = {}
+    _local_buckets_lock = threading.Lock()
+
+    def __init__(self, bot_token: str, priority: Literal["interactive", "bulk"] = "interactive"):
+        # Only the bot ID, the token itself must not end up in Redis
+        self.bot_id = bot_token.split(":")[0]
+        self.bot_token = bot_token
+        self.priority = priority
+
+    @staticmethod
+    def get_redis_client():
+        return get_redis_client()
+
+    @classmethod
+    def get_chat_rate(cls, chat_id: int | str) -> float:
+        # Groups and channels have negative IDs or a public @username
+        chat_id = str(chat_id)
+        return cls.GROUP_CHAT_RATE if chat_id.startswith(("-", "@")) else cls.PRIVATE_CHAT_RATE
+
+    def acquire(self, chat_id: int | str | None = None) -> float:
+        """
+        Block until a message can be sent to `chat_id`.
+
+        Returns:
+            float: The seconds spent waiting
+        """
+
+        waited = 0.0
+        while wait := self.try_acquire(chat_id):
+            if waited + wait > self.MAX_WAIT:
+                logger.warning("Telegram rate limit wait for chat %s exceeded %s seconds", chat_id, self.MAX_WAIT)
+                break
+
+            time.sleep(wait)
+            waited += wait
+
+        return waited
+
+    def try_acquire(self, chat_id: int | str | None = None) -> float:
+        """Take the tokens to send a message. Returns 0 if they were taken, else the seconds to wait."""
+
+        client = self.get_redis_client()
+        if client is None:
+            return self.get_local_bucket().try_acquire()
+
+        keys = [f"{self.KEY_PREFIX}:{self.bot_id}"]
+        args = [self.BOT_RATE, self.BOT_CAPACITY, self.INTERACTIVE_RESERVE if self.priority == "bulk" else 0]
+        if chat_id is not None:
+            keys.append(f"{self.KEY_PREFIX}:{self.bot_id}:{chat_id}")
+            args += [self.get_chat_rate(chat_id), self.CHAT_CAPACITY]
+
+        try:
+            return float(client.eval(self.SCRIPT, len(keys), *keys, *args))
+        except RedisError:
+            logger.warning("Failed to check the Telegram rate limit in Redis", exc_info=True)
+            return self.get_local_bucket().try_acquire()
+
+    def get_local_bucket(self) -> TokenBucket:
+        bucket = self._local_buckets.get(self.bot_id)
+        if bucket is None:
+            with self._local_buckets_lock:
+                bucket = self._local_buckets.setdefault(self.bot_id, TokenBucket(self.BOT_RATE, self.BOT_CAPACITY))
+        return bucket
+
+
+def loads_json(data: bytes | str):
+    """Decode JSON with orjson when it's installed, it's several times faster than the json module"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class TelegramUpdate:
+    """
+    A Telegram update, decoded once into plain attributes.
+
+    Covers the `message`, `edited_message` and `callback_query` updates. For the other kinds of
+    updates only `update_id` and `kind` are set.
+    """
+
+    KINDS = ("message", "edited_message", "callback_query")
+
+    __slots__ = ("update_id", "kind", "user", "chat_id", "message_id", "text", "callback_query_id", "callback_data")
+
+    def __init__(self, payload: dict):
+        self.update_id = payload.get("update_id")
+        self.kind = next((kind for kind in self.KINDS if payload.get(kind)), None)
+        self.user = None
+        self.chat_id = None
+        self.message_id = None
+        self.text = ""
+        self.callback_query_id = None
+        self.callback_data = ""
+
+        if self.kind == "callback_query":
+            callback_query = payload["callback_query"]
+            self.user = callback_query.get("from")
+            self.callback_query_id = callback_query.get("id")
+            self.callback_data = callback_query.get("data", "")
+            message = callback_query.get("message") or {}
+        elif self.kind:
+            message = payload[self.kind]
+            self.user = message.get("from")
+            self.text = message.get("text", "")
+        else:
+            return
+
+        self.chat_id = (message.get("chat") or {}).get("id")
+        self.message_id = message.get("message_id")
+
+    @classmethod
+    def from_json(cls, data: bytes | str) -> "TelegramUpdate | None":
+        """Decode an update from the webhook request body. Returns None if it's not a JSON object."""
+        try:
+            payload = loads_json(data)
+        except (TypeError, ValueError):
+            return None
+
+        if not isinstance(payload, dict):
+            return None
+        return cls(payload)
+
+
 class TelegramWebhookParser:
+    """Parse the body of a Telegram webhook request. The body is decoded once, into `update`."""
+
     def __init__(self, request_data: HttpRequest):
         self.request_data = request_data
+        self.update = TelegramUpdate.from_json(request_data)
 
-    @property
+    @cached_property
     def data(self) -> dict | None:
-        try:
-            data = json.loads(self.request_data)
-        except Exception:
-            return None
+        update = self.update
 
         # Reject if not first message (eg. edited or deleted message)
-        if not data.get("message"):
+        if not update or update.kind != "message":
             return None
 
         # Reject if messaage is not text message
-        if data.get("message") and not data.get("message").get("text"):
+        if not update.text or not update.user:
             return None
 
-        user = data.get("message").get("from")
-        message = data.get("message").get("text", "")
-
-        return {"user": user, "text_message": message}
+        return {"user": update.user, "text_message": update.text}
 
     def get_user(self) -> TelegramUser:
         required_keys = ["first_name", "id"]
 
-        try:
-            payload = json.loads(self.request_data)
-        except Exception:
+        if self.update is None:
             raise Exception("Failed to parse JSON payload ☠️")
 
-        message = payload.get("message", None)
-        edited_message = payload.get("edited_message", None)
-
-        if not message and not edited_message:
+        if self.update.kind not in ("message", "edited_message"):
             raise Exception("Unable to find `message` and `edited_message` data 😿")
 
-        user_data = message.get("from") or edited_message.get("from")
+        user_data = self.update.user or {}
 
         for key in required_keys:
             if not user_data.get(key):
@@ -74,18 +485,13 @@ class TelegramWebhookParser:
         }
 
     def get_text_message(self) -> str:
-        try:
-            payload = json.loads(self.request_data)
-        except Exception:
+        if self.update is None:
             raise Exception("Failed to parse JSON payload ☠️")
 
-        message = payload.get("message", None)
-
-        if not message:
+        if self.update.kind != "message":
             raise Exception("Message is not available 😿")
 
-        text = message.get("text")
-        return text
+        return self.update.text
 
 
 def validate_telegram_mini_app_data(
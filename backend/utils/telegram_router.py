@@ -0,0 +1,148 @@
+import re
+import time
+from collections.abc import Callable
+from typing import Any
+
+from prometheus_client import Histogram
+
+command_seconds = Histogram(
+    "telegram_bot_command_seconds",
+    "Text messages handled by the Telegram bots, labeled by bot and command",
+    ["bot", "command"],
+)
+
+
+class CommandMessage:
+    """A text message routed by `CommandRouter`, passed to the middlewares and the handler"""
+
+    __slots__ = ("user", "text", "command", "match")
+
+    def __init__(self, user, text: str, command: str, match: re.Match | None = None):
+        self.user = user
+        self.text = text
+        self.command = command
+        self.match = match
+
+
+class Route:
+    __slots__ = ("name", "handler", "middlewares", "metric")
+
+    def __init__(self, bot: str, name: str, handler: Callable, middlewares: list[Callable]):
+        self.name = name
+        self.handler = handler
+        self.middlewares = middlewares
+        self.metric = command_seconds.labels(bot, name)
+
+
+class CommandRouter:
+    """
+    Route the text messages of a Telegram bot to their handlers.
+
+    The route of a message is found with one dict lookup for the commands (eg. `/start`, or
+    `/start@bot`), then one search with a regex compiled from all the patterns, so adding routes
+    doesn't add work per message. Messages matching nothing go to the `default` handler.
+
+    The middlewares of the router, then those of the route, run before the handler. A middleware
+    returning anything but None stops the message, and its result is returned by `dispatch`
+    (eg. after replying to a banned user). The time spent on each route, middlewares included,
+    is recorded in the `telegram_bot_command_seconds` histogram.
+
+    Handlers and middlewares are called with the extra arguments given to `dispatch`, then the
+    `CommandMessage`, so methods can be routed from the class body:
+
+        class UpdateHandler:
+            router = CommandRouter("my_bot")
+
+            @router.command("/start")
+            def handle_start_command(self, message):
+                message.user.send_message("Welcome!")
+
+            def handle(self, user, text):
+                return self.router.dispatch(text, user, self)
+    """
+
+    def __init__(self, bot: str, middlewares: list[Callable] | None = None):
+        self.bot = bot
+        self.middlewares = list(middlewares or [])
+        self.commands: dict[str, Route] = {}
+        self.patterns: list[tuple[str, Route]] = []
+        self.compiled_patterns: re.Pattern | None = None
+        self.default_route: Route | None = None
+
+    def route(self, name: str, handler: Callable, middlewares: list[Callable] | None) -> Route:
+        return Route(self.bot, name, handler, self.middlewares + list(middlewares or []))
+
+    def command(self, *names: str, middlewares: list[Callable] | None = None) -> Callable:
+        """Route the messages starting with one of the commands, eg. `@router.command("/start")`"""
+
+        def decorator(handler: Callable) -> Callable:
+            route = self.route(names[0].lower(), handler, middlewares)
+            for name in names:
+                self.commands[name.lower()] = route
+            return handler
+
+        return decorator
+
+    def match(self, pattern: str, name: str, middlewares: list[Callable] | None = None) -> Callable:
+        """
+        Route the messages containing the (case-insensitive) regex pattern. The match is in `message.match`.
+        The patterns are compiled together, each wrapped in a `route<N>` group: use named groups, unique
+        across the patterns of the router and not starting with `route`, instead of numbered ones.
+        """
+
+        if re.search(r"\(\?P<route", pattern):
+            raise ValueError(f"The group names of the pattern {pattern!r} can't start with `route`")
+
+        def decorator(handler: Callable) -> Callable:
+            self.patterns.append((pattern, self.route(name, handler, middlewares)))
+            self.compiled_patterns = re.compile(
+                "|".join(f"(?P<route{i}>{pattern})" for i, (pattern, _) in enumerate(self.patterns)),
+                re.IGNORECASE,
+            )
+            return handler
+
+        return decorator
+
+    def default(self, middlewares: list[Callable] | None = None) -> Callable:
+        """Route the messages matching no command nor pattern"""
+
+        def decorator(handler: Callable) -> Callable:
+            self.default_route = self.route("other", handler, middlewares)
+            return handler
+
+        return decorator
+
+    def resolve(self, text: str) -> tuple[Route | None, re.Match | None]:
+        if text.startswith("/"):
+            command = text.split(maxsplit=1)[0].split("@", 1)[0].lower()
+            route = self.commands.get(command)
+            if route:
+                return route, None
+
+        if self.compiled_patterns:
+            match = self.compiled_patterns.search(text)
+            if match:
+                # The route is the top-level group which matched, not `lastgroup` which may be a group of the pattern
+                for i, (_, route) in enumerate(self.patterns):
+                    if match.group(f"route{i}") is not None:
+                        return route, match
+
+        return self.default_route, None
+
+    def dispatch(self, text: str, user, *args) -> Any:
+        """Run the middlewares and the handler of the message. Returns the result of the one which ran last."""
+
+        route, match = self.resolve(text)
+        if route is None:
+            return None
+
+        message = CommandMessage(user, text, route.name, match)
+        start = time.perf_counter()
+        try:
+            for middleware in route.middlewares:
+                result = middleware(*args, message)
+                if result is not None:
+                    return result
+            return route.handler(*args, message)
+        finally:
+            route.metric.observe(time.perf_counter() - start)
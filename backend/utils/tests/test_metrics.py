@@ -0,0 +1,28 @@
+import os
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from backend.utils.metrics import start_multiprocess_metrics_server
+
+
+@patch("backend.utils.metrics.start_http_server")
+class TestStartMultiprocessMetricsServer(SimpleTestCase):
+    def test_disabled_without_port(self, mock_start_http_server):
+        with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": "/tmp"}):
+            self.assertFalse(start_multiprocess_metrics_server(0))
+        mock_start_http_server.assert_not_called()
+
+    def test_disabled_without_multiprocess_dir(self, mock_start_http_server):
+        with patch.dict(os.environ, clear=True):
+            self.assertFalse(start_multiprocess_metrics_server(9808))
+        mock_start_http_server.assert_not_called()
+
+    @patch("backend.utils.metrics.multiprocess.MultiProcessCollector")
+    def test_serves_the_metrics_of_all_the_processes(self, mock_collector, mock_start_http_server):
+        with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": "/tmp"}):
+            self.assertTrue(start_multiprocess_metrics_server(9808))
+
+        registry = mock_start_http_server.call_args.kwargs["registry"]
+        mock_start_http_server.assert_called_once_with(9808, registry=registry)
+        mock_collector.assert_called_once_with(registry)
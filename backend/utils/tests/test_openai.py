@@ -0,0 +1,43 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from backend.utils.openai import embedding_cache, get_cached_embedding
+
+
+@patch("backend.utils.openai.get_embedding", return_value=[0.1, 0.2, 0.3])
+class TestGetCachedEmbedding(TestCase):
+    def setUp(self):
+        cache.clear()
+        embedding_cache.clear_local()
+
+    def test_repeated_query_calls_api_once(self, mock_get_embedding):
+        self.assertEqual(get_cached_embedding("Space Adventure"), [0.1, 0.2, 0.3])
+        self.assertEqual(get_cached_embedding("Space Adventure"), [0.1, 0.2, 0.3])
+        mock_get_embedding.assert_called_once_with("Space Adventure", model="text-embedding-3-small")
+
+    def test_query_is_normalized(self, mock_get_embedding):
+        get_cached_embedding("Space Adventure")
+        get_cached_embedding("  space   ADVENTURE ")
+        self.assertEqual(mock_get_embedding.call_count, 1, "Should reuse the cached embedding")
+
+    def test_cache_is_keyed_by_model(self, mock_get_embedding):
+        get_cached_embedding("Space Adventure")
+        get_cached_embedding("Space Adventure", model="text-embedding-3-large")
+        self.assertEqual(mock_get_embedding.call_count, 2, "Should not share embeddings between models")
+
+    def test_shared_cache_is_used_when_local_cache_is_empty(self, mock_get_embedding):
+        get_cached_embedding("Space Adventure")
+        embedding_cache.clear_local()
+
+        self.assertEqual(get_cached_embedding("Space Adventure"), [0.1, 0.2, 0.3])
+        self.assertEqual(mock_get_embedding.call_count, 1, "Should be served from the shared cache")
+
+    def test_local_cache_evicts_least_recently_used(self, mock_get_embedding):
+        with patch.object(embedding_cache, "maxsize", 2):
+            for text in ("first", "second", "third"):
+                get_cached_embedding(text)
+
+            self.assertEqual(len(embedding_cache._local), 2)
+            self.assertNotIn(embedding_cache.make_key("first", "text-embedding-3-small"), embedding_cache._local)
@@ -0,0 +1,97 @@
+from datetime import date, datetime, timezone
+
+from django.db import DatabaseError, connection, transaction
+from django.test import SimpleTestCase, TestCase
+
+from backend.utils.partitions import MonthlyPartitions, add_months
+
+
+class TestAddMonths(SimpleTestCase):
+    def test_add_months(self):
+        self.assertEqual(add_months(date(2026, 10, 17), 0), date(2026, 10, 1))
+        self.assertEqual(add_months(date(2026, 10, 17), 3), date(2027, 1, 1))
+        self.assertEqual(add_months(date(2026, 1, 31), -1), date(2025, 12, 1))
+
+
+class TestMonthlyPartitions(TestCase):
+    TABLE = "test_partitioned_events"
+
+    def setUp(self):
+        # Dropped with the rollback of the test
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE {self.TABLE} (id serial, created_at timestamp with time zone NOT NULL) "
+                "PARTITION BY RANGE (created_at)"
+            )
+            cursor.execute(f"CREATE TABLE {self.TABLE}_default PARTITION OF {self.TABLE} DEFAULT")
+        self.partitions = MonthlyPartitions(self.TABLE)
+
+    def _insert(self, *timestamps: datetime) -> None:
+        with connection.cursor() as cursor:
+            for timestamp in timestamps:
+                cursor.execute(f"INSERT INTO {self.TABLE} (created_at) VALUES (%s)", [timestamp])
+
+    def _count(self, table: str) -> int:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            return cursor.fetchone()[0]
+
+    def test_is_partitioned(self):
+        self.assertTrue(self.partitions.is_partitioned())
+        self.assertFalse(MonthlyPartitions("django_migrations").is_partitioned())
+
+    def test_create_ahead_is_idempotent(self):
+        created = self.partitions.create_ahead(today=date(2026, 11, 17))
+
+        self.assertEqual(
+            created,
+            [f"{self.TABLE}_p2026_11", f"{self.TABLE}_p2026_12", f"{self.TABLE}_p2027_01", f"{self.TABLE}_p2027_02"],
+        )
+        self.assertEqual(self.partitions.create_ahead(today=date(2026, 11, 17)), [])
+        self.partitions.create(date(2026, 11, 1))
+        self.assertEqual(self.partitions.get_partitions(), created)
+
+    def test_rows_go_to_their_month(self):
+        self.partitions.create(date(2026, 10, 1))
+        self._insert(datetime(2026, 10, 31, 23, 59, tzinfo=timezone.utc), datetime(2026, 11, 1, tzinfo=timezone.utc))
+
+        self.assertEqual(self._count(f"{self.TABLE}_p2026_10"), 1)
+        self.assertEqual(self._count(f"{self.TABLE}_default"), 1, "Should keep the rows of other months in default")
+
+    def test_create_with_rows_of_the_month_in_default(self):
+        self._insert(datetime(2026, 10, 5, tzinfo=timezone.utc))
+
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            self.partitions.create(date(2026, 10, 1))
+
+        with self.assertLogs("backend.utils.partitions", level="ERROR"):
+            created = self.partitions.create_ahead(today=date(2026, 10, 17))
+        self.assertNotIn(f"{self.TABLE}_p2026_10", created, "Should skip the month, its rows expire from default")
+        self.assertEqual(len(created), 3)
+        self.assertEqual(self._count(self.TABLE), 1)
+
+    def test_drop_before_only_drops_older_partitions(self):
+        for month in (date(2026, 8, 1), date(2026, 9, 1), date(2026, 10, 1)):
+            self.partitions.create(month)
+
+        # September still has rows newer than the cutoff
+        dropped = self.partitions.drop_before(datetime(2026, 9, 15, tzinfo=timezone.utc))
+
+        self.assertEqual(dropped, [f"{self.TABLE}_p2026_08"])
+        self.assertEqual(self.partitions.get_partitions(), [f"{self.TABLE}_p2026_09", f"{self.TABLE}_p2026_10"])
+
+        dropped = self.partitions.drop_before(datetime(2026, 10, 1, tzinfo=timezone.utc))
+        self.assertEqual(dropped, [f"{self.TABLE}_p2026_09"])
+
+    def test_delete_from_default(self):
+        self._insert(
+            datetime(2025, 1, 1, tzinfo=timezone.utc),
+            datetime(2025, 2, 1, tzinfo=timezone.utc),
+            datetime(2025, 3, 1, tzinfo=timezone.utc),
+            datetime(2026, 10, 1, tzinfo=timezone.utc),
+        )
+
+        deleted = self.partitions.delete_from_default(datetime(2026, 1, 1, tzinfo=timezone.utc), chunk_size=2)
+
+        self.assertEqual(deleted, 3)
+        self.assertEqual(self._count(f"{self.TABLE}_default"), 1)
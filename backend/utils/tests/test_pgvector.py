@@ -0,0 +1,31 @@
+from unittest.mock import patch
+
+from django.db import connection, transaction
+from django.test import TestCase
+
+from backend.utils.pgvector import get_pgvector_version, set_hnsw_ef_search, set_hnsw_iterative_scan
+
+
+class TestPgvectorSettings(TestCase):
+    def _current_setting(self, name: str) -> str:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT current_setting(%s, true)", [name])
+            return cursor.fetchone()[0]
+
+    def test_set_hnsw_ef_search(self):
+        with transaction.atomic():
+            set_hnsw_ef_search(123)
+            self.assertEqual(self._current_setting("hnsw.ef_search"), "123")
+
+    def test_set_hnsw_ef_search_rejects_out_of_range_values(self):
+        for ef_search in (0, 1001):
+            with self.assertRaises(ValueError):
+                set_hnsw_ef_search(ef_search)
+
+    def test_get_pgvector_version(self):
+        version = get_pgvector_version()
+        self.assertIsInstance(version, tuple)
+
+    @patch("backend.utils.pgvector.get_pgvector_version", return_value=(0, 7, 4))
+    def test_set_hnsw_iterative_scan_is_skipped_on_old_pgvector(self, mock_version):
+        self.assertFalse(set_hnsw_iterative_scan())
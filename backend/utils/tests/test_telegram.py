@@ -1,8 +1,21 @@
 import json
+from io import BytesIO
+from unittest.mock import Mock, patch
 
+import requests
+from django.core.files.uploadhandler import MemoryFileUploadHandler
+from django.http.multipartparser import MultiPartParser
 from django.test import TestCase
+from redis.exceptions import ConnectionError as RedisConnectionError
 
-from backend.utils.telegram import TelegramWebhookParser
+from backend.utils.telegram import (
+    MultipartStream,
+    TelegramBotAPI,
+    TelegramRateLimiter,
+    TelegramUpdate,
+    TelegramWebhookParser,
+    TokenBucket,
+)
 
 
 class TestTelegramWebhookParser(TestCase):
@@ -34,3 +47,264 @@ class TestTelegramWebhookParser(TestCase):
         text_message = webhook.get_text_message()
 
         self.assertEqual(text_message, "/start")
+
+    @patch("backend.utils.telegram.loads_json", wraps=json.loads)
+    def test_decode_once(self, mock_loads_json):
+        webhook = TelegramWebhookParser(self.request_data_1)
+        webhook.data, webhook.data, webhook.get_user(), webhook.get_text_message()
+
+        mock_loads_json.assert_called_once()
+        self.assertEqual(webhook.data["text_message"], "/start")
+        self.assertEqual(webhook.data["user"]["id"], 1111111)
+
+    def test_edited_message(self):
+        webhook = TelegramWebhookParser(
+            json.dumps(
+                {
+                    "update_id": 10001,
+                    "edited_message": {
+                        "chat": {"id": 1111111},
+                        "message_id": 1365,
+                        "from": {"id": 1111111, "first_name": "Arter"},
+                        "text": "/help",
+                    },
+                }
+            )
+        )
+
+        self.assertIsNone(webhook.data, "Should only accept new text messages")
+        self.assertEqual(webhook.update.kind, "edited_message")
+        self.assertEqual(webhook.update.text, "/help")
+        self.assertEqual(webhook.get_user()["first_name"], "Arter")
+
+    def test_callback_query(self):
+        update = TelegramUpdate.from_json(
+            json.dumps(
+                {
+                    "update_id": 10002,
+                    "callback_query": {
+                        "id": "4382bfdwdsb323b2d9",
+                        "from": {"id": 1111111, "first_name": "Arter"},
+                        "message": {"chat": {"id": 2222222}, "message_id": 1366, "text": "Choose"},
+                        "data": "quality:HD",
+                    },
+                }
+            )
+        )
+
+        self.assertEqual(update.kind, "callback_query")
+        self.assertEqual(update.callback_query_id, "4382bfdwdsb323b2d9")
+        self.assertEqual(update.callback_data, "quality:HD")
+        self.assertEqual(update.chat_id, 2222222)
+        self.assertEqual(update.message_id, 1366)
+        self.assertEqual(update.text, "")
+
+    def test_invalid_payload(self):
+        for request_data in (b"", b"not json", b"[1, 2]", None):
+            webhook = TelegramWebhookParser(request_data)
+            self.assertIsNone(webhook.update)
+            self.assertIsNone(webhook.data)
+            with self.assertRaises(Exception):
+                webhook.get_user()
+
+
+def _mock_response(status_code: int, data: dict) -> Mock:
+    response = Mock(status_code=status_code, ok=status_code == 200)
+    response.json.return_value = data
+    return response
+
+
+@patch("backend.utils.telegram.time.sleep")
+@patch("backend.utils.telegram.requests.Session.post")
+class TestTelegramBotAPI(TestCase):
+    def test_request(self, mock_post, mock_sleep):
+        mock_post.return_value = _mock_response(200, {"ok": True})
+
+        response = TelegramBotAPI("token").request("sendMessage", {"chat_id": 1, "text": "Hello"})
+
+        self.assertTrue(response.ok)
+        mock_post.assert_called_once_with(
+            "https://api.telegram.org/bottoken/sendMessage",
+            json={"chat_id": 1, "text": "Hello"},
+            timeout=TelegramBotAPI.TIMEOUT,
+        )
+
+    def test_session_is_shared_per_bot_token(self, mock_post, mock_sleep):
+        self.assertIs(TelegramBotAPI.get_session("token"), TelegramBotAPI.get_session("token"))
+        self.assertIsNot(TelegramBotAPI.get_session("token"), TelegramBotAPI.get_session("other-token"))
+
+    def test_retry_after_rate_limit(self, mock_post, mock_sleep):
+        mock_post.side_effect = [
+            _mock_response(429, {"ok": False, "parameters": {"retry_after": 3}}),
+            _mock_response(200, {"ok": True}),
+        ]
+
+        response = TelegramBotAPI("token").request("sendMessage", {"chat_id": 1, "text": "Hello"})
+
+        self.assertTrue(response.ok)
+        mock_sleep.assert_called_once_with(3)
+        self.assertEqual(mock_post.call_count, 2)
+
+    def test_long_retry_after_is_not_retried(self, mock_post, mock_sleep):
+        mock_post.return_value = _mock_response(429, {"ok": False, "parameters": {"retry_after": 600}})
+
+        response = TelegramBotAPI("token").request("sendMessage", {"chat_id": 1, "text": "Hello"})
+
+        self.assertEqual(response.status_code, 429)
+        mock_sleep.assert_not_called()
+
+    @patch("backend.utils.telegram.TelegramRateLimiter.acquire", return_value=0)
+    def test_messages_are_rate_limited(self, mock_acquire, mock_post, mock_sleep):
+        mock_post.return_value = _mock_response(200, {"ok": True})
+        telegram_api = TelegramBotAPI("token")
+
+        telegram_api.request("sendMessage", {"chat_id": 1, "text": "Hello"})
+        mock_acquire.assert_called_once_with(1)
+
+        telegram_api.request("sendChatAction", {"chat_id": 1, "action": "typing"})
+        telegram_api.request("setWebhook", {"url": "https://example.com"})
+        mock_acquire.assert_called_once()
+
+    @patch("backend.utils.telegram.TelegramRateLimiter.acquire", return_value=0)
+    def test_upload(self, mock_acquire, mock_post, mock_sleep):
+        mock_post.return_value = _mock_response(429, {"ok": False, "parameters": {"retry_after": 3}})
+        stream = MultipartStream({"chat_id": 1}, "video", "video.mp4", [b"video"], 5)
+
+        response = TelegramBotAPI("token").upload("sendVideo", stream)
+
+        self.assertEqual(response.status_code, 429)
+        mock_acquire.assert_called_once_with(1)
+        mock_post.assert_called_once_with(
+            "https://api.telegram.org/bottoken/sendVideo",
+            data=stream,
+            headers={"Content-Type": stream.content_type},
+            timeout=TelegramBotAPI.TIMEOUT,
+        )
+        mock_sleep.assert_not_called()
+
+
+class TestMultipartStream(TestCase):
+    def test_body(self):
+        chunks = [b"a" * 10, b"b" * 10, b"c" * 5]
+        stream = MultipartStream(
+            {"chat_id": 1, "supports_streaming": True, "reply_markup": {"inline_keyboard": []}, "caption": None},
+            "video",
+            "video.mp4",
+            iter(chunks),
+            25,
+            "video/mp4",
+        )
+
+        body = b"".join(stream)
+        self.assertEqual(len(body), len(stream))
+
+        parser = MultiPartParser(
+            {"CONTENT_TYPE": stream.content_type, "CONTENT_LENGTH": len(body)},
+            BytesIO(body),
+            [MemoryFileUploadHandler()],
+            "utf-8",
+        )
+        fields, files = parser.parse()
+        self.assertEqual(
+            fields.dict(), {"chat_id": "1", "supports_streaming": "true", "reply_markup": '{"inline_keyboard": []}'}
+        )
+        self.assertEqual(files["video"].read(), b"".join(chunks))
+        self.assertEqual(files["video"].content_type, "video/mp4")
+
+    def test_sent_with_content_length(self):
+        stream = MultipartStream({"chat_id": 1}, "video", "video.mp4", iter([b"video"]), 5)
+
+        request = requests.Request("POST", "https://api.telegram.org/bottoken/sendVideo", data=stream).prepare()
+
+        self.assertEqual(request.headers["Content-Length"], str(len(stream)))
+        self.assertNotIn("Transfer-Encoding", request.headers)
+        self.assertIs(request.body, stream, "Should not read the stream before sending it")
+
+    def test_size_mismatch(self):
+        with self.assertRaises(ValueError):
+            b"".join(MultipartStream({}, "video", "video.mp4", iter([b"video"]), 4))
+        with self.assertRaises(ValueError):
+            b"".join(MultipartStream({}, "video", "video.mp4", iter([b"video"]), 6))
+
+
+class TestTokenBucket(TestCase):
+    @patch("backend.utils.telegram.time.sleep")
+    @patch("backend.utils.telegram.time.monotonic")
+    def test_acquire_waits_for_a_token(self, mock_monotonic, mock_sleep):
+        clock = [0.0]
+        mock_monotonic.side_effect = lambda: clock[0]
+        mock_sleep.side_effect = lambda seconds: clock.__setitem__(0, clock[0] + seconds)
+
+        rate_limiter = TokenBucket(rate=10, capacity=2)
+        for _ in range(2):
+            rate_limiter.acquire()
+        mock_sleep.assert_not_called()
+
+        rate_limiter.acquire()
+        mock_sleep.assert_called_once()
+        self.assertAlmostEqual(clock[0], 0.1)
+
+
+@patch("backend.utils.telegram.time.sleep")
+class TestTelegramRateLimiter(TestCase):
+    def setUp(self):
+        TelegramRateLimiter._local_buckets.clear()
+
+    @patch.object(TelegramRateLimiter, "get_redis_client")
+    def test_try_acquire(self, mock_get_redis_client, mock_sleep):
+        mock_get_redis_client.return_value.eval.return_value = b"0"
+
+        wait = TelegramRateLimiter("123:secret").try_acquire(939376599)
+
+        self.assertEqual(wait, 0)
+        _, numkeys, *keys_and_args = mock_get_redis_client.return_value.eval.call_args.args
+        self.assertEqual(numkeys, 2)
+        self.assertEqual(
+            keys_and_args,
+            ["telegram_rate_limit:123", "telegram_rate_limit:123:939376599", 30, 30, 0, 1, 3],
+            "Should not put the bot token in the keys, and let interactive traffic use all the bot tokens",
+        )
+
+    @patch.object(TelegramRateLimiter, "get_redis_client")
+    def test_bulk_priority_leaves_reserve(self, mock_get_redis_client, mock_sleep):
+        mock_get_redis_client.return_value.eval.return_value = b"0.5"
+
+        wait = TelegramRateLimiter("123:secret", priority="bulk").try_acquire("-1001234567890")
+
+        self.assertEqual(wait, 0.5)
+        args = mock_get_redis_client.return_value.eval.call_args.args[4:]
+        self.assertEqual(args[2], TelegramRateLimiter.INTERACTIVE_RESERVE)
+        self.assertEqual(args[3], TelegramRateLimiter.GROUP_CHAT_RATE, "Should use the group rate for channels")
+
+    @patch.object(TelegramRateLimiter, "get_redis_client")
+    def test_acquire_waits(self, mock_get_redis_client, mock_sleep):
+        mock_get_redis_client.return_value.eval.side_effect = [b"0.5", b"0.25", b"0"]
+
+        waited = TelegramRateLimiter("123:secret").acquire(939376599)
+
+        self.assertEqual(waited, 0.75)
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    @patch.object(TelegramRateLimiter, "get_redis_client")
+    def test_acquire_gives_up_after_max_wait(self, mock_get_redis_client, mock_sleep):
+        mock_get_redis_client.return_value.eval.return_value = b"20"
+
+        waited = TelegramRateLimiter("123:secret").acquire(939376599)
+
+        self.assertEqual(waited, 20)
+        mock_sleep.assert_called_once_with(20.0)
+
+    @patch.object(TelegramRateLimiter, "get_redis_client")
+    def test_redis_error_falls_back_to_local_bucket(self, mock_get_redis_client, mock_sleep):
+        mock_get_redis_client.return_value.eval.side_effect = RedisConnectionError
+
+        self.assertEqual(TelegramRateLimiter("123:secret").try_acquire(939376599), 0)
+        self.assertIn("123", TelegramRateLimiter._local_buckets)
+
+    def test_without_redis(self, mock_sleep):
+        self.assertIsNone(TelegramRateLimiter.get_redis_client(), "Tests use the local memory cache")
+
+        rate_limiter = TelegramRateLimiter("123:secret")
+        for _ in range(TelegramRateLimiter.BOT_CAPACITY):
+            self.assertEqual(rate_limiter.try_acquire(939376599), 0)
+        self.assertGreater(rate_limiter.try_acquire(939376599), 0)
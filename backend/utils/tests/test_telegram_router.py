@@ -0,0 +1,100 @@
+from unittest.mock import Mock
+
+from django.test import SimpleTestCase
+
+from backend.utils.telegram_router import CommandRouter, command_seconds
+
+
+class TestCommandRouter(SimpleTestCase):
+    def setUp(self):
+        self.calls = []
+        self.router = CommandRouter("test_bot", middlewares=[self.check_banned])
+
+        @self.router.command("/start", "/help")
+        def start(message):
+            self.calls.append(("start", message.text))
+            return "start"
+
+        @self.router.match(r"https://(?:x|twitter)\.com/(?P<username>\w+)", name="tweet_link")
+        def tweet_link(message):
+            self.calls.append(("tweet_link", message.match.group("username")))
+
+        @self.router.match(r"https://www\.pixiv\.net/\S+", name="pixiv", middlewares=[self.check_premium])
+        def pixiv(message):
+            self.calls.append(("pixiv", message.match.group()))
+
+        @self.router.default()
+        def other(message):
+            self.calls.append(("other", message.text))
+
+    def check_banned(self, message):
+        if message.user.is_banned:
+            return "banned"
+
+    def check_premium(self, message):
+        if not message.user.is_premium:
+            return "not premium"
+
+    def dispatch(self, text: str, **user):
+        return self.router.dispatch(text, Mock(**{"is_banned": False, "is_premium": True} | user))
+
+    def test_command(self):
+        self.assertEqual(self.dispatch("/start"), "start")
+        self.assertEqual(self.dispatch("/START@test_bot payload"), "start", "Should ignore the case and the bot name")
+        self.dispatch("/help")
+        self.assertEqual([name for name, _ in self.calls], ["start", "start", "start"])
+
+    def test_unknown_command(self):
+        self.dispatch("/starting")
+        self.assertEqual(self.calls, [("other", "/starting")])
+
+    def test_pattern(self):
+        self.dispatch("Look at HTTPS://X.com/animemoe/status/1")
+        self.dispatch("https://www.pixiv.net/en/artworks/1")
+        self.assertEqual(self.calls, [("tweet_link", "animemoe"), ("pixiv", "https://www.pixiv.net/en/artworks/1")])
+
+    def test_pattern_with_trailing_named_group(self):
+        @self.router.match(r"https://pixiv\.me/(?P<pixiv_user>\w+)", name="pixiv_user")
+        def handle_pixiv_user(message):
+            self.calls.append(("pixiv_user", message.match.group("pixiv_user")))
+
+        self.dispatch("https://pixiv.me/animemoe")
+        self.assertEqual(self.calls, [("pixiv_user", "animemoe")])
+
+    def test_route_group_names_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.router.match(r"(?P<route0>\d+)", name="number")
+
+    def test_default(self):
+        self.dispatch("Hello")
+        self.assertEqual(self.calls, [("other", "Hello")])
+
+    def test_middlewares(self):
+        self.assertEqual(self.dispatch("/start", is_banned=True), "banned")
+        self.assertEqual(self.dispatch("https://www.pixiv.net/en/artworks/1", is_premium=False), "not premium")
+        self.assertEqual(self.dispatch("/start", is_premium=False), "start", "Should only run the route middlewares")
+        self.assertEqual(self.calls, [("start", "/start")])
+
+    def test_method_handlers(self):
+        class Handler:
+            router = CommandRouter("test_bot")
+
+            @router.command("/start")
+            def handle_start_command(self, message):
+                return self, message.user
+
+        handler = Handler()
+        self.assertEqual(Handler.router.dispatch("/start", "user", handler), (handler, "user"))
+        self.assertIsNone(Handler.router.dispatch("Hello", "user", handler), "Should ignore messages without route")
+
+    def test_latency_metric(self):
+        before = self.get_sample_count()
+        self.dispatch("/start")
+        self.assertEqual(self.get_sample_count(), before + 1)
+
+    def get_sample_count(self) -> float:
+        for metric in command_seconds.collect():
+            for sample in metric.samples:
+                if sample.name.endswith("_count") and sample.labels == {"bot": "test_bot", "command": "/start"}:
+                    return sample.value
+        return 0
@@ -0,0 +1,27 @@
+from django_filters import rest_framework as filters
+
+from .models import Genre, Movie
+
+
+class MovieRecommendationFilter(filters.FilterSet):
+    genre = filters.ModelMultipleChoiceFilter(queryset=Genre.objects.all(), method="filter_genre")
+    original_language = filters.CharFilter(field_name="original_language")
+    min_rating = filters.NumberFilter(field_name="rating", lookup_expr="gte")
+    max_rating = filters.NumberFilter(field_name="rating", lookup_expr="lte")
+
+    class Meta:
+        model = Movie
+        fields = ["genre", "original_language", "min_rating", "max_rating"]
+
+    def filter_genre(self, queryset, name, value):
+        """
+        Keep movies that have any of the given genres.
+        Uses a subquery instead of a join so the result doesn't need DISTINCT,
+        which would prevent Postgres from using the HNSW index for ordering.
+        """
+
+        if not value:
+            return queryset
+
+        movie_ids = Movie.genre.through.objects.filter(genre__in=value).values("movie_id")
+        return queryset.filter(pk__in=movie_ids)
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.21 on 2026-10-17 11:03
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import pgvector.django.indexes
+
+
+class Migration(migrations.Migration):
+    # Building the indexes concurrently keeps the table writable while the indexes are built
+    atomic = False
+
+    dependencies = [
+        ("cinematch", "0003_movie_embedding"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="movie",
+            index=pgvector.django.indexes.HnswIndex(
+                ef_construction=64,
+                fields=["embedding"],
+                m=16,
+                name="cinematch_movie_embedding_hnsw",
+                opclasses=["vector_cosine_ops"],
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="movie",
+            index=models.Index(fields=["original_language"], name="cinematch_movie_language_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="movie",
+            index=models.Index(fields=["rating"], name="cinematch_movie_rating_idx"),
+        ),
+    ]
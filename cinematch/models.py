@@ -1,5 +1,5 @@
 from django.db import models
-from pgvector.django import VectorField
+from pgvector.django import HnswIndex, VectorField
 
 
 class Genre(models.Model):
@@ -43,5 +43,19 @@ class Movie(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            HnswIndex(
+                name="cinematch_movie_embedding_hnsw",
+                fields=["embedding"],
+                m=16,
+                ef_construction=64,
+                opclasses=["vector_cosine_ops"],
+            ),
+            # Let the planner pre-filter selective recommendation queries instead of walking the HNSW graph
+            models.Index(fields=["original_language"], name="cinematch_movie_language_idx"),
+            models.Index(fields=["rating"], name="cinematch_movie_rating_idx"),
+        ]
+
     def __str__(self):
         return self.title
@@ -1,8 +1,8 @@
-from rest_framework.pagination import CursorPagination
+from backend.utils.pagination import SnapshotCursorPagination
 
 
-class MovieRecommendationPagination(CursorPagination):
+class MovieRecommendationPagination(SnapshotCursorPagination):
     page_size = 10
     max_page_size = 50
     page_size_query_param = "count"
-    ordering = "-similarity_score"
+    max_results = 500
@@ -1,3 +1,76 @@
-# from django.test import TestCase
+import datetime
+from unittest.mock import patch
 
-# Create your tests here.
+from django.test import TestCase
+from django.urls import reverse
+
+from cinematch.models import Genre, Movie
+
+
+def _embedding(first: float, second: float) -> list[float]:
+    return [first, second] + [0.0] * 1534
+
+
+def _create_movie(title: str, embedding: list[float] | None, rating: str = "7.0", language: str = "en") -> Movie:
+    return Movie.objects.create(
+        title=title,
+        release_date=datetime.date(2024, 1, 1),
+        rating=rating,
+        original_language=language,
+        embedding=embedding,
+    )
+
+
+@patch("cinematch.views.get_cached_embedding", return_value=_embedding(1.0, 0.0))
+class TestMovieRecommendationAPIView(TestCase):
+    def setUp(self):
+        self.url = reverse("cinematch:movie-recommendations")
+
+        self.action = Genre.objects.create(name="Action")
+        self.drama = Genre.objects.create(name="Drama")
+
+        self.close = _create_movie("Close", _embedding(0.9, 0.1), rating="8.5", language="en")
+        self.close.genre.add(self.action, self.drama)
+        self.middle = _create_movie("Middle", _embedding(0.5, 0.5), rating="6.0", language="ja")
+        self.middle.genre.add(self.drama)
+        self.far = _create_movie("Far", _embedding(0.0, 1.0), rating="4.0", language="en")
+        self.far.genre.add(self.action)
+        self.no_embedding = _create_movie("No Embedding", None)
+
+    def _titles(self, response) -> list[str]:
+        return [item["title"] for item in response.json().get("results")]
+
+    def test_recommendations_ordered_by_similarity(self, mock_get_embedding):
+        response = self.client.get(self.url, {"query": "something"})
+        self.assertEqual(response.status_code, 200, "Should return 200 OK")
+
+        results = response.json().get("results")
+        self.assertEqual(self._titles(response), ["Close", "Middle", "Far"])
+        self.assertGreater(results[0]["similarity_score"], results[-1]["similarity_score"])
+
+    def test_recommendations_require_query(self, mock_get_embedding):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 400, "Should return 400 Bad Request")
+
+    def test_recommendations_filter_by_genre(self, mock_get_embedding):
+        response = self.client.get(self.url, {"query": "something", "genre": [self.action.id, self.drama.id]})
+        self.assertEqual(response.status_code, 200, "Should return 200 OK")
+        self.assertEqual(self._titles(response), ["Close", "Middle", "Far"], "Should not contain duplicates")
+
+        response = self.client.get(self.url, {"query": "something", "genre": self.drama.id})
+        self.assertEqual(self._titles(response), ["Close", "Middle"])
+
+    def test_recommendations_filter_by_language_and_rating(self, mock_get_embedding):
+        response = self.client.get(self.url, {"query": "something", "original_language": "en", "min_rating": "5"})
+        self.assertEqual(response.status_code, 200, "Should return 200 OK")
+        self.assertEqual(self._titles(response), ["Close"])
+
+        response = self.client.get(self.url, {"query": "something", "max_rating": "6"})
+        self.assertEqual(self._titles(response), ["Middle", "Far"])
+
+    def test_recommendations_pagination(self, mock_get_embedding):
+        response = self.client.get(self.url, {"query": "something", "count": 2})
+        self.assertEqual(self._titles(response), ["Close", "Middle"])
+
+        response = self.client.get(response.json().get("next"))
+        self.assertEqual(self._titles(response), ["Far"])
@@ -1,9 +1,14 @@
+from django.db import transaction
+from django.db.models import F
+from django_filters.rest_framework import DjangoFilterBackend
 from pgvector.django import CosineDistance
 from rest_framework.exceptions import ValidationError
 from rest_framework.generics import ListAPIView
 
-from backend.utils.openai import get_embedding
+from backend.utils.openai import get_cached_embedding
+from backend.utils.pgvector import set_hnsw_iterative_scan
 
+from .filters import MovieRecommendationFilter
 from .models import Movie
 from .pagination import MovieRecommendationPagination
 from .serializers import MovieListSerializer
@@ -12,11 +17,15 @@ from .serializers import MovieListSerializer
 class MovieRecommendationAPIView(ListAPIView):
     """
     API endpoint to get movie recommendations using vector similarity search.
+    Results can be narrowed down with the `genre`, `original_language`, `min_rating` and `max_rating` filters.
     """
 
     serializer_class = MovieListSerializer
     pagination_class = MovieRecommendationPagination
 
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = MovieRecommendationFilter
+
     def get_queryset(self):
         query = self.request.query_params.get("query")
 
@@ -24,14 +33,17 @@ class MovieRecommendationAPIView(ListAPIView):
             raise ValidationError("Query parameter is required")
 
         try:
-            # Generate embedding for the search query
-            query_embedding = get_embedding(query)
+            # Generate embedding for the search query.
+            # Cached, so paging through the results doesn't call OpenAI again.
+            query_embedding = get_cached_embedding(query)
 
-            # Find movies with similar embeddings using cosine distance
+            # Find movies with similar embeddings using cosine distance.
+            # Order by the raw distance (ascending) so Postgres can use the HNSW index.
             similar_movies = (
                 Movie.objects.filter(embedding__isnull=False)
-                .annotate(similarity_score=1 - CosineDistance("embedding", query_embedding))
-                .order_by("-similarity_score")
+                .annotate(distance=CosineDistance("embedding", query_embedding))
+                .annotate(similarity_score=1 - F("distance"))
+                .order_by("distance")
                 .prefetch_related("genre", "talent")
             )
 
@@ -39,3 +51,15 @@ class MovieRecommendationAPIView(ListAPIView):
 
         except Exception as e:
             raise ValidationError(f"Failed to generate recommendations: {str(e)}")
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        # The filters are applied while walking the HNSW index instead of after it,
+        # so filtered pages are not cut short. The setting is transaction scoped.
+        with transaction.atomic():
+            set_hnsw_iterative_scan()
+            page = self.paginate_queryset(queryset)
+
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
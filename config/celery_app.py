@@ -1,6 +1,7 @@
 import os
 
 from celery import Celery
+from celery.signals import worker_init, worker_process_shutdown
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.local")
@@ -15,3 +16,23 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
+
+
+@worker_init.connect
+def start_worker_metrics_server(**kwargs):
+    """
+    Expose the metrics recorded by the tasks (eg. `telegram_bot_command_seconds` of the bots handled
+    in `process_telegram_update`) for Prometheus to scrape, aggregated over the pool processes.
+    """
+    from django.conf import settings
+
+    from backend.utils.metrics import start_multiprocess_metrics_server
+
+    start_multiprocess_metrics_server(settings.PROMETHEUS_CELERY_WORKER_PORT)
+
+
+@worker_process_shutdown.connect
+def mark_worker_process_dead(pid=None, **kwargs):
+    from backend.utils.metrics import mark_process_dead
+
+    mark_process_dead(pid or os.getpid())
@@ -336,6 +336,14 @@ CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
 CELERY_WORKER_SEND_TASK_EVENTS = True
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#std-setting-task_send_sent_event
 CELERY_TASK_SEND_SENT_EVENT = True
+# https://docs.celeryq.dev/en/stable/userguide/configuration.html#task-routes
+# Telegram webhook updates get their own queue and workers, so they aren't stuck behind background jobs
+CELERY_TASK_ROUTES = {
+    "twitter_downloader.tasks.process_telegram_update": {"queue": "telegram_webhooks"},
+}
+# Port of the Prometheus metrics of a celery worker, 0 to disable. The metrics of the pool processes are
+# shared through PROMETHEUS_MULTIPROC_DIR, set by the worker start scripts.
+PROMETHEUS_CELERY_WORKER_PORT = env.int("PROMETHEUS_CELERY_WORKER_PORT", default=0)
 # django-allauth
 # ------------------------------------------------------------------------------
 ACCOUNT_ALLOW_REGISTRATION = env.bool("DJANGO_ACCOUNT_ALLOW_REGISTRATION", True)
@@ -403,6 +411,10 @@ TWITTER_DOWNLOADER_COOKIE = env.str("TWITTER_DOWNLOADER_COOKIE", default="")
 TWITTER_DOWNLOADER_API_URL = env.str("TWITTER_DOWNLOADER_API_URL", default="")
 TWITTER_DOWNLOADER_API_KEY = env.str("TWITTER_DOWNLOADER_API_KEY", default="")
 TWITTER_VIDEO_DOWNLOADER_BOT_TOKEN = env.str("TWITTER_VIDEO_DOWNLOADER_BOT_TOKEN", default="")
+# Public base URL of this backend, for the links sent by the bot (eg. the external link click counter)
+TWITTER_DOWNLOADER_BASE_URL = env.str("TWITTER_DOWNLOADER_BASE_URL", default="http://localhost:8000")
+# Tweet extractors in failover order, see twitter_downloader.providers (providers that aren't configured are skipped)
+TWITTER_DOWNLOADER_PROVIDERS = env.list("TWITTER_DOWNLOADER_PROVIDERS", default=["v4", "v3", "v2"])
 
 # discord
 DISCORD_REFRESH_URL = env.str("DISCORD_REFRESH_URL", default="")
@@ -199,3 +199,6 @@ SPECTACULAR_SETTINGS["SERVERS"] = [  # noqa: F405
 ]
 # Your stuff...
 # ------------------------------------------------------------------------------
+# twitter_video_downloader
+# Required, so a staging deployment can't send links pointing at another environment
+TWITTER_DOWNLOADER_BASE_URL = env.str("TWITTER_DOWNLOADER_BASE_URL")
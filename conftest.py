@@ -0,0 +1,9 @@
+import pytest
+
+from models.base import CachedSingletonModel
+
+
+@pytest.fixture(autouse=True)
+def clear_singleton_settings():
+    # The settings kept in memory would outlive the rolled back test transactions
+    CachedSingletonModel.clear_solo_instances()
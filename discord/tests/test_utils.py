@@ -0,0 +1,114 @@
+import json
+import time
+from concurrent.futures import Future
+from unittest.mock import Mock, patch
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from discord.utils import DiscordAttachmentURLRefresher, get_discord_url_expiry
+
+
+def _signed_url(attachment_id: int, expiry: float) -> str:
+    return (
+        f"https://cdn.discordapp.com/attachments/858938620425404426/{attachment_id}/animemoeus-waifu.jpg"
+        f"?ex={int(expiry):x}&is=66f00000&hm=abcdef"
+    )
+
+
+def _mock_refresh_response(method, url, headers, data, timeout):
+    expiry = time.time() + 60 * 60 * 24
+    attachment_urls = json.loads(data)["attachment_urls"]
+    mock_response = Mock()
+    mock_response.ok = True
+    mock_response.json.return_value = {
+        "refreshed_urls": [
+            {"original": original, "refreshed": f"{original.split('?')[0]}?ex={int(expiry):x}&is=0&hm=0"}
+            for original in attachment_urls
+        ]
+    }
+    return mock_response
+
+
+@patch("discord.utils.requests.request", side_effect=_mock_refresh_response)
+class TestDiscordAttachmentURLRefresher(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.refresher = DiscordAttachmentURLRefresher(bot_token="token", api_url="https://example.com/refresh")
+        self.expired_url = _signed_url(1, time.time() - 60)
+
+    def test_get_discord_url_expiry(self, mock_request):
+        self.assertEqual(get_discord_url_expiry(_signed_url(1, 1727000000)), 1727000000)
+        self.assertIsNone(get_discord_url_expiry("https://cdn.discordapp.com/attachments/1/2/waifu.jpg"))
+
+    def test_valid_urls_are_not_refreshed(self, mock_request):
+        valid_url = _signed_url(1, time.time() + 60 * 60)
+        tumblr_url = "https://64.media.tumblr.com/waifu.jpg"
+
+        result = self.refresher.refresh([valid_url, tumblr_url])
+
+        self.assertEqual(result, {valid_url: valid_url, tumblr_url: tumblr_url})
+        mock_request.assert_not_called()
+
+    def test_refreshed_urls_are_cached_until_expiry(self, mock_request):
+        refreshed_url = self.refresher.refresh_one(self.expired_url)
+        self.assertNotEqual(refreshed_url, self.expired_url)
+
+        # Same attachment with a different (also expired) signature
+        other_signature = _signed_url(1, time.time() - 120)
+        self.assertEqual(self.refresher.refresh_one(other_signature), refreshed_url)
+        self.assertEqual(self.refresher.refresh_one(self.expired_url), refreshed_url)
+        mock_request.assert_called_once()
+
+    def test_urls_are_deduplicated_and_batched(self, mock_request):
+        urls = [_signed_url(attachment_id, time.time() - 60) for attachment_id in range(120)]
+
+        result = self.refresher.refresh(urls + urls)
+
+        self.assertEqual(len(result), 120)
+        self.assertEqual(mock_request.call_count, 3, "Should refresh 120 URLs in batches of 50")
+
+    def test_cache_is_bypassed_when_disabled(self, mock_request):
+        refreshed_url = self.refresher.refresh_one(self.expired_url)
+
+        refresher = DiscordAttachmentURLRefresher(
+            bot_token="token", api_url="https://example.com/refresh", use_cache=False
+        )
+        self.assertIsNotNone(refresher.refresh_one(self.expired_url))
+        self.assertIsNotNone(refresher.refresh_one(refreshed_url))
+        self.assertEqual(mock_request.call_count, 3, "Should call Discord even for cached or valid URLs")
+
+    @patch.object(DiscordAttachmentURLRefresher, "IN_FLIGHT_TIMEOUT", 0.01)
+    def test_stuck_in_flight_refresh_is_refreshed_again(self, mock_request):
+        key = self.refresher.get_cache_key(self.expired_url)
+        DiscordAttachmentURLRefresher._in_flight[key] = Future()
+        try:
+            refreshed_url = self.refresher.refresh_one(self.expired_url)
+        finally:
+            DiscordAttachmentURLRefresher._in_flight.pop(key, None)
+
+        self.assertIsNotNone(refreshed_url)
+        mock_request.assert_called_once()
+        self.assertEqual(mock_request.call_args.kwargs["timeout"], DiscordAttachmentURLRefresher.REQUEST_TIMEOUT)
+
+    @patch.object(DiscordAttachmentURLRefresher, "IN_FLIGHT_TIMEOUT", 0.01)
+    def test_stuck_in_flight_refresh_is_evicted(self, mock_request):
+        key = self.refresher.get_cache_key(self.expired_url)
+        stuck = DiscordAttachmentURLRefresher._in_flight[key] = Future()
+
+        self.refresher.refresh_one(self.expired_url)
+
+        self.assertNotIn(key, DiscordAttachmentURLRefresher._in_flight, "Should not let the next refreshes wait")
+        # The stuck thread releasing its future later doesn't evict the futures of other threads
+        new = DiscordAttachmentURLRefresher._in_flight[key] = Future()
+        self.refresher._release({key: (self.expired_url, stuck)}, refreshed={})
+        self.assertIs(DiscordAttachmentURLRefresher._in_flight.pop(key), new)
+
+    @patch("discord.utils.cache.set", side_effect=ConnectionError)
+    def test_in_flight_refresh_is_released_when_the_cache_fails(self, mock_cache_set, mock_request):
+        key = self.refresher.get_cache_key(self.expired_url)
+
+        with self.assertRaises(ConnectionError):
+            self.refresher.refresh_one(self.expired_url)
+
+        self.assertNotIn(key, DiscordAttachmentURLRefresher._in_flight)
@@ -26,3 +26,12 @@ class TestDiscordRefreshURL(TestCase):
         mock_refresh.return_value = None
         response = self.client.get(f"/discord/refresh/?url={self.invalid_url}")
         self.assertEqual(response.status_code, 444)
+
+    @patch("discord.views.DiscordAPI.refresh_url")
+    def test_health_check_bypasses_the_cache(self, mock_refresh):
+        mock_refresh.return_value = "https://cdn.discordapp.com/attachments/refreshed-url.jpg"
+
+        response = self.client.get("/discord/refresh-url-health-check/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(mock_refresh.call_args.kwargs["use_cache"])
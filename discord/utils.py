@@ -1,22 +1,239 @@
 import json
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from urllib.parse import parse_qs, urlsplit
 
 import requests
 from django.conf import settings
+from django.core.cache import cache
 
+logger = logging.getLogger(__name__)
 
-class DiscordAPI:
-    def __init__(self) -> None:
-        pass
+DISCORD_CDN_HOSTS = ("cdn.discordapp.com", "media.discordapp.net")
 
-    @staticmethod
-    def refresh_url(url: str) -> str:
-        payload = json.dumps({"attachment_urls": [url]})
 
+def get_discord_url_expiry(url: str) -> int | None:
+    """
+    Return the expiry (unix timestamp) embedded in a signed Discord attachment URL.
+    Discord stores it as a hex string in the `ex` query param, eg. `?ex=66f1a2b3&is=...&hm=...`.
+    """
+    ex = parse_qs(urlsplit(url).query).get("ex")
+    if not ex:
+        return None
+
+    try:
+        return int(ex[0], 16)
+    except ValueError:
+        return None
+
+
+def is_discord_attachment_url(url: str) -> bool:
+    return urlsplit(url).hostname in DISCORD_CDN_HOSTS
+
+
+class DiscordAttachmentURLRefresher:
+    """
+    Refresh signed Discord attachment URLs with as few calls to the refresh endpoint as possible.
+
+    - URLs that are still valid (their `ex` is far enough in the future) are returned as they are
+    - Refreshed URLs are cached until shortly before their own `ex` expiry
+    - Concurrent refreshes of the same attachment in this process share a single request
+    - The remaining URLs are refreshed in batches of `BATCH_SIZE` (Discord's per-call limit)
+
+    With `use_cache=False` every Discord URL is sent to the refresh endpoint, eg. for a health check
+    which must reach Discord.
+    """
+
+    BATCH_SIZE = 50
+    # Don't hand out URLs that are about to expire
+    EXPIRY_MARGIN = 60 * 10
+    CACHE_KEY_PREFIX = "discord_refreshed_url"
+    # How long to wait for another thread that is already refreshing the same URL
+    IN_FLIGHT_TIMEOUT = 30
+    # (connect, read) timeouts of the refresh endpoint, shorter than `IN_FLIGHT_TIMEOUT`
+    REQUEST_TIMEOUT = (5, 20)
+
+    _in_flight: dict[str, Future] = {}
+    _in_flight_lock = threading.Lock()
+
+    def __init__(
+        self, bot_token: str, api_url: str | None = None, expiry_margin: int | None = None, use_cache: bool = True
+    ):
+        self.bot_token = bot_token
+        self.api_url = api_url or settings.DISCORD_REFRESH_URL
+        # URLs expiring within `expiry_margin` seconds are refreshed, eg. a background job refreshing ahead of time
+        self.expiry_margin = self.EXPIRY_MARGIN if expiry_margin is None else expiry_margin
+        self.use_cache = use_cache
+
+    def refresh(self, urls: list[str]) -> dict[str, str]:
+        """
+        Refresh Discord attachment URLs.
+
+        Args:
+            urls (list[str]): URLs to refresh. Non Discord URLs are returned unchanged.
+
+        Returns:
+            dict: A dictionary mapping the given URLs to usable URLs. URLs Discord failed to refresh are omitted.
+
+        Raises:
+            Exception: If the refresh endpoint returns an error.
+        """
+
+        result = {}
+        pending = {}
+        for url in dict.fromkeys(urls):
+            if not url:
+                continue
+            if not is_discord_attachment_url(url) or (self.use_cache and self.is_fresh(url)):
+                result[url] = url
+            else:
+                pending[self.get_cache_key(url)] = url
+
+        if not pending:
+            return result
+
+        if not self.use_cache:
+            refreshed = self._request_refresh(list(pending.values()))
+            self._store(refreshed)
+            result.update(refreshed)
+            return result
+
+        cached = cache.get_many(list(pending))
+        for key, refreshed_url in cached.items():
+            if self.is_fresh(refreshed_url):
+                result[pending.pop(key)] = refreshed_url
+
+        owned, waiting = self._claim(pending)
+        owned_urls = [url for url, _ in owned.values()]
+        refreshed, exception = {}, None
+        try:
+            if owned_urls:
+                refreshed = self._request_refresh(owned_urls)
+                self._store(refreshed)
+        except Exception as e:
+            exception = e
+            raise
+        finally:
+            # Always settle the futures, the threads waiting for them would block until they time out
+            self._release(owned, refreshed=refreshed, exception=exception)
+        result.update({url: refreshed[url] for url in owned_urls if url in refreshed})
+
+        timed_out = []
+        for key, (url, future) in waiting.items():
+            try:
+                refreshed_url = future.result(timeout=self.IN_FLIGHT_TIMEOUT)
+            except FuturesTimeoutError:
+                # The other thread is stuck, don't wait for it any longer, nor let the next refreshes wait for it
+                logger.warning("Timed out waiting for the in-flight refresh of %s", url)
+                self._evict(key, future)
+                timed_out.append(url)
+                continue
+            if refreshed_url:
+                result[url] = refreshed_url
+
+        if timed_out:
+            refreshed = self._request_refresh(timed_out)
+            self._store(refreshed)
+            result.update(refreshed)
+
+        return result
+
+    def refresh_one(self, url: str) -> str | None:
+        return self.refresh([url]).get(url)
+
+    def is_fresh(self, url: str) -> bool:
+        expiry = get_discord_url_expiry(url)
+        return expiry is not None and expiry - self.expiry_margin > time.time()
+
+    def get_cache_key(self, url: str) -> str:
+        # The signature params change on every refresh, the attachment is identified by its host and path
+        parts = urlsplit(url)
+        return f"{self.CACHE_KEY_PREFIX}:{parts.hostname}{parts.path}"
+
+    def _claim(self, pending: dict[str, str]) -> tuple[dict[str, tuple[str, Future]], dict[str, tuple[str, Future]]]:
+        """Split the pending URLs into the ones this thread refreshes and the ones already in flight."""
+
+        owned, waiting = {}, {}
+        with self._in_flight_lock:
+            for key, url in pending.items():
+                if key in self._in_flight:
+                    waiting[key] = (url, self._in_flight[key])
+                else:
+                    self._in_flight[key] = Future()
+                    owned[key] = (url, self._in_flight[key])
+        return owned, waiting
+
+    def _release(
+        self,
+        owned: dict[str, tuple[str, Future]],
+        refreshed: dict | None = None,
+        exception: Exception | None = None,
+    ):
+        for key, (url, future) in owned.items():
+            self._evict(key, future)
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(refreshed.get(url))
+
+    def _evict(self, key: str, future: Future) -> None:
+        # The future may already have been evicted by a thread which timed out waiting for it
+        with self._in_flight_lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def _store(self, refreshed: dict[str, str]) -> None:
+        now = time.time()
+        for url, refreshed_url in refreshed.items():
+            expiry = get_discord_url_expiry(refreshed_url)
+            if expiry is None:
+                continue
+
+            timeout = int(expiry - self.EXPIRY_MARGIN - now)
+            if timeout > 0:
+                cache.set(self.get_cache_key(url), refreshed_url, timeout=timeout)
+
+    def _request_refresh(self, urls: list[str]) -> dict[str, str]:
         headers = {
-            "Authorization": f"Bot {settings.DISCORD_REFRESH_URL_BOT_TOKEN}",
+            "Authorization": f"Bot {self.bot_token}",
             "Content-Type": "application/json",
         }
 
-        response = requests.request("POST", settings.DISCORD_REFRESH_URL, headers=headers, data=payload)
+        result = {}
+        for index in range(0, len(urls), self.BATCH_SIZE):
+            payload = json.dumps({"attachment_urls": urls[index : index + self.BATCH_SIZE]})
+
+            response = requests.request(
+                "POST", self.api_url, headers=headers, data=payload, timeout=self.REQUEST_TIMEOUT
+            )
+            if not response.ok:
+                raise Exception("Oh no! Failed to refresh URLs. Discord API isn’t playing nice right now.")
+
+            result.update(
+                {
+                    data.get("original"): data.get("refreshed")
+                    for data in response.json().get("refreshed_urls")
+                    if data.get("refreshed")
+                }
+            )
+
+        logger.debug("Refreshed %d of %d Discord URLs", len(result), len(urls))
+        return result
+
+
+class DiscordAPI:
+    def __init__(self) -> None:
+        pass
+
+    @staticmethod
+    def refresh_url(url: str, use_cache: bool = True) -> str | None:
+        if not is_discord_attachment_url(url):
+            return None
 
-        return response.json().get("refreshed_urls")[0].get("refreshed")
+        refresher = DiscordAttachmentURLRefresher(
+            bot_token=settings.DISCORD_REFRESH_URL_BOT_TOKEN, use_cache=use_cache
+        )
+        return refresher.refresh_one(url)
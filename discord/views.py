@@ -8,8 +8,10 @@ def index(request):
 
 
 def refresh_url_health_check(request):
+    # Bypass the refreshed URLs cache, the health check must reach Discord
     refreshed_url = DiscordAPI.refresh_url(
-        "https://cdn.discordapp.com/attachments/858938620425404426/1248453128991412224/animemoeus-waifu.jpg"
+        "https://cdn.discordapp.com/attachments/858938620425404426/1248453128991412224/animemoeus-waifu.jpg",
+        use_cache=False,
     )
 
     if refreshed_url:
@@ -1,11 +1,21 @@
-import json
+import copy
+import time
+import uuid
 from typing import Literal
 
-import requests
 import tenacity
-from django.db import models
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import models, transaction
+from django.db.models.signals import class_prepared, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from solo.models import SingletonModel
 from tenacity import stop_after_attempt, stop_after_delay
 
+from backend.utils.telegram import TelegramBotAPI
+
 
 class BaseTelegramUserModel(models.Model):
     class Meta:
@@ -24,35 +34,191 @@ class BaseTelegramUserModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Cached by `get_or_create_cached` for the webhooks, invalidated when the user is saved or deleted
+    CACHE_TIMEOUT = 60 * 60
+    CACHED_FIELDS = ("id", "user_id", "first_name", "last_name", "username", "is_active", "is_banned")
+
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
+    @classmethod
+    def get_cache_key(cls, user_id: int | str) -> str:
+        return f"telegram_user:{cls._meta.label_lower}:{user_id}"
+
+    @classmethod
+    def get_or_create_cached(cls, user_data: dict, **defaults) -> tuple["BaseTelegramUserModel", bool]:
+        """
+        Get or create the user of a Telegram update. Served from the cache, so the webhooks of known
+        users don't read the database, and the profile is only saved when the name or username changed.
+
+        The user is loaded with the `CACHED_FIELDS` only, the other fields are deferred.
+
+        Args:
+            user_data: The `from` object of the Telegram update
+            defaults: Extra fields of a new user
+
+        Returns:
+            tuple: The user, and whether it was created
+        """
+
+        user_id = str(user_data.get("id"))
+        profile = {
+            "first_name": user_data.get("first_name"),
+            "last_name": user_data.get("last_name") or "",
+            "username": user_data.get("username") or "",
+        }
+
+        cache_key = cls.get_cache_key(user_id)
+        cached = cache.get(cache_key)
+
+        if cached is not None:
+            field_names = [field.attname for field in cls._meta.concrete_fields if field.attname in cached]
+            telegram_user = cls.from_db(cls.objects.db, field_names, [cached[name] for name in field_names])
+            created = False
+        else:
+            telegram_user, created = cls.objects.get_or_create(user_id=user_id, defaults={**profile, **defaults})
+
+        profile_changed = any(getattr(telegram_user, name) != value for name, value in profile.items())
+        if profile_changed:
+            cls.objects.filter(pk=telegram_user.pk).update(**profile, updated_at=timezone.now())
+            for name, value in profile.items():
+                setattr(telegram_user, name, value)
+
+        if cached is None or profile_changed:
+            cache.set(cache_key, {name: getattr(telegram_user, name) for name in cls.CACHED_FIELDS}, cls.CACHE_TIMEOUT)
+
+        return telegram_user, created
+
+    @classmethod
+    def invalidate_cache(cls, user_id: int | str) -> None:
+        # After the commit, so a webhook can't cache the old row again in between
+        transaction.on_commit(lambda: cache.delete(cls.get_cache_key(user_id)))
+
+    @property
+    def telegram_api(self) -> TelegramBotAPI:
+        return TelegramBotAPI(self.BOT_TOKEN)
+
     @tenacity.retry(stop=(stop_after_delay(10) | stop_after_attempt(5)))
     def send_chat_action(self, action: Literal["typing"]) -> bool:
-        url = f"https://api.telegram.org/bot{self.BOT_TOKEN}/sendChatAction"
-        payload = json.dumps({"chat_id": self.user_id, "action": action})
-        headers = {"Content-Type": "application/json"}
+        payload = {"chat_id": self.user_id, "action": action}
 
-        response = requests.request("POST", url, headers=headers, data=payload)
+        response = self.telegram_api.request("sendChatAction", payload)
         return response.ok
 
     @tenacity.retry(stop=(stop_after_delay(10) | stop_after_attempt(5)))
     def send_message(self, message: str) -> bool:
         self.send_chat_action("typing")
 
-        url = f"https://api.telegram.org/bot{self.BOT_TOKEN}/sendMessage"
-        payload = json.dumps({"chat_id": self.user_id, "text": message, "parse_mode": "HTML"})
-        headers = {"Content-Type": "application/json"}
+        payload = {"chat_id": self.user_id, "text": message, "parse_mode": "HTML"}
 
-        response = requests.request("POST", url, headers=headers, data=payload)
+        response = self.telegram_api.request("sendMessage", payload)
         return response.ok
 
     def send_document(self, document, caption="") -> bool:
         self.send_chat_action("upload_document")
 
-        url = f"https://api.telegram.org/bot{self.BOT_TOKEN}/sendDocument"
-        payload = json.dumps({"chat_id": self.user_id, "document": document, "caption": caption, "parse_mode": "HTML"})
-        headers = {"Content-Type": "application/json"}
+        payload = {"chat_id": self.user_id, "document": document, "caption": caption, "parse_mode": "HTML"}
 
-        response = requests.request("POST", url, headers=headers, data=payload)
+        response = self.telegram_api.request("sendDocument", payload)
         return response.ok
+
+
+def invalidate_telegram_user_cache(sender, instance, **kwargs):
+    sender.invalidate_cache(instance.user_id)
+
+
+@receiver(class_prepared)
+def connect_telegram_user_cache_invalidation(sender, **kwargs):
+    """
+    Drop the cached telegram user when it's saved or deleted, for the telegram users of every bot.
+    Connected per model, a receiver of all the senders would disable the fast deletes of every model.
+    """
+    if issubclass(sender, BaseTelegramUserModel) and not sender._meta.abstract:
+        post_save.connect(invalidate_telegram_user_cache, sender=sender)
+        post_delete.connect(invalidate_telegram_user_cache, sender=sender)
+
+
+class CachedSingletonModel(SingletonModel):
+    """
+    Singleton settings kept in the memory of each process, so the hot paths don't query them.
+
+    Saving the settings changes their version in the shared cache. The processes check the
+    version at most every `SOLO_VERSION_CHECK_INTERVAL` seconds, and reload the settings when
+    it changed. `get_solo` returns a copy, the changes to it stay local until it's saved.
+
+    This requires a default cache shared by the processes (eg. Redis in production). With a per
+    process cache (LocMemCache, DummyCache), a worker would never see the changes saved by the
+    admin, so the settings are read from the database on every `get_solo` instead.
+    """
+
+    SOLO_VERSION_CHECK_INTERVAL = 5
+
+    # {model: (version, instance, checked_at)}
+    _solo_instances: dict[type, tuple[str, "CachedSingletonModel", float]] = {}
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.invalidate_solo()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.invalidate_solo()
+        return result
+
+    @classmethod
+    def get_solo(cls):
+        if not cls.is_cache_shared():
+            return super().get_solo()
+
+        cached = cls._solo_instances.get(cls)
+        now = time.monotonic()
+        if cached is not None and now - cached[2] < cls.SOLO_VERSION_CHECK_INTERVAL:
+            return copy.copy(cached[1])
+
+        # Read the version before the settings, so a change saved in between is seen on the next check
+        version = cls.get_solo_version()
+        if cached is not None and cached[0] == version:
+            cls._solo_instances[cls] = (version, cached[1], now)
+            return copy.copy(cached[1])
+
+        instance = super().get_solo()
+        if version is not None:
+            cls._solo_instances[cls] = (version, instance, now)
+        return copy.copy(instance)
+
+    @staticmethod
+    def is_cache_shared() -> bool:
+        return not isinstance(caches["default"], (LocMemCache, DummyCache))
+
+    @classmethod
+    def get_solo_version_key(cls) -> str:
+        return f"{cls.get_cache_key()}:version"
+
+    @classmethod
+    def get_solo_version(cls) -> str | None:
+        """Return the version of the settings, or None if the cache is unavailable"""
+        version_key = cls.get_solo_version_key()
+        version = cache.get(version_key)
+        if version is None:
+            cache.add(version_key, uuid.uuid4().hex, None)
+            version = cache.get(version_key)
+        return version
+
+    @classmethod
+    def invalidate_solo(cls) -> None:
+        cls._solo_instances.pop(cls, None)
+
+        def change_version():
+            cls._solo_instances.pop(cls, None)
+            cache.set(cls.get_solo_version_key(), uuid.uuid4().hex, None)
+
+        # After the commit, so the other processes don't reload the settings before they are saved
+        transaction.on_commit(change_version)
+
+    @classmethod
+    def clear_solo_instances(cls) -> None:
+        """Forget the settings kept in memory, eg. between tests"""
+        cls._solo_instances.clear()
@@ -3,7 +3,8 @@ from urllib.parse import urljoin
 import requests
 from django.db import models, transaction
 from pgvector.django import VectorField
-from solo.models import SingletonModel
+
+from models.base import CachedSingletonModel
 
 
 class ProductCategory(models.Model):
@@ -96,7 +97,7 @@ class ProductImage(models.Model):
         return f"Image for {self.product.name}"
 
 
-class Setting(SingletonModel):
+class Setting(CachedSingletonModel):
     class Meta:
         verbose_name = "Rent AI Setting"
 
@@ -0,0 +1,130 @@
+"""
+Django runscript to compare the time spent parsing a corpus of recorded Telegram updates with the
+decode-per-access webhook parser and the decode-once `TelegramWebhookParser`.
+
+Each round parses every update of the corpus, and reads `data` three times like the webhook views do.
+
+Usage: python manage.py runscript benchmark_telegram_webhook_parser [--script-args <rounds>]
+"""
+
+import json
+import time
+
+from backend.utils import telegram
+from backend.utils.telegram import TelegramWebhookParser
+
+CORPUS = [
+    {
+        "update_id": 10000,
+        "message": {
+            "message_id": 1365,
+            "from": {
+                "id": 939376599,
+                "is_bot": False,
+                "first_name": "Arter",
+                "last_name": "Tendean",
+                "username": "artertendean",
+                "language_code": "en",
+            },
+            "chat": {"id": 939376599, "first_name": "Arter", "last_name": "Tendean", "type": "private"},
+            "date": 1441645532,
+            "text": "https://x.com/user/status/1829443959665443131",
+            "entities": [{"offset": 0, "length": 45, "type": "url"}],
+        },
+    },
+    {
+        "update_id": 10001,
+        "message": {
+            "message_id": 1366,
+            "from": {"id": 939376599, "is_bot": False, "first_name": "Arter", "language_code": "en"},
+            "chat": {"id": 939376599, "first_name": "Arter", "type": "private"},
+            "date": 1441645533,
+            "text": "/start",
+            "entities": [{"offset": 0, "length": 6, "type": "bot_command"}],
+        },
+    },
+    {
+        "update_id": 10002,
+        "edited_message": {
+            "message_id": 1365,
+            "from": {"id": 939376599, "is_bot": False, "first_name": "Arter"},
+            "chat": {"id": 939376599, "first_name": "Arter", "type": "private"},
+            "date": 1441645532,
+            "edit_date": 1441645540,
+            "text": "https://twitter.com/user/status/1829443959665443131",
+        },
+    },
+    {
+        "update_id": 10003,
+        "callback_query": {
+            "id": "4382bfdwdsb323b2d9",
+            "from": {"id": 939376599, "is_bot": False, "first_name": "Arter"},
+            "message": {
+                "message_id": 1367,
+                "chat": {"id": 939376599, "type": "private"},
+                "date": 1441645541,
+                "text": "Choose the quality",
+            },
+            "chat_instance": "-7013431418237406012",
+            "data": "quality:HD",
+        },
+    },
+    {
+        "update_id": 10004,
+        "message": {
+            "message_id": 1368,
+            "from": {"id": 939376599, "is_bot": False, "first_name": "Arter"},
+            "chat": {"id": 939376599, "type": "private"},
+            "date": 1441645542,
+            "photo": [{"file_id": "AgACAgUAAxkBAAIBZ2", "file_unique_id": "AQADq7kxG", "width": 90, "height": 67}],
+        },
+    },
+]
+
+
+class DecodePerAccessParser:
+    """The webhook parser before it decoded the body once"""
+
+    def __init__(self, request_data):
+        self.request_data = request_data
+
+    @property
+    def data(self) -> dict | None:
+        try:
+            data = json.loads(self.request_data)
+        except Exception:
+            return None
+
+        if not data.get("message") or not data.get("message").get("text"):
+            return None
+        return {"user": data.get("message").get("from"), "text_message": data.get("message").get("text", "")}
+
+
+def benchmark(name: str, parser_class, bodies: list[bytes], rounds: int) -> None:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for body in bodies:
+            parser = parser_class(body)
+            parser.data, parser.data, parser.data
+
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {elapsed / (rounds * len(bodies)) * 1_000_000:>7.2f} µs per update")
+
+
+def run(*args):
+    rounds = int(args[0]) if len(args) > 0 else 10_000
+
+    bodies = [json.dumps(update).encode() for update in CORPUS]
+    print(f"Corpus of {len(bodies)} updates, {rounds} rounds\n")
+
+    benchmark("before (decode per access)", DecodePerAccessParser, bodies, rounds)
+
+    orjson = telegram.orjson
+    telegram.orjson = None
+    try:
+        benchmark("decode once (json)", TelegramWebhookParser, bodies, rounds)
+    finally:
+        telegram.orjson = orjson
+
+    if orjson is not None:
+        benchmark("decode once (orjson)", TelegramWebhookParser, bodies, rounds)
@@ -0,0 +1,68 @@
+"""
+Django runscript to compare the payload size and the time spent loading and serializing a
+page of `WaifuListView` with the full (`fields = "__all__"`) and the slim list representation.
+
+Usage: python manage.py runscript benchmark_waifu_list [--script-args <page_size> <rounds>]
+"""
+
+import json
+import time
+
+from rest_framework import serializers
+
+from waifu.models import Image
+from waifu.serializers import WaifuListSerialzer
+
+
+class FullImageSerializer(serializers.ModelSerializer):
+    """The list representation before it was slimmed down"""
+
+    class Meta:
+        model = Image
+        fields = "__all__"
+
+
+def benchmark(name: str, queryset, serializer_class, context: dict, rounds: int) -> None:
+    query_time = serialization_time = 0.0
+    payload_size = 0
+
+    for _ in range(rounds):
+        start = time.perf_counter()
+        page = list(queryset)
+        query_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        data = serializer_class(page, many=True, context=context).data
+        payload = json.dumps(data, default=str)
+        serialization_time += time.perf_counter() - start
+        payload_size = len(payload.encode())
+
+    print(
+        f"{name:<28} payload: {payload_size / 1024:>9.1f} KiB"
+        f"  query: {query_time / rounds * 1000:>7.2f} ms"
+        f"  serialization: {serialization_time / rounds * 1000:>7.2f} ms"
+    )
+
+
+def run(*args):
+    page_size = int(args[0]) if len(args) > 0 else 20
+    rounds = int(args[1]) if len(args) > 1 else 20
+
+    queryset = Image.objects.filter(is_nsfw=False).order_by("-id")
+    page_ids = list(queryset.values_list("id", flat=True)[:page_size])
+    if not page_ids:
+        print("No images to benchmark")
+        return
+
+    queryset = queryset.filter(id__in=page_ids)
+    print(f"Page of {len(page_ids)} images, average of {rounds} rounds\n")
+
+    benchmark("before (__all__)", queryset, FullImageSerializer, {}, rounds)
+    benchmark("slim", queryset.defer("embedding"), WaifuListSerialzer, {}, rounds)
+    benchmark(
+        "slim, blur=false",
+        queryset.defer("embedding", "blur_data_url"),
+        WaifuListSerialzer,
+        {"include_blur_data_url": False},
+        rounds,
+    )
@@ -4,6 +4,8 @@ from django.core.cache import cache
 from requests import Response
 from saiyaku import retry
 
+from backend.utils.telegram import TelegramBotAPI
+
 from .models import SavedTiktokVideo
 
 
@@ -137,7 +139,6 @@ class TiktokVideoNoWatermark:
 def send_to_private_telegram_channel(video_url: str, caption: str = "") -> None:
     """Sent to private Telegram channel by via Telegram Bot"""
 
-    url = f"https://api.telegram.org/bot{settings.TIKTOK_MONITOR_TELEGRAM_BOT_SECRET}/sendDocument"
     payload = {
         "chat_id": settings.TIKTOK_MONITOR_TELEGRAM_PRIVATE_CHANNEL_ID,
         "document": video_url,
@@ -145,5 +146,5 @@ def send_to_private_telegram_channel(video_url: str, caption: str = "") -> None:
         "disable_notification": True,
     }
 
-    response = requests.request("POST", url, data=payload)
+    response = TelegramBotAPI(settings.TIKTOK_MONITOR_TELEGRAM_BOT_SECRET).request("sendDocument", payload)
     return response.status_code
@@ -0,0 +1,64 @@
+from django.db import connection, transaction
+from django.utils import timezone
+
+from backend.utils.cache import CounterBuffer
+
+from .models import ExternalLink, TelegramUser
+
+
+class TelegramUserActivityBuffer(CounterBuffer):
+    """
+    Buffer the `request_count` increments of the telegram users in Redis, instead of saving the
+    user row on every webhook. Flushed by the `flush_telegram_user_activity` task, with one
+    `UPDATE ... FROM (VALUES ...)` per batch of users.
+
+    The profile (name, username) is saved by `TelegramUser.get_or_create_cached`, only when it changed.
+    """
+
+    KEY = "twitter_downloader_user_activity:counts"
+
+    UPDATE_SQL = """
+        UPDATE {table} AS telegram_user
+        SET
+            request_count = telegram_user.request_count + activity.request_count::integer,
+            is_active = TRUE,
+            updated_at = %s
+        FROM (VALUES {values}) AS activity (user_id, request_count)
+        WHERE telegram_user.user_id = activity.user_id
+    """
+
+    def update(self, counts: dict[str, int]) -> None:
+        now = timezone.now()
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            for batch in self.batches(counts):
+                values = ", ".join(["(%s, %s)"] * len(batch))
+                params = [now] + [value for item in batch for value in item]
+                cursor.execute(self.UPDATE_SQL.format(table=TelegramUser._meta.db_table, values=values), params)
+
+
+class ExternalLinkClickBuffer(CounterBuffer):
+    """
+    Buffer the clicks on the external links in Redis, instead of one UPDATE per click.
+    Flushed by the `flush_external_link_clicks` task.
+    """
+
+    KEY = "twitter_downloader_external_link_clicks"
+
+    UPDATE_SQL = """
+        UPDATE {table} AS external_link
+        SET counter = external_link.counter + clicks.count::integer
+        FROM (VALUES {values}) AS clicks (id, count)
+        WHERE external_link.id = clicks.id::bigint
+    """
+
+    def update(self, counts: dict[str, int]) -> None:
+        with transaction.atomic(), connection.cursor() as cursor:
+            for batch in self.batches(counts):
+                values = ", ".join(["(%s, %s)"] * len(batch))
+                params = [value for item in batch for value in item]
+                cursor.execute(self.UPDATE_SQL.format(table=ExternalLink._meta.db_table, values=values), params)
+
+
+telegram_user_activity = TelegramUserActivityBuffer()
+external_link_clicks = ExternalLinkClickBuffer()
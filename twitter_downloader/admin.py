@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models import Count
 from django.utils.html import format_html
 from solo.admin import SingletonModelAdmin
 from unfold.admin import ModelAdmin
@@ -6,7 +7,7 @@ from unfold.decorators import action
 
 from .models import BroadcastLog, BroadcastMessage, DownloadedTweet, ExternalLink
 from .models import Settings as TwitterDownloaderSettings
-from .models import TelegramUser
+from .models import TelegramUser, Tweet
 
 
 @admin.register(TelegramUser)
@@ -30,10 +31,26 @@ class TelegramUserAdmin(ModelAdmin):
     search_fields = ("user_id", "first_name", "last_name", "username")
 
 
+@admin.register(Tweet)
+class TweetAdmin(ModelAdmin):
+    list_display = ("id", "url", "download_count", "created_at")
+    readonly_fields = ("id", "url", "tweet_data", "created_at")
+    search_fields = ("id",)
+    ordering = ("-created_at",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(download_count=Count("downloads"))
+
+    @admin.display(description="Downloads", ordering="download_count")
+    def download_count(self, obj):
+        return obj.download_count
+
+
 @admin.register(DownloadedTweet)
 class DownloadedTweetAdmin(ModelAdmin):
-    list_display = ("tweet_url", "telegram_user", "created_at")
-    readonly_fields = ("tweet_url", "telegram_user", "created_at")
+    list_display = ("tweet", "telegram_user", "created_at")
+    list_select_related = ("tweet", "telegram_user")
+    readonly_fields = ("tweet", "telegram_user", "created_at")
     ordering = ("-created_at",)
 
 
@@ -61,6 +78,8 @@ class BroadcastMessageAdmin(ModelAdmin):
         "sent_count",
         "failed_count",
         "progress_bar",
+        "throughput_display",
+        "eta_display",
         "created_at",
         "started_at",
     )
@@ -71,6 +90,12 @@ class BroadcastMessageAdmin(ModelAdmin):
         "total_users",
         "sent_count",
         "failed_count",
+        "throughput_display",
+        "eta_display",
+        "last_user_id",
+        "processed_chunks",
+        "checkpointed_at",
+        "stalled_resumes",
         "created_at",
         "started_at",
         "completed_at",
@@ -88,6 +113,19 @@ class BroadcastMessageAdmin(ModelAdmin):
                     "total_users",
                     "sent_count",
                     "failed_count",
+                    "throughput_display",
+                    "eta_display",
+                )
+            },
+        ),
+        (
+            "Checkpoint",
+            {
+                "fields": (
+                    "last_user_id",
+                    "processed_chunks",
+                    "checkpointed_at",
+                    "stalled_resumes",
                 )
             },
         ),
@@ -116,6 +154,7 @@ class BroadcastMessageAdmin(ModelAdmin):
         colors = {
             "draft": "gray",
             "sending": "blue",
+            "paused": "orange",
             "completed": "green",
             "failed": "red",
         }
@@ -148,6 +187,20 @@ class BroadcastMessageAdmin(ModelAdmin):
             f"{failed_percent:.1f}",
         )
 
+    @admin.display(description="Throughput")
+    def throughput_display(self, obj):
+        """Display messages sent per second"""
+        if obj.throughput is None:
+            return "-"
+        return f"{obj.throughput:.1f} msg/s"
+
+    @admin.display(description="ETA")
+    def eta_display(self, obj):
+        """Display estimated time left"""
+        if obj.eta is None:
+            return "-"
+        return str(obj.eta)
+
     def save_model(self, request, obj, form, change):
         """Auto-fill created_by field with current user"""
         if not change:  # Only on creation
@@ -168,7 +221,29 @@ class BroadcastMessageAdmin(ModelAdmin):
             f"Started broadcasting {count} message(s). Check celery logs for progress.",
         )
 
-    actions = [start_broadcast]
+    @action(description="Pause Broadcasting")
+    def pause_broadcast(self, request, queryset):
+        """Admin action to pause broadcasting selected messages after their current chunk"""
+        count = 0
+        for broadcast in queryset:
+            if broadcast.status == BroadcastMessage.BroadcastStatus.SENDING:
+                broadcast.pause_broadcast()
+                count += 1
+
+        self.message_user(request, f"Paused broadcasting {count} message(s).")
+
+    @action(description="Resume Broadcasting")
+    def resume_broadcast(self, request, queryset):
+        """Admin action to resume broadcasting selected messages from their last checkpoint"""
+        count = 0
+        for broadcast in queryset:
+            if broadcast.status == BroadcastMessage.BroadcastStatus.PAUSED:
+                broadcast.resume_broadcast()
+                count += 1
+
+        self.message_user(request, f"Resumed broadcasting {count} message(s).")
+
+    actions = ["start_broadcast", "pause_broadcast", "resume_broadcast"]
 
 
 @admin.register(BroadcastLog)
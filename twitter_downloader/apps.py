@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TwitterDownloaderConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "twitter_downloader"
+
+    def ready(self):
+        import twitter_downloader.signals  # noqa: F401
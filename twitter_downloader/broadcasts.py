@@ -0,0 +1,160 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from django.db import transaction
+from django.db.models import Count, F, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from backend.utils.telegram import TelegramBotAPI
+
+from .models import BroadcastLog, BroadcastMessage, TelegramUser
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastSender:
+    """
+    Send a `BroadcastMessage` to the active telegram users, one chunk of users at a time.
+    After each chunk, the ID of its last user is saved as a checkpoint to resume from.
+
+    The messages of a chunk are sent concurrently over the shared `TelegramBotAPI` session, as
+    bulk traffic of the shared rate limiter. Every `LOG_BATCH_SIZE` sent messages are logged with
+    one `bulk_create` and counted with one UPDATE, so when the chunk fails midway (time limit,
+    database error...) its retry skips the users already sent to. If the worker is killed, at most
+    the last `LOG_BATCH_SIZE` + `CONCURRENCY` users of the chunk are sent the message again.
+    """
+
+    CHUNK_SIZE = 500
+    CONCURRENCY = 8
+    LOG_BATCH_SIZE = 25
+
+    def __init__(self, broadcast: BroadcastMessage):
+        self.broadcast = broadcast
+        self.telegram_api = TelegramBotAPI(TelegramUser.BOT_TOKEN, priority="bulk")
+
+    @staticmethod
+    def get_recipients():
+        return TelegramUser.objects.filter(is_active=True, is_banned=False)
+
+    def send_chunk(self) -> bool:
+        """
+        Send the broadcast to the next chunk of recipients after the `last_user_id` checkpoint, then
+        move the checkpoint to the last recipient of the chunk.
+
+        Returns:
+            bool: False if there are no recipients left
+        """
+
+        started = time.monotonic()
+        after_id = self.broadcast.last_user_id
+
+        recipients = self.get_recipients().filter(id__gt=after_id).order_by("id").values_list("id", "user_id")
+        chunk = list(recipients[: self.CHUNK_SIZE])
+        if not chunk:
+            return False
+        last_id = chunk[-1][0]
+
+        # Skip the users already processed, eg. when the chunk is retried
+        processed_ids = set(
+            BroadcastLog.objects.filter(
+                broadcast=self.broadcast,
+                telegram_user_id__in=[telegram_user_id for telegram_user_id, _ in chunk],
+            ).values_list("telegram_user_id", flat=True)
+        )
+        chunk = [
+            (telegram_user_id, chat_id) for telegram_user_id, chat_id in chunk if telegram_user_id not in processed_ids
+        ]
+
+        executor = ThreadPoolExecutor(max_workers=self.CONCURRENCY)
+        futures = {executor.submit(self.send, chat_id): telegram_user_id for telegram_user_id, chat_id in chunk}
+        logged = set()
+        try:
+            for completed, future in enumerate(as_completed(futures), start=1):
+                # Raise the unexpected errors, the chunk is retried
+                future.result()
+                if completed % self.LOG_BATCH_SIZE == 0:
+                    self.save_logs(futures, logged)
+        finally:
+            # Stop sending on errors, and log the messages sent until then
+            executor.shutdown(cancel_futures=True)
+            self.save_logs(futures, logged)
+
+        # The checkpoint is saved once the whole chunk is logged, a restart resumes after this chunk
+        BroadcastMessage.objects.filter(uuid=self.broadcast.uuid).update(
+            last_user_id=last_id,
+            processed_chunks=F("processed_chunks") + 1,
+            sending_seconds=F("sending_seconds") + (time.monotonic() - started),
+            checkpointed_at=timezone.now(),
+            stalled_resumes=0,
+        )
+
+        self.broadcast.last_user_id = last_id
+        return True
+
+    def save_logs(self, futures: dict, logged: set) -> None:
+        """Log the sent messages which aren't logged yet, and add them to the broadcast counters"""
+
+        logs = []
+        for future, telegram_user_id in futures.items():
+            if future in logged or not future.done() or future.cancelled() or future.exception():
+                continue
+
+            error_message = future.result()
+            logs.append(
+                BroadcastLog(
+                    broadcast=self.broadcast,
+                    telegram_user_id=telegram_user_id,
+                    status=BroadcastLog.LogStatus.FAILED if error_message else BroadcastLog.LogStatus.SUCCESS,
+                    error_message=error_message,
+                )
+            )
+            logged.add(future)
+
+        if not logs:
+            return
+
+        with transaction.atomic():
+            BroadcastLog.objects.bulk_create(logs, ignore_conflicts=True)
+            # Only count the logs inserted, the users already logged (eg. by a redelivered chunk) are ignored.
+            # Their UUIDs are generated here, so the inserted logs are the ones found by UUID.
+            uuids = [log.uuid for log in logs]
+            BroadcastMessage.objects.filter(uuid=self.broadcast.uuid).update(
+                sent_count=F("sent_count") + self.count_logs(uuids, BroadcastLog.LogStatus.SUCCESS),
+                failed_count=F("failed_count") + self.count_logs(uuids, BroadcastLog.LogStatus.FAILED),
+            )
+
+    @staticmethod
+    def count_logs(uuids: list, status: str) -> Coalesce:
+        logs = (
+            BroadcastLog.objects.filter(uuid__in=uuids, status=status)
+            .values("broadcast_id")
+            .annotate(count=Count("uuid"))
+            .values("count")
+        )
+        return Coalesce(Subquery(logs), 0)
+
+    def send(self, chat_id: str) -> str:
+        """Send the broadcast message to a chat. Returns the error message, or an empty string on success."""
+
+        payload = {"chat_id": chat_id, "text": self.broadcast.message, "parse_mode": "HTML"}
+        try:
+            response = self.telegram_api.request("sendMessage", payload)
+        except requests.RequestException as e:
+            logger.warning("Failed to send broadcast %s to %s: %s", self.broadcast.uuid, chat_id, e)
+            return str(e) or e.__class__.__name__
+
+        if response.ok:
+            return ""
+        return response.text or f"HTTP {response.status_code}"
+
+    def complete(self) -> None:
+        BroadcastMessage.objects.filter(
+            uuid=self.broadcast.uuid,
+            status=BroadcastMessage.BroadcastStatus.SENDING,
+        ).update(
+            status=BroadcastMessage.BroadcastStatus.COMPLETED,
+            completed_at=timezone.now(),
+        )
@@ -0,0 +1,118 @@
+import logging
+import re
+
+from backend.utils.telegram_router import CommandMessage, CommandRouter
+
+from .activity import telegram_user_activity
+from .models import DownloadedTweet
+from .models import Settings as TwitterDownloaderSettings
+from .models import TelegramUser, Tweet
+from .tasks import forward_tweet_to_channel
+from .utils import get_cached_tweet_data, get_tweet_id_from_url
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramUpdateHandler:
+    """
+    Process a Telegram update received by `TelegramWebhookView`.
+    Runs in the `process_telegram_update` Celery task, so slow upstream calls don't block the webhook.
+    """
+
+    def __init__(self, update: dict):
+        self.update = update
+
+    def handle(self) -> None:
+        telegram_user = self.update_telegram_user(self.update.get("user"))
+
+        text_message = self.update.get("text_message")
+        if text_message:
+            self.router.dispatch(text_message, telegram_user, self)
+
+    def update_telegram_user(self, user_data: dict) -> TelegramUser:
+        # Get or create TelegramUser, from the cache for known users
+        telegram_user, _ = TelegramUser.get_or_create_cached(user_data, is_active=True)
+
+        # The request count is buffered, then saved by `flush_telegram_user_activity`
+        telegram_user_activity.record(telegram_user.user_id)
+
+        return telegram_user
+
+    @property
+    def is_maintenance(self):
+        """
+        Check if the Twitter downloader is in maintenance mode.
+        Returns:
+            bool: True if the system is in maintenance mode, False otherwise.
+        """
+
+        return TwitterDownloaderSettings.get_solo().is_maintenance
+
+    def check_maintenance(self, message: CommandMessage):
+        if self.is_maintenance:
+            message.user.send_maintenance_message()
+            return True
+
+    def check_banned(self, message: CommandMessage):
+        if message.user.is_banned:
+            message.user.send_banned_message()
+            return True
+
+    router = CommandRouter("twitter_downloader", middlewares=[check_maintenance, check_banned])
+
+    @router.command("/start")
+    def handle_start_command(self, message: CommandMessage):
+        telegram_user = message.user
+        telegram_user.send_message("Welcome to Twitter Video Downloader Bot!\n\no(*￣▽￣*)ブ")
+        telegram_user.send_message("Send me a tweet link and I will send you the video and download link!")
+
+    @router.command("/contact")
+    def handle_contact_command(self, message: CommandMessage):
+        message.user.send_message("Please contact me at arter@animemoe.us for any inquiries.")
+
+    @router.command("/about")
+    def handle_about_command(self, message: CommandMessage):
+        about_message = "This is the Twitter Video Downloader Bot.\n\n"
+        about_message += "It allows you to download videos from Twitter by sending a tweet link.\n\n"
+        about_message += "Developed by Arter Tendean.\n\n"
+        about_message += "For more information, visit our website at https://animemoe.us"
+        message.user.send_message(about_message)
+
+    @router.match(r"https://(?:x|twitter)\.com", name="tweet_link")
+    def handle_tweet_link(self, message: CommandMessage):
+        telegram_user = message.user
+        telegram_user.send_chat_action("typing")
+
+        # Extract all strings starting with "https"
+        urls = re.findall(r"https://\S+", message.text.lower())
+        url = urls[0] if urls else None
+
+        try:
+            tweet_id = get_tweet_id_from_url(url or "")
+        except ValueError:
+            telegram_user.send_message(
+                "Hmm... I couldn't find a valid tweet URL in your message. Could you double-check it? 😊"
+            )
+            return
+
+        try:
+            tweet_data = get_cached_tweet_data(url)
+        except Exception:
+            logger.exception("Failed to get tweet data for %s", url)
+            telegram_user.send_message("Sorry, I can't find any video in that tweet link.")
+            return
+
+        if not tweet_data or not tweet_data.get("success"):
+            telegram_user.send_message("Sorry, I can't find any video in that tweet link.")
+            return
+
+        tweet = Tweet.save_tweet_data(tweet_id, url, tweet_data)
+        downloaded_tweet = DownloadedTweet.objects.create(telegram_user=telegram_user, tweet=tweet)
+        downloaded_tweet.send_to_telegram_user()
+        forward_tweet_to_channel.delay(str(downloaded_tweet.uuid))
+
+    @router.default()
+    def handle_other_messages(self, message: CommandMessage):
+        message.user.send_message(
+            "Haha, I'm just a bot.\n\nI can't understand everything.\n\nTry sending a different command!"
+        )
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.21 on 2026-10-17 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("twitter_downloader", "0021_settings_forward_channel_id_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="broadcastmessage",
+            name="checkpointed_at",
+            field=models.DateTimeField(blank=True, help_text="Last checkpoint time", null=True),
+        ),
+        migrations.AddField(
+            model_name="broadcastmessage",
+            name="last_user_id",
+            field=models.PositiveBigIntegerField(default=0, help_text="ID of the last processed telegram user"),
+        ),
+        migrations.AddField(
+            model_name="broadcastmessage",
+            name="processed_chunks",
+            field=models.PositiveIntegerField(default=0, help_text="Number of processed chunks of users"),
+        ),
+        migrations.AddField(
+            model_name="broadcastmessage",
+            name="sending_seconds",
+            field=models.FloatField(default=0, help_text="Time spent sending the processed chunks"),
+        ),
+        migrations.AlterField(
+            model_name="broadcastmessage",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("draft", "Draft"),
+                    ("sending", "Sending"),
+                    ("paused", "Paused"),
+                    ("completed", "Completed"),
+                    ("failed", "Failed"),
+                ],
+                default="draft",
+                max_length=20,
+            ),
+        ),
+    ]
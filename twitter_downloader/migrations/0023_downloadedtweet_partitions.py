@@ -0,0 +1,155 @@
+from datetime import date
+
+from django.db import migrations, models, transaction
+
+TABLE = "twitter_downloader_downloadedtweet"
+PRIMARY_KEY = f"{TABLE}_pkey"
+CREATED_AT_INDEX = f"{TABLE}_created_at_6f02f870"
+TELEGRAM_USER_INDEX = f"{TABLE}_telegram_user_id_64706d1e"
+TELEGRAM_USER_FOREIGN_KEY = "twitter_downloader_d_telegram_user_id_64706d1e_fk_twitter_d"
+
+# Frozen copies of backend.utils.partitions, so later changes to it can't change this migration
+MONTHS_AHEAD = 3
+BATCH_SIZE = 10_000
+
+
+def add_months(month: date, months: int) -> date:
+    year, index = divmod(month.year * 12 + month.month - 1 + months, 12)
+    return date(year, index + 1, 1)
+
+
+def replace_table(schema_editor, partitioned: bool):
+    """
+    Copy the table into a new (un)partitioned one, then swap them, without blocking the writes
+    for the duration of the copy:
+
+    1. The new table is created with its indexes and constraints, and a trigger mirrors the
+       writes to the old table into it
+    2. The existing rows are copied in batches of `BATCH_SIZE`, each in its own transaction which
+       blocks the writes for the duration of the batch
+    3. The tables are swapped in a short transaction, which only drops and renames
+
+    The migration is not atomic, if it fails midway drop the `_new` table and its trigger function
+    before running it again.
+    """
+
+    execute = schema_editor.execute
+    connection = schema_editor.connection
+
+    partition_by = " PARTITION BY RANGE (created_at)" if partitioned else ""
+    primary_key = "(uuid, created_at)" if partitioned else "(uuid)"
+    execute(f"CREATE TABLE {TABLE}_new (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS){partition_by}")
+
+    if partitioned:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT MIN(created_at)::date, (NOW() AT TIME ZONE 'UTC')::date FROM {TABLE}")
+            oldest, today = cursor.fetchone()
+
+        # Named after the final table, the partitions keep their name when the table is renamed
+        month = add_months(oldest or today, 0)
+        while month <= add_months(today, MONTHS_AHEAD):
+            end = add_months(month, 1)
+            execute(
+                f"CREATE TABLE {TABLE}_p{month:%Y_%m} PARTITION OF {TABLE}_new "
+                f"FOR VALUES FROM ('{month} 00:00:00+00') TO ('{end} 00:00:00+00')"
+            )
+            month = end
+        execute(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE}_new DEFAULT")
+
+    # Built while the table is empty, and renamed after the swap
+    execute(f"ALTER TABLE {TABLE}_new ADD CONSTRAINT {PRIMARY_KEY}_new PRIMARY KEY {primary_key}")
+    execute(f"CREATE INDEX {TELEGRAM_USER_INDEX}_new ON {TABLE}_new (telegram_user_id)")
+    if partitioned:
+        execute(f"CREATE INDEX {CREATED_AT_INDEX}_new ON {TABLE}_new (created_at)")
+    execute(
+        f"ALTER TABLE {TABLE}_new ADD CONSTRAINT {TELEGRAM_USER_FOREIGN_KEY}_new FOREIGN KEY (telegram_user_id) "
+        "REFERENCES twitter_downloader_telegramuser (id) DEFERRABLE INITIALLY DEFERRED"
+    )
+
+    execute(
+        f"""
+        CREATE FUNCTION {TABLE}_mirror() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM {TABLE}_new WHERE uuid = OLD.uuid AND created_at = OLD.created_at;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO {TABLE}_new SELECT NEW.* ON CONFLICT DO NOTHING;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    execute(
+        f"CREATE TRIGGER {TABLE}_mirror AFTER INSERT OR UPDATE OR DELETE ON {TABLE} "
+        f"FOR EACH ROW EXECUTE FUNCTION {TABLE}_mirror()"
+    )
+
+    # Keyset pagination on the primary key of both the old and the new table. The writes are blocked
+    # during each batch: a row deleted while the batch copies it would be deleted from the new table
+    # by the trigger before the batch inserts it, and brought back.
+    last_uuid = "00000000-0000-0000-0000-000000000000"
+    while True:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {TABLE} IN SHARE ROW EXCLUSIVE MODE")
+            cursor.execute(
+                f"""
+                WITH batch AS (SELECT * FROM {TABLE} WHERE uuid > %s ORDER BY uuid LIMIT %s),
+                copied AS (INSERT INTO {TABLE}_new SELECT * FROM batch ON CONFLICT DO NOTHING)
+                SELECT uuid FROM batch ORDER BY uuid DESC LIMIT 1
+                """,
+                [last_uuid, BATCH_SIZE],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            break
+        last_uuid = row[0]
+
+    with transaction.atomic(using=connection.alias):
+        execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+        execute(f"DROP TABLE {TABLE}")
+        execute(f"DROP FUNCTION {TABLE}_mirror()")
+        execute(f"ALTER TABLE {TABLE}_new RENAME TO {TABLE}")
+        execute(f"ALTER TABLE {TABLE} RENAME CONSTRAINT {PRIMARY_KEY}_new TO {PRIMARY_KEY}")
+        execute(
+            f"ALTER TABLE {TABLE} RENAME CONSTRAINT {TELEGRAM_USER_FOREIGN_KEY}_new TO {TELEGRAM_USER_FOREIGN_KEY}"
+        )
+        execute(f"ALTER INDEX {TELEGRAM_USER_INDEX}_new RENAME TO {TELEGRAM_USER_INDEX}")
+        if partitioned:
+            execute(f"ALTER INDEX {CREATED_AT_INDEX}_new RENAME TO {CREATED_AT_INDEX}")
+
+
+def partition_downloaded_tweets(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        replace_table(schema_editor, partitioned=True)
+
+
+def unpartition_downloaded_tweets(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        replace_table(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+    # The rows are copied in batches, each in its own transaction, see `replace_table`
+    atomic = False
+
+    dependencies = [
+        ("twitter_downloader", "0022_broadcastmessage_checkpoint"),
+    ]
+
+    operations = [
+        # The created_at index is built by `replace_table` on PostgreSQL, before the rows are copied
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name="downloadedtweet",
+                    name="created_at",
+                    field=models.DateTimeField(auto_now_add=True, db_index=True),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(partition_downloaded_tweets, unpartition_downloaded_tweets),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.21 on 2026-10-17 04:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("twitter_downloader", "0023_downloadedtweet_partitions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Tweet",
+            fields=[
+                ("id", models.PositiveBigIntegerField(help_text="Tweet ID", primary_key=True, serialize=False)),
+                ("url", models.URLField(max_length=500)),
+                ("tweet_data", models.JSONField(default=dict)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="downloadedtweet",
+            name="tweet",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="downloads",
+                to="twitter_downloader.tweet",
+            ),
+        ),
+    ]
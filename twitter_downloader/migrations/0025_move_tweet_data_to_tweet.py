@@ -0,0 +1,99 @@
+import re
+
+from django.db import migrations, transaction
+from django.db.models import Q
+
+BATCH_SIZE = 1000
+
+
+def get_tweet_id(tweet_url: str) -> int | None:
+    match = re.search(r"/status/(\d+)", tweet_url)
+    return int(match.group(1)) if match else None
+
+
+def link_downloads_to_tweets(DownloadedTweet, Tweet):
+    """
+    Point the downloads without a tweet to it, in batches each in its own transaction.
+    The downloads are read oldest first and the data of the tweets is updated, so the data of the
+    latest download of each tweet is kept, like `Tweet.save_tweet_data` does.
+    """
+
+    downloads = (
+        DownloadedTweet.objects.filter(tweet__isnull=True)
+        .order_by("created_at", "uuid")
+        .only("uuid", "created_at", "tweet_url", "tweet_data")
+    )
+    last = None
+    while True:
+        queryset = downloads
+        if last is not None:
+            queryset = queryset.filter(
+                Q(created_at__gt=last.created_at) | Q(created_at=last.created_at, uuid__gt=last.uuid)
+            )
+        batch = list(queryset[:BATCH_SIZE])
+        if not batch:
+            return
+
+        with transaction.atomic():
+            save_batch(Tweet, DownloadedTweet, batch)
+        last = batch[-1]
+
+
+def save_batch(Tweet, DownloadedTweet, batch):
+    linked = []
+    tweets = {}
+    for downloaded_tweet in batch:
+        downloaded_tweet.tweet_id = get_tweet_id(downloaded_tweet.tweet_url)
+        if downloaded_tweet.tweet_id:
+            # The latest download of the tweet in the batch wins
+            tweets[downloaded_tweet.tweet_id] = Tweet(
+                id=downloaded_tweet.tweet_id, url=downloaded_tweet.tweet_url, tweet_data=downloaded_tweet.tweet_data
+            )
+            linked.append(downloaded_tweet)
+
+    Tweet.objects.bulk_create(
+        tweets.values(), update_conflicts=True, unique_fields=["id"], update_fields=["url", "tweet_data"]
+    )
+    DownloadedTweet.objects.bulk_update(linked, ["tweet"])
+
+
+def move_tweet_data_to_tweet(apps, schema_editor):
+    """
+    Save the data of each tweet once, in `Tweet`, and point the downloads to it. The downloads saved
+    by the previous release while this runs are linked by 0026, before `tweet` is made required.
+    """
+
+    link_downloads_to_tweets(
+        apps.get_model("twitter_downloader", "DownloadedTweet"), apps.get_model("twitter_downloader", "Tweet")
+    )
+
+
+def move_tweet_data_to_downloaded_tweet(apps, schema_editor):
+    DownloadedTweet = apps.get_model("twitter_downloader", "DownloadedTweet")
+
+    downloads = DownloadedTweet.objects.select_related("tweet").only("uuid", "tweet__url", "tweet__tweet_data")
+    batch = []
+    for downloaded_tweet in downloads.iterator(chunk_size=BATCH_SIZE):
+        downloaded_tweet.tweet_url = downloaded_tweet.tweet.url
+        downloaded_tweet.tweet_data = downloaded_tweet.tweet.tweet_data
+        batch.append(downloaded_tweet)
+
+        if len(batch) >= BATCH_SIZE:
+            with transaction.atomic():
+                DownloadedTweet.objects.bulk_update(batch, ["tweet_url", "tweet_data"])
+            batch = []
+    with transaction.atomic():
+        DownloadedTweet.objects.bulk_update(batch, ["tweet_url", "tweet_data"])
+
+
+class Migration(migrations.Migration):
+    # Each batch is saved in its own transaction, the table isn't locked for the whole migration
+    atomic = False
+
+    dependencies = [
+        ("twitter_downloader", "0024_tweet"),
+    ]
+
+    operations = [
+        migrations.RunPython(move_tweet_data_to_tweet, move_tweet_data_to_downloaded_tweet),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.21 on 2026-10-17 04:51
+
+from importlib import import_module
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+link_downloads_to_tweets = import_module(
+    "twitter_downloader.migrations.0025_move_tweet_data_to_tweet"
+).link_downloads_to_tweets
+
+
+def link_remaining_downloads(apps, schema_editor):
+    """
+    Link the downloads saved by the previous release since 0025, the writes are blocked until the
+    end of the migration so none is saved between this and `tweet` being made required.
+    """
+
+    DownloadedTweet = apps.get_model("twitter_downloader", "DownloadedTweet")
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"LOCK TABLE {DownloadedTweet._meta.db_table} IN SHARE ROW EXCLUSIVE MODE")
+
+    link_downloads_to_tweets(DownloadedTweet, apps.get_model("twitter_downloader", "Tweet"))
+    # Only the downloads without a tweet ID in their URL are left, they can't be linked to a tweet.
+    # The bot never saved such downloads.
+    DownloadedTweet.objects.filter(tweet__isnull=True).delete()
+
+    if schema_editor.connection.vendor == "postgresql":
+        # Run the deferred foreign key checks, a table with pending trigger events can't be altered
+        schema_editor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("twitter_downloader", "0025_move_tweet_data_to_tweet"),
+    ]
+
+    operations = [
+        migrations.RunPython(link_remaining_downloads, migrations.RunPython.noop),
+        # The default lets the migration be reversed, the column is then filled by 0025
+        migrations.AlterField(
+            model_name="downloadedtweet",
+            name="tweet_url",
+            field=models.URLField(default="", max_length=500),
+        ),
+        migrations.RemoveField(
+            model_name="downloadedtweet",
+            name="tweet_data",
+        ),
+        migrations.RemoveField(
+            model_name="downloadedtweet",
+            name="tweet_url",
+        ),
+        migrations.AlterField(
+            model_name="downloadedtweet",
+            name="tweet",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE, related_name="downloads", to="twitter_downloader.tweet"
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.21 on 2026-10-17 05:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("twitter_downloader", "0026_remove_downloadedtweet_tweet_data_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="broadcastmessage",
+            name="stalled_resumes",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Number of times the broadcast was resumed after stalling since its last checkpoint",
+            ),
+        ),
+    ]
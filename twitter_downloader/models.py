@@ -1,14 +1,19 @@
 import json
 import uuid
+from datetime import timedelta
 
-import requests
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.urls import reverse
 from django.utils import timezone
-from solo.models import SingletonModel
 
-from models.base import BaseTelegramUserModel
+from backend.utils.partitions import MonthlyPartitions
+from backend.utils.telegram import TelegramBotAPI
+from models.base import BaseTelegramUserModel, CachedSingletonModel
+
+from .relay import VideoRelay
 
 User = get_user_model()
 
@@ -29,74 +34,77 @@ class TelegramUser(BaseTelegramUserModel):
     def send_photo(self, message):
         self.send_chat_action("upload_photo")
 
-        url = f"https://api.telegram.org/bot{self.BOT_TOKEN}/sendPhoto"
-        payload = json.dumps(
-            {
-                "chat_id": self.user_id,
-                "photo": message.get("thumbnail"),
-                "text": "arter",
-                "parse_mode": "HTML",
-                "has_spoiler": message.get("is_nsfw", False),
-                "reply_markup": {
-                    "inline_keyboard": [
-                        [
-                            {"text": f"🔗 {video['quality']}", "url": video["url"]}
-                            for video in message.get("videos", [])[:3]
-                        ],
-                    ]
-                },
-            }
-        )
-        headers = {"Content-Type": "application/json"}
+        payload = {
+            "chat_id": self.user_id,
+            "photo": message.get("thumbnail"),
+            "text": "arter",
+            "parse_mode": "HTML",
+            "has_spoiler": message.get("is_nsfw", False),
+            "reply_markup": {
+                "inline_keyboard": [
+                    [
+                        {"text": f"🔗 {video['quality']}", "url": video["url"]}
+                        for video in message.get("videos", [])[:3]
+                    ],
+                ]
+            },
+        }
 
-        response = requests.request("POST", url, headers=headers, data=payload)
+        response = self.telegram_api.request("sendPhoto", payload)
         return response.ok
 
-    def send_video(self, tweet_data):
+    def send_video(self, tweet_data, tweet_id=None):
         self.send_chat_action("upload_video")
 
-        external_link = ExternalLink.objects.filter(is_active=True).order_by("-updated_at")
-        external_link = (
-            [
-                [{"text": i.title, "web_app": {"url": i.url}}] if i.is_web_app else [{"text": i.title, "url": i.url}]
-                for i in external_link
-            ]
-            if external_link
-            else []
-        )
-
-        url = f"https://api.telegram.org/bot{self.BOT_TOKEN}/sendPaidMedia"
-        payload = json.dumps(
-            {
-                "chat_id": self.user_id,
-                "star_count": 1,
-                # "video": tweet_data.get("videos")[0]["url"],
-                "media": [{"type": "video", "media": tweet_data.get("videos")[0]["url"]}],
-                "caption": tweet_data.get("description"),
-                "parse_mode": "HTML",
-                "has_spoiler": tweet_data.get("is_nsfw", False),
-                "reply_to_message_id": "",
-                "reply_markup": {
-                    "inline_keyboard": [
-                        [
-                            {"text": f"🔗 {video['quality']}", "url": video["url"]}
-                            for video in tweet_data.get("videos", [])[:3]
-                        ],
-                    ]
-                    + external_link
-                },
-            }
-        )
-
-        headers = {"Content-Type": "application/json"}
+        videos = tweet_data.get("videos", [])
+        payload = {
+            "chat_id": self.user_id,
+            "star_count": 1,
+            # The video uploaded by `VideoRelay` if any, Telegram doesn't have to fetch it again
+            "media": [{"type": "video", "media": VideoRelay.get_file_id(tweet_id) or videos[0]["url"]}],
+            "caption": tweet_data.get("description"),
+            "parse_mode": "HTML",
+            "has_spoiler": tweet_data.get("is_nsfw", False),
+            "reply_to_message_id": "",
+            "reply_markup": self.get_video_reply_markup(videos),
+        }
 
-        response = requests.request("POST", url, headers=headers, data=payload)
+        response = self.telegram_api.request("sendPaidMedia", payload)
 
         if response.ok:
             return response.ok
 
-        if response.status_code != 200:
-            return self.send_photo(tweet_data)
+        # Telegram may fail to fetch the video URL, the video is uploaded by a task instead
+        if VideoRelay.is_fetch_error(response):
+            from .tasks import relay_tweet_video
+
+            relay_tweet_video.delay(self.user_id, tweet_data, tweet_id)
+            return True
+
+        return self.send_photo(tweet_data)
+
+    def relay_video(self, tweet_data, tweet_id=None) -> bool:
+        """Upload the video of the tweet with `VideoRelay`, see `relay_tweet_video`"""
+        self.send_chat_action("upload_video")
+
+        payload = {
+            "chat_id": self.user_id,
+            "caption": tweet_data.get("description"),
+            "parse_mode": "HTML",
+            "has_spoiler": tweet_data.get("is_nsfw", False),
+            "reply_markup": self.get_video_reply_markup(tweet_data.get("videos", [])),
+        }
+        response = VideoRelay(self.telegram_api).send_video(payload, tweet_data.get("videos", []), tweet_id)
+        return response is not None and response.ok
+
+    @staticmethod
+    def get_video_reply_markup(videos: list[dict]) -> dict:
+        return {
+            "inline_keyboard": [
+                [{"text": f"🔗 {video['quality']}", "url": video["url"]} for video in videos[:3]],
+            ]
+            + ExternalLink.get_inline_keyboard()
+        }
 
     def send_image_with_inline_keyboard(
         self,
@@ -104,29 +112,24 @@ class TelegramUser(BaseTelegramUserModel):
         inline_text: str,
         inline_url: str,
     ):
-        url = f"https://api.telegram.org/bot{self.BOT_TOKEN}/sendPhoto"
-        headers = {"Content-Type": "application/json"}
-
-        payload = json.dumps(
-            {
-                "chat_id": self.user_id,
-                "photo": image_url,
-                "parse_mode": "HTML",
-                "disable_web_page_preview": "True",
-                "reply_markup": {
-                    "inline_keyboard": [
-                        [
-                            {
-                                "text": inline_text,
-                                "web_app": {"url": inline_url},
-                            }
-                        ],
-                    ]
-                },
-            }
-        )
+        payload = {
+            "chat_id": self.user_id,
+            "photo": image_url,
+            "parse_mode": "HTML",
+            "disable_web_page_preview": "True",
+            "reply_markup": {
+                "inline_keyboard": [
+                    [
+                        {
+                            "text": inline_text,
+                            "web_app": {"url": inline_url},
+                        }
+                    ],
+                ]
+            },
+        }
 
-        response = requests.request("POST", url, headers=headers, data=payload)
+        response = self.telegram_api.request("sendPhoto", payload)
         return response.ok
 
     def send_download_button_with_safelink(
@@ -134,45 +137,98 @@ class TelegramUser(BaseTelegramUserModel):
         inline_text: str,
         inline_url: str,
     ):
-        url = f"https://api.telegram.org/bot{self.BOT_TOKEN}/sendMessage"
-        headers = {"Content-Type": "application/json"}
-
-        payload = json.dumps(
-            {
-                "chat_id": self.user_id,
-                "text": "Click the button below to continue! 😉\n\nAnd hey, don’t forget to click the ads to support this bot!\nYour clicks help keep things running smoothly! 💡",
-                "parse_mode": "HTML",
-                "disable_web_page_preview": "True",
-                "reply_markup": {
-                    "inline_keyboard": [
-                        [
-                            {
-                                "text": inline_text,
-                                "web_app": {"url": inline_url},
-                            }
-                        ],
-                    ]
-                },
-            }
-        )
+        payload = {
+            "chat_id": self.user_id,
+            "text": "Click the button below to continue! 😉\n\nAnd hey, don’t forget to click the ads to support this bot!\nYour clicks help keep things running smoothly! 💡",
+            "parse_mode": "HTML",
+            "disable_web_page_preview": "True",
+            "reply_markup": {
+                "inline_keyboard": [
+                    [
+                        {
+                            "text": inline_text,
+                            "web_app": {"url": inline_url},
+                        }
+                    ],
+                ]
+            },
+        }
 
-        response = requests.request("POST", url, headers=headers, data=payload)
+        response = self.telegram_api.request("sendMessage", payload)
         return response.ok
 
 
+class Tweet(models.Model):
+    """
+    The data of a downloaded tweet, saved once however many users download the tweet, and updated with
+    the data of its latest download. Deleted by `delete_old_data` once its downloads expired.
+    """
+
+    id = models.PositiveBigIntegerField(primary_key=True, help_text="Tweet ID")
+    url = models.URLField(max_length=500)
+    tweet_data = models.JSONField(default=dict)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.url
+
+    @classmethod
+    def save_tweet_data(cls, tweet_id: str, url: str, tweet_data: dict) -> "Tweet":
+        """Save the data of a tweet, the data of a tweet downloaded again is updated. Returns the saved tweet"""
+        tweet = cls(id=int(tweet_id), url=url, tweet_data=tweet_data)
+        cls.objects.bulk_create(
+            [tweet], update_conflicts=True, unique_fields=["id"], update_fields=["url", "tweet_data"]
+        )
+        return tweet
+
+    @classmethod
+    def delete_without_downloads(cls, cutoff) -> int:
+        """
+        Delete the tweets created before the cutoff without downloads left, with a single DELETE.
+        `QuerySet.delete()` would collect the downloads to cascade, though there are none.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                DELETE FROM {cls._meta.db_table} AS tweet
+                WHERE tweet.created_at < %s
+                AND NOT EXISTS (SELECT 1 FROM {DownloadedTweet._meta.db_table} WHERE tweet_id = tweet.id)
+                """,
+                [cutoff],
+            )
+            return cursor.rowcount
+
+    @classmethod
+    def get_most_downloaded(cls, since=None) -> models.QuerySet:
+        """The tweets with their `download_count` (since a date), the most downloaded first"""
+        queryset = cls.objects.filter(downloads__created_at__gte=since) if since else cls.objects.all()
+        return queryset.annotate(download_count=models.Count("downloads")).order_by("-download_count")
+
+
 class DownloadedTweet(models.Model):
+    """
+    A download of a tweet by a telegram user. The data of the tweet is saved once, in `Tweet`.
+
+    On PostgreSQL the table is partitioned by month of `created_at` (see migration 0023), so the old
+    downloads are deleted by dropping their partitions. The primary key of the table is (uuid, created_at).
+    """
+
     uuid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     telegram_user = models.ForeignKey(TelegramUser, on_delete=models.CASCADE)
-    tweet_url = models.URLField(max_length=500)
-    tweet_data = models.JSONField(default=dict)
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, related_name="downloads")
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     def __str__(self):
-        return self.tweet_url
+        return self.tweet.url
+
+    @classmethod
+    def get_partitions(cls) -> MonthlyPartitions:
+        return MonthlyPartitions(cls._meta.db_table, "created_at")
 
     def send_to_telegram_user(self) -> bool:
-        return self.telegram_user.send_video(self.tweet_data)
+        return self.telegram_user.send_video(self.tweet.tweet_data, tweet_id=self.tweet_id)
 
 
 class ExternalLink(models.Model):
@@ -186,9 +242,63 @@ class ExternalLink(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # The keyboard rows of the active links, invalidated when a link is saved or deleted.
+    # Keyed by the base URL of the click URLs, so changing it doesn't serve the old URLs.
+    KEYBOARD_CACHE_KEY = "twitter_downloader_external_link_keyboard:{base_url}"
+    KEYBOARD_CACHE_TIMEOUT = 60 * 60 * 24
+
     def __str__(self):
         return self.title
 
+    def get_click_url(self) -> str:
+        """URL of the redirect view that counts the clicks on the link"""
+        path = reverse("twitter-downloader:external-link", kwargs={"pk": self.pk})
+        return f"{settings.TWITTER_DOWNLOADER_BASE_URL.rstrip('/')}{path}"
+
+    def get_inline_button(self) -> dict:
+        # Web apps are opened by Telegram itself, so their clicks can't go through the redirect view
+        if self.is_web_app:
+            return {"text": self.title, "web_app": {"url": self.url}}
+        return {"text": self.title, "url": self.get_click_url()}
+
+    @classmethod
+    def get_cached_links(cls) -> dict:
+        """
+        The prebuilt keyboard of the active links, and their URLs by ID for the redirect view.
+        Cached as a JSON string, so the links are queried once per change instead of once per tweet.
+        """
+
+        cache_key = cls.get_keyboard_cache_key()
+        cached = cache.get(cache_key)
+        if cached is None:
+            links = cls.objects.filter(is_active=True).order_by("-updated_at")
+            cached = json.dumps(
+                {
+                    "keyboard": [[link.get_inline_button()] for link in links],
+                    "urls": {str(link.pk): link.url for link in links},
+                }
+            )
+            cache.set(cache_key, cached, cls.KEYBOARD_CACHE_TIMEOUT)
+        return json.loads(cached)
+
+    @classmethod
+    def get_keyboard_cache_key(cls) -> str:
+        return cls.KEYBOARD_CACHE_KEY.format(base_url=settings.TWITTER_DOWNLOADER_BASE_URL)
+
+    @classmethod
+    def get_inline_keyboard(cls) -> list[list[dict]]:
+        """Inline keyboard rows of the active links, one button per row"""
+        return cls.get_cached_links()["keyboard"]
+
+    @classmethod
+    def get_redirect_url(cls, pk: int) -> str | None:
+        """URL of an active link, or None"""
+        return cls.get_cached_links()["urls"].get(str(pk))
+
+    @classmethod
+    def invalidate_cache(cls) -> None:
+        transaction.on_commit(lambda: cache.delete(cls.get_keyboard_cache_key()))
+
 
 class BroadcastMessage(models.Model):
     """Model for storing broadcast messages to be sent to all telegram users"""
@@ -196,6 +306,7 @@ class BroadcastMessage(models.Model):
     class BroadcastStatus(models.TextChoices):
         DRAFT = "draft", "Draft"
         SENDING = "sending", "Sending"
+        PAUSED = "paused", "Paused"
         COMPLETED = "completed", "Completed"
         FAILED = "failed", "Failed"
 
@@ -212,6 +323,15 @@ class BroadcastMessage(models.Model):
     sent_count = models.PositiveIntegerField(default=0, help_text="Number of messages successfully sent")
     failed_count = models.PositiveIntegerField(default=0, help_text="Number of messages that failed to send")
 
+    # Checkpoint, the broadcast resumes from the first user after `last_user_id`
+    last_user_id = models.PositiveBigIntegerField(default=0, help_text="ID of the last processed telegram user")
+    processed_chunks = models.PositiveIntegerField(default=0, help_text="Number of processed chunks of users")
+    sending_seconds = models.FloatField(default=0, help_text="Time spent sending the processed chunks")
+    checkpointed_at = models.DateTimeField(null=True, blank=True, help_text="Last checkpoint time")
+    stalled_resumes = models.PositiveIntegerField(
+        default=0, help_text="Number of times the broadcast was resumed after stalling since its last checkpoint"
+    )
+
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     started_at = models.DateTimeField(null=True, blank=True, help_text="Broadcasting start time")
@@ -251,8 +371,42 @@ class BroadcastMessage(models.Model):
 
         self.save()
 
-        # Trigger celery task
-        broadcast_message_to_all_users.delay(str(self.uuid))
+        # Trigger celery task once the status is committed, the chunks aren't sent to a broadcast in draft
+        transaction.on_commit(lambda: broadcast_message_to_all_users.delay(str(self.uuid)))
+
+    def pause_broadcast(self):
+        """Stop broadcasting after the current chunk"""
+        self.status = self.BroadcastStatus.PAUSED
+        self.save(update_fields=["status"])
+
+    def resume_broadcast(self):
+        """Resume broadcasting from the last checkpoint, eg. a failed broadcast once the cause is fixed"""
+        from .tasks import send_broadcast_chunk
+
+        self.status = self.BroadcastStatus.SENDING
+        self.stalled_resumes = 0
+        self.save(update_fields=["status", "stalled_resumes"])
+
+        transaction.on_commit(lambda: send_broadcast_chunk.delay(str(self.uuid), self.last_user_id))
+
+    @property
+    def processed_count(self) -> int:
+        return self.sent_count + self.failed_count
+
+    @property
+    def throughput(self) -> float | None:
+        """Messages sent per second, pauses excluded"""
+        if not self.sending_seconds:
+            return None
+        return self.processed_count / self.sending_seconds
+
+    @property
+    def eta(self) -> timedelta | None:
+        """Estimated time left to send the broadcast to the remaining users"""
+        if self.status != self.BroadcastStatus.SENDING or not self.throughput:
+            return None
+        remaining = max(self.total_users - self.processed_count, 0)
+        return timedelta(seconds=round(remaining / self.throughput))
 
 
 class BroadcastLog(models.Model):
@@ -289,7 +443,7 @@ class BroadcastLog(models.Model):
         return f"{self.telegram_user.username or self.telegram_user.user_id} - {self.status}"
 
 
-class Settings(SingletonModel):
+class Settings(CachedSingletonModel):
     class Meta:
         verbose_name = "Twitter Downloader Settings"
 
@@ -318,12 +472,10 @@ class Settings(SingletonModel):
         super().save(*args, **kwargs)
 
     def set_webhook(self) -> bool:
-        url = f"https://api.telegram.org/bot{settings.TWITTER_VIDEO_DOWNLOADER_BOT_TOKEN}/setWebhook"
-
         payload = {
             "url": self.webhook_url,
             "secret_token": self.secret_token,
         }
 
-        response = requests.request("POST", url, data=payload)
+        response = TelegramBotAPI(settings.TWITTER_VIDEO_DOWNLOADER_BOT_TOKEN).request("setWebhook", payload)
         return response.ok
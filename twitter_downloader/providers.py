@@ -0,0 +1,423 @@
+import logging
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from prometheus_client import Counter, Histogram
+from tenacity import stop_after_attempt
+
+from .utils import (
+    TwitterDownloader,
+    TwitterDownloaderAPIV2,
+    TwitterDownloaderAPIV3,
+    TwitterDownloaderAPIV4,
+    get_tweet_id_from_url,
+)
+
+logger = logging.getLogger(__name__)
+
+provider_request_seconds = Histogram(
+    "twitter_downloader_provider_request_seconds",
+    "Tweet extraction requests, labeled by provider and outcome",
+    ["provider", "outcome"],
+)
+provider_hedged_requests = Counter(
+    "twitter_downloader_provider_hedged_requests_total",
+    "Hedged requests fired because the previous provider was slower than its p95 latency",
+    ["provider"],
+)
+
+VIDEO_QUALITIES = ["HD", "SD", "Low"]
+
+
+class ProviderError(Exception):
+    """The provider failed to answer (network error, bad response...), another provider should be tried."""
+
+
+def _no_video_result(tweet_url: str) -> dict:
+    return {
+        "success": False,
+        "tweet": tweet_url,
+        "error": "No video links found. The tweet may not contain a video or the URL is invalid.",
+    }
+
+
+def _normalize_videos(variants: list[dict]) -> list[dict]:
+    """
+    Convert `{"url", "bitrate", "size"}` video variants to the `TwitterDownloaderAPIV4` video schema,
+    highest bitrate first.
+    """
+
+    videos = []
+    for index, variant in enumerate(sorted(variants, key=lambda variant: variant.get("bitrate") or 0, reverse=True)):
+        width, height = (int(value) for value in (variant.get("size") or "0x0").split("x"))
+        videos.append(
+            {
+                "url": variant.get("url"),
+                "quality": VIDEO_QUALITIES[index] if index < len(VIDEO_QUALITIES) else f"{height}p",
+                "resolution": f"{width}x{height}",
+                "format": "mp4",
+                "width": width,
+                "height": height,
+            }
+        )
+    return videos
+
+
+class TweetProvider:
+    """
+    Adapter of a tweet extractor. `fetch` returns the `TwitterDownloaderAPIV4.get_tweet_data` schema:
+
+        {
+            "success": bool,
+            "tweet": str,
+            "description": str,
+            "thumbnail": str | None,
+            "is_nsfw": bool,
+            "videos": [{"url", "quality", "resolution", "format", "width", "height"}],
+        }
+
+    A tweet without a video is a successful answer with `"success": False`, failures raise `ProviderError`.
+    Providers make a single attempt, the router fails over to the next provider instead of retrying.
+
+    `upstream` is the service the provider calls, the router doesn't hedge between providers of the
+    same upstream since it would only double its load.
+    """
+
+    name = ""
+
+    @property
+    def upstream(self) -> str:
+        return self.name
+
+    def is_configured(self) -> bool:
+        return True
+
+    def fetch(self, tweet_url: str) -> dict:
+        raise NotImplementedError
+
+
+class TwitterDownloaderAPIV4Provider(TweetProvider):
+    name = "v4"
+
+    @property
+    def upstream(self) -> str:
+        return TwitterDownloaderAPIV4.API_URL
+
+    def fetch(self, tweet_url: str) -> dict:
+        # Network and parsing errors are returned, not raised, so they aren't retried by tenacity
+        tweet_data = TwitterDownloaderAPIV4().get_tweet_data(tweet_url)
+
+        if tweet_data.get("retryable"):
+            raise ProviderError(tweet_data.get("error"))
+        return tweet_data
+
+
+class TwitterDownloaderAPIV3Provider(TweetProvider):
+    name = "v3"
+
+    @property
+    def upstream(self) -> str:
+        return settings.TWITTER_DOWNLOADER_API_URL
+
+    def is_configured(self) -> bool:
+        return bool(settings.TWITTER_DOWNLOADER_API_URL and settings.TWITTER_DOWNLOADER_API_KEY)
+
+    def fetch(self, tweet_url: str) -> dict:
+        # A single attempt, the router fails over to the next provider instead of retrying
+        get_tweet_data = TwitterDownloaderAPIV3.get_tweet_data.retry_with(stop=stop_after_attempt(1))
+        try:
+            tweet_data = get_tweet_data(TwitterDownloaderAPIV3(), get_tweet_id_from_url(tweet_url))
+        except Exception as e:
+            raise ProviderError(str(e)) from e
+
+        if not tweet_data.get("videos"):
+            return _no_video_result(tweet_url)
+
+        video = tweet_data["videos"][0]
+        return {
+            "success": True,
+            "tweet": tweet_url,
+            "description": tweet_data.get("text") or "",
+            "thumbnail": video.get("thumbnail"),
+            "is_nsfw": tweet_data.get("is_nsfw", False),
+            "videos": _normalize_videos(video.get("variants", [])),
+        }
+
+
+class RapidAPIProviderMixin:
+    @property
+    def upstream(self) -> str:
+        return settings.TWITTER_DOWNLOADER_API_URL
+
+    def is_configured(self) -> bool:
+        return bool(
+            settings.TWITTER_DOWNLOADER_API_URL
+            and settings.TWITTER_DOWNLOADER_KEY
+            and settings.TWITTER_DOWNLOADER_HOST
+        )
+
+
+class TwitterDownloaderAPIV2Provider(RapidAPIProviderMixin, TweetProvider):
+    name = "v2"
+
+    def fetch(self, tweet_url: str) -> dict:
+        try:
+            tweet = TwitterDownloaderAPIV2(tweet_url, retry_rate_limited=False)
+        except Exception as e:
+            raise ProviderError(str(e)) from e
+
+        media = tweet.data[0] if tweet.data else {}
+        if media.get("type") != "video":
+            return _no_video_result(tweet_url)
+
+        variants = [
+            {
+                "url": video_info.get("url"),
+                "bitrate": video_info.get("bitrate"),
+                "size": (re.findall(r"[0-9]+x[0-9]+", video_info.get("url", "")) or ["0x0"])[0],
+            }
+            for video_info in media.get("video_info", [])
+            if video_info.get("bitrate")
+        ]
+        return {
+            "success": True,
+            "tweet": tweet_url,
+            "description": tweet.description or "",
+            "thumbnail": media.get("media"),
+            "is_nsfw": False,
+            "videos": _normalize_videos(variants),
+        }
+
+
+class TwitterDownloaderProvider(RapidAPIProviderMixin, TweetProvider):
+    name = "v1"
+
+    def fetch(self, tweet_url: str) -> dict:
+        try:
+            # Skip the retries of the rate limited requests
+            video_data = TwitterDownloader.get_video_data.__wrapped__(TwitterDownloader, tweet_url)
+        except Exception as e:
+            raise ProviderError(str(e)) from e
+
+        if not video_data or not video_data.get("videos"):
+            return _no_video_result(tweet_url)
+
+        return {
+            "success": True,
+            "tweet": tweet_url,
+            "description": video_data.get("description") or "",
+            "thumbnail": video_data.get("thumbnail"),
+            "is_nsfw": False,
+            "videos": _normalize_videos(video_data.get("videos")),
+        }
+
+
+class ProviderHealth:
+    """
+    Latency and error rate of a provider over its last requests, and its circuit breaker.
+
+    The breaker opens when at least half of the last `window` requests failed (with at least
+    `min_requests` of them), or after `max_consecutive_failures` failures in a row. While open the
+    provider is skipped; after `cooldown` seconds a single trial request is let through
+    (half-open) and its outcome closes or re-opens the breaker.
+
+    The state is kept per process.
+    """
+
+    def __init__(
+        self,
+        window: int = 50,
+        min_requests: int = 10,
+        error_rate_threshold: float = 0.5,
+        max_consecutive_failures: int = 5,
+        cooldown: int = 60,
+        default_hedge_delay: float = 5.0,
+    ):
+        self.window = window
+        self.min_requests = min_requests
+        self.error_rate_threshold = error_rate_threshold
+        self.max_consecutive_failures = max_consecutive_failures
+        self.cooldown = cooldown
+        self.default_hedge_delay = default_hedge_delay
+
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.outcomes: deque[bool] = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    @property
+    def p95(self) -> float:
+        """p95 latency of the successful requests, `default_hedge_delay` until there are enough samples."""
+
+        if len(self.latencies) < self.min_requests:
+            return self.default_hedge_delay
+        latencies = sorted(self.latencies)
+        return latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.trial_in_flight or time.monotonic() - self.opened_at < self.cooldown:
+                return False
+
+            # Half-open: let a single trial request through
+            self.trial_in_flight = True
+            return True
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self.latencies.append(latency)
+            self.outcomes.append(True)
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.outcomes.append(False)
+            self.consecutive_failures += 1
+
+            is_failing = len(self.outcomes) >= self.min_requests and self.error_rate >= self.error_rate_threshold
+            if self.trial_in_flight or is_failing or self.consecutive_failures >= self.max_consecutive_failures:
+                if self.opened_at is None or self.trial_in_flight:
+                    logger.warning("Opening the circuit breaker, error rate %.0f%%", self.error_rate * 100)
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+
+
+class TweetProviderRouter:
+    """
+    Fetch tweet data from the first healthy provider, in `settings.TWITTER_DOWNLOADER_PROVIDERS` order.
+
+    - Providers that aren't configured or whose circuit breaker is open are skipped
+    - When a provider fails, the next one is called right away
+    - When a provider is slower than its p95 latency, a hedged request is fired to the next
+      provider of another upstream, and the first successful answer wins
+    """
+
+    PROVIDERS = {
+        provider.name: provider
+        for provider in (
+            TwitterDownloaderAPIV4Provider,
+            TwitterDownloaderAPIV3Provider,
+            TwitterDownloaderAPIV2Provider,
+            TwitterDownloaderProvider,
+        )
+    }
+    MAX_WORKERS = 8
+
+    def __init__(self, provider_names: list[str] | None = None):
+        self.provider_names = provider_names
+        self.health: dict[str, ProviderHealth] = {}
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix="tweet-provider")
+            return self._executor
+
+    def get_health(self, provider: TweetProvider) -> ProviderHealth:
+        with self._lock:
+            return self.health.setdefault(provider.name, ProviderHealth())
+
+    def get_providers(self) -> list[TweetProvider]:
+        provider_names = self.provider_names or settings.TWITTER_DOWNLOADER_PROVIDERS
+        providers = [self.PROVIDERS[name]() for name in provider_names if name in self.PROVIDERS]
+        return [provider for provider in providers if provider.is_configured()]
+
+    def get_tweet_data(self, tweet_url: str) -> dict:
+        """
+        Fetch the tweet data, see `TweetProvider` for the result schema.
+
+        Network and parsing errors of the last provider are returned with `"retryable": True`.
+        """
+
+        providers = list(self.get_providers())
+        pending: dict[Future, TweetProvider] = {}
+        last_started: TweetProvider | None = None
+        # A tweet without a video, returned if no running provider answers successfully
+        unsuccessful: dict | None = None
+        error = "No tweet provider is available."
+
+        def start_next(hedge: bool = False) -> bool:
+            nonlocal last_started
+            busy_upstreams = {provider.upstream for provider in pending.values()}
+            for provider in list(providers):
+                if hedge and provider.upstream in busy_upstreams:
+                    # Kept for the failover
+                    continue
+
+                providers.remove(provider)
+                if self.get_health(provider).allow_request():
+                    pending[self.executor.submit(self._fetch, provider, tweet_url)] = provider
+                    last_started = provider
+                    return True
+            return False
+
+        start_next()
+        while pending:
+            hedge_delay = self.get_health(last_started).p95
+            done, _ = wait(pending, timeout=hedge_delay, return_when=FIRST_COMPLETED)
+
+            if not done:
+                if start_next(hedge=True):
+                    provider_hedged_requests.labels(provider=last_started.name).inc()
+                    logger.info("Provider is slow, hedging the request to %s", last_started.name)
+                    continue
+
+                # No provider of another upstream left to hedge to, wait for the running ones
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    tweet_data = future.result()
+                except ProviderError as e:
+                    error = str(e)
+                    logger.warning("Tweet provider %s failed: %s", provider.name, e)
+                    continue
+
+                if tweet_data.get("success"):
+                    return tweet_data
+                unsuccessful = unsuccessful or tweet_data
+
+            if not pending:
+                if unsuccessful:
+                    return unsuccessful
+                start_next()
+
+        return {"success": False, "tweet": tweet_url, "error": error, "retryable": True}
+
+    def _fetch(self, provider: TweetProvider, tweet_url: str) -> dict:
+        health = self.get_health(provider)
+        start = time.monotonic()
+        try:
+            tweet_data = provider.fetch(tweet_url)
+        except Exception as e:
+            health.record_failure()
+            provider_request_seconds.labels(provider=provider.name, outcome="error").observe(time.monotonic() - start)
+            if isinstance(e, ProviderError):
+                raise
+            raise ProviderError(str(e)) from e
+
+        latency = time.monotonic() - start
+        health.record_success(latency)
+        provider_request_seconds.labels(provider=provider.name, outcome="success").observe(latency)
+        return {**tweet_data, "provider": provider.name}
+
+
+tweet_provider_router = TweetProviderRouter()
@@ -0,0 +1,131 @@
+import logging
+
+import requests
+from django.core.cache import cache
+
+from backend.utils.telegram import MultipartStream, TelegramBotAPI
+
+logger = logging.getLogger(__name__)
+
+
+class VideoRelay:
+    """
+    Upload the video of a tweet to Telegram with `sendVideo`, for when Telegram fails to fetch the
+    video URL itself.
+
+    The video is streamed from its source to Telegram in chunks of `CHUNK_SIZE`, never held whole
+    in memory. The best variant under the upload limit of the Bot API is sent. The `file_id` returned
+    by Telegram is cached by tweet ID, so the next sends of the tweet reuse the uploaded video.
+    """
+
+    CHUNK_SIZE = 256 * 1024
+    # The Bot API doesn't accept uploads over 50 MB
+    MAX_SIZE = 50 * 1024 * 1024
+    # (connect, read) timeouts of the video source
+    TIMEOUT = (5, 30)
+
+    FILE_ID_CACHE_KEY = "twitter_downloader_video_file_id:{tweet_id}"
+    FILE_ID_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+    # Descriptions of the Bad Request errors of the Bot API when it can't fetch the video URL,
+    # or doesn't know the file_id
+    FETCH_ERRORS = ("failed to get http url content", "wrong file identifier")
+    FILE_ID_ERROR = "wrong file identifier"
+
+    def __init__(self, telegram_api: TelegramBotAPI):
+        self.telegram_api = telegram_api
+
+    @classmethod
+    def get_file_id(cls, tweet_id) -> str | None:
+        if not tweet_id:
+            return None
+        return cache.get(cls.FILE_ID_CACHE_KEY.format(tweet_id=tweet_id))
+
+    @classmethod
+    def set_file_id(cls, tweet_id, file_id: str | None) -> None:
+        key = cls.FILE_ID_CACHE_KEY.format(tweet_id=tweet_id)
+        if file_id:
+            cache.set(key, file_id, cls.FILE_ID_CACHE_TIMEOUT)
+        else:
+            cache.delete(key)
+
+    def send_video(self, payload: dict, videos: list[dict], tweet_id=None) -> requests.Response | None:
+        """
+        Send the video with the `sendVideo` parameters of the payload (chat_id, caption...).
+        The videos are the variants of the tweet data, the best first.
+
+        Returns:
+            requests.Response | None: The response of Telegram, or None if no variant could be uploaded
+        """
+
+        file_id = self.get_file_id(tweet_id)
+        if file_id:
+            response = self.telegram_api.request("sendVideo", {**payload, "video": file_id})
+            if response.ok or not self.is_file_id_error(response):
+                return response
+            # Telegram doesn't know the file anymore, upload it again
+            self.set_file_id(tweet_id, None)
+
+        for video in videos:
+            response = self.upload(payload, video["url"])
+            if response is None:
+                continue
+
+            if response.ok and tweet_id:
+                self.set_file_id(tweet_id, self.get_response_file_id(response))
+            return response
+
+        return None
+
+    def upload(self, payload: dict, url: str) -> requests.Response | None:
+        """Stream the video from its URL to Telegram. Returns None if the video can't be relayed."""
+
+        try:
+            with requests.get(url, stream=True, timeout=self.TIMEOUT) as source:
+                size = int(source.headers.get("Content-Length") or 0)
+                if not source.ok or not size or size > self.MAX_SIZE:
+                    logger.info("Not relaying %s: HTTP %s, %s bytes", url, source.status_code, size)
+                    return None
+
+                file = MultipartStream(
+                    {**payload, "supports_streaming": True},
+                    "video",
+                    "video.mp4",
+                    source.iter_content(self.CHUNK_SIZE),
+                    size,
+                    source.headers.get("Content-Type", "video/mp4"),
+                )
+                return self.telegram_api.upload("sendVideo", file)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning("Failed to relay the video %s: %s", url, e)
+            return None
+
+    @staticmethod
+    def get_response_file_id(response: requests.Response) -> str | None:
+        try:
+            result = response.json()["result"]
+        except (ValueError, KeyError, TypeError):
+            return None
+
+        # Short videos without sound may be converted to animations
+        media = result.get("video") or result.get("animation") or result.get("document") or {}
+        return media.get("file_id")
+
+    @staticmethod
+    def get_error_description(response: requests.Response) -> str:
+        if response.status_code != 400:
+            return ""
+        try:
+            return str(response.json()["description"]).lower()
+        except (ValueError, KeyError, TypeError):
+            return ""
+
+    @classmethod
+    def is_fetch_error(cls, response: requests.Response) -> bool:
+        """Whether Telegram failed to fetch the media of the request, which the relay may upload instead"""
+        description = cls.get_error_description(response)
+        return any(error in description for error in cls.FETCH_ERRORS)
+
+    @classmethod
+    def is_file_id_error(cls, response: requests.Response) -> bool:
+        return cls.FILE_ID_ERROR in cls.get_error_description(response)
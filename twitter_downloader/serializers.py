@@ -4,6 +4,7 @@ from rest_framework.serializers import Serializer
 
 from backend.utils.telegram import validate_telegram_mini_app_data
 
+from .activity import telegram_user_activity
 from .models import TelegramUser
 
 
@@ -20,18 +21,7 @@ class ValidateTelegramMiniAppDataSerializer(Serializer):
         return value
 
     def create_or_update_telegram_user(self, telegram_user_data: dict):
-        telegram_user, _ = TelegramUser.objects.get_or_create(
-            user_id=telegram_user_data.get("id"),
-            defaults={
-                "first_name": telegram_user_data.get("first_name"),
-                "last_name": telegram_user_data.get("last_name"),
-                "username": telegram_user_data.get("username"),
-            },
-        )
-
-        telegram_user.is_active = True
-        telegram_user.first_name = telegram_user_data.get("first_name")
-        telegram_user.last_name = telegram_user_data.get("last_name") or ""
-        telegram_user.username = telegram_user_data.get("username") or ""
-        telegram_user.request_count += 1
-        telegram_user.save()
+        telegram_user, _ = TelegramUser.get_or_create_cached(telegram_user_data, is_active=True)
+
+        # The request count is buffered, then saved by `flush_telegram_user_activity`
+        telegram_user_activity.record(telegram_user.user_id)
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ExternalLink
+
+
+@receiver(post_save, sender=ExternalLink)
+@receiver(post_delete, sender=ExternalLink)
+def invalidate_external_link_cache(sender, **kwargs):
+    sender.invalidate_cache()
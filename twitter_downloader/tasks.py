@@ -1,15 +1,19 @@
-import json
 import logging
 from datetime import timedelta
 
-import requests
-from celery import shared_task
+from celery import Task, shared_task
+from celery.exceptions import SoftTimeLimitExceeded
 from django.conf import settings
-from django.db import transaction
-from django.db.models import F
+from django.core.cache import cache
+from django.db.models import F, Q
 from django.utils import timezone
 
-from .models import BroadcastLog, BroadcastMessage, DownloadedTweet, ExternalLink, Settings, TelegramUser
+from backend.utils.partitions import delete_in_chunks
+from backend.utils.telegram import TelegramBotAPI
+
+from .broadcasts import BroadcastSender
+from .models import BroadcastMessage, DownloadedTweet, ExternalLink, Settings, TelegramUser, Tweet
+from .relay import VideoRelay
 
 logger = logging.getLogger(__name__)
 
@@ -18,97 +22,182 @@ logger = logging.getLogger(__name__)
 def delete_old_data():
     now = timezone.now()
     one_month_ago = now - timedelta(days=30)
-    DownloadedTweet.objects.order_by("-created_at").filter(created_at__lt=one_month_ago).delete()
+
+    partitions = DownloadedTweet.get_partitions()
+    if partitions.is_partitioned():
+        # Whole months are dropped, so the downloads are kept between 30 days and a month more
+        created = partitions.create_ahead()
+        dropped = partitions.drop_before(one_month_ago)
+        deleted = partitions.delete_from_default(one_month_ago)
+        result = f"Created partitions {created}, dropped partitions {dropped}, deleted {deleted} downloaded tweets"
+    else:
+        deleted = delete_in_chunks(DownloadedTweet.objects.filter(created_at__lt=one_month_ago))
+        result = f"Deleted {deleted} downloaded tweets"
+
+    deleted = Tweet.delete_without_downloads(one_month_ago)
+    return f"{result}, {deleted} tweets"
+
+
+# Routed to the `telegram_webhooks` queue (see CELERY_TASK_ROUTES), served by its own workers.
+# The time limits cover the tweet extraction (30s timeout, 3 attempts) and the replies.
+@shared_task(ignore_result=True, soft_time_limit=150, time_limit=180)
+def process_telegram_update(update: dict):
+    """Process a Telegram update enqueued by `TelegramWebhookView`."""
+    from .handlers import TelegramUpdateHandler
+
+    TelegramUpdateHandler(update).handle()
+
+
+# On the default queue, so the uploads don't hold the `telegram_webhooks` workers. The time limits
+# cover an upload of `VideoRelay.MAX_SIZE`.
+@shared_task(ignore_result=True, soft_time_limit=300, time_limit=330)
+def relay_tweet_video(user_id: str, tweet_data: dict, tweet_id=None):
+    """
+    Upload the video of a tweet Telegram failed to fetch, queued by `TelegramUser.send_video`.
+    The photo of the tweet is sent instead if the video can't be relayed in time.
+    """
+    try:
+        telegram_user = TelegramUser.objects.get(user_id=user_id)
+    except TelegramUser.DoesNotExist:
+        return
+
+    try:
+        if telegram_user.relay_video(tweet_data, tweet_id):
+            return
+    except SoftTimeLimitExceeded:
+        logger.warning("Timed out relaying the video of tweet %s", tweet_id)
+
+    telegram_user.send_photo(tweet_data)
+
+
+@shared_task(ignore_result=True)
+def flush_telegram_user_activity():
+    """
+    Write the request counts buffered by `TelegramUserActivityBuffer` to Postgres.
+    Runs periodically, schedule it from the Periodic Tasks admin (eg. every 30 seconds).
+    """
+    from .activity import telegram_user_activity
+
+    return telegram_user_activity.flush()
+
+
+@shared_task(ignore_result=True)
+def flush_external_link_clicks():
+    """
+    Add the clicks buffered by `ExternalLinkClickBuffer` to the `counter` of the external links.
+    Runs periodically, schedule it from the Periodic Tasks admin (eg. every minute).
+    """
+    from .activity import external_link_clicks
+
+    return external_link_clicks.flush()
 
 
 @shared_task
 def broadcast_message_to_all_users(broadcast_id: str):
     """
     Main task to broadcast message to all active telegram users.
-    Spawns individual tasks for each user with rate limiting.
+    Starts the chain of `send_broadcast_chunk` tasks.
     """
-    try:
-        _ = BroadcastMessage.objects.get(uuid=broadcast_id)
-    except BroadcastMessage.DoesNotExist:
+    if not BroadcastMessage.objects.filter(uuid=broadcast_id).exists():
         return f"Broadcast {broadcast_id} not found"
 
-    # Get all active and non-banned users
-    active_users = TelegramUser.objects.filter(
-        is_active=True,
-        is_banned=False,
-    ).values_list("user_id", flat=True)
+    send_broadcast_chunk.delay(broadcast_id)
+    return f"Started broadcast {broadcast_id}"
+
 
-    # Spawn individual tasks for each user
-    for telegram_user_id in active_users:
-        send_broadcast_to_user.delay(broadcast_id, telegram_user_id)
+def fail_broadcast(broadcast_id: str) -> bool:
+    """Mark a broadcast which is still sending as failed, it's no longer resumed until resumed from the admin"""
+    return bool(
+        BroadcastMessage.objects.filter(uuid=broadcast_id, status=BroadcastMessage.BroadcastStatus.SENDING).update(
+            status=BroadcastMessage.BroadcastStatus.FAILED
+        )
+    )
 
-    return f"Spawned {len(active_users)} broadcast tasks"
+
+class BroadcastChunkTask(Task):
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        # The retries are exhausted, or the error isn't retried
+        broadcast_id = args[0] if args else kwargs["broadcast_id"]
+        if fail_broadcast(broadcast_id):
+            logger.error("Broadcast %s failed: %r", broadcast_id, exc)
 
 
 @shared_task(
+    base=BroadcastChunkTask,
     autoretry_for=(Exception,),
     max_retries=3,
     retry_backoff=True,
-    rate_limit="30/s",  # Telegram API limit: 30 messages per second
+    # Redelivered if the worker dies, the chunk is resumed from the last checkpoint
+    acks_late=True,
+    reject_on_worker_lost=True,
+    # A chunk of 500 messages takes ~20s at the bulk rate, leave room for the rate limiter and 429 waits
+    soft_time_limit=240,
+    time_limit=300,
 )
-def send_broadcast_to_user(broadcast_id: str, telegram_user_id: str):
+def send_broadcast_chunk(broadcast_id: str, after_id: int = 0):
     """
-    Send broadcast message to individual telegram user.
-    This task has retry logic and rate limiting for Telegram API.
+    Send a broadcast to the next chunk of users after its checkpoint, then enqueue the following chunk.
+    Chunks are sent one at a time, so the broadcast stays within the Telegram rate limit whatever
+    the number of workers, and each task stays well within the Celery time limits.
+
+    `after_id` is the checkpoint the task was enqueued for. If the broadcast has moved past it,
+    another chain of chunks is sending it (eg. after a resume) and this one stops.
     """
+    lock_key = f"twitter_downloader_broadcast_lock:{broadcast_id}"
+    if not cache.add(lock_key, "locked", timeout=send_broadcast_chunk.time_limit):
+        return f"Broadcast {broadcast_id} is already being sent"
+
     try:
-        broadcast = BroadcastMessage.objects.get(uuid=broadcast_id)
-        telegram_user = TelegramUser.objects.get(user_id=telegram_user_id)
-    except (BroadcastMessage.DoesNotExist, TelegramUser.DoesNotExist) as e:
-        return f"Error: {str(e)}"
-
-    # Skip if already sent to this user
-    if BroadcastLog.objects.filter(
-        broadcast=broadcast,
-        telegram_user=telegram_user,
-    ).exists():
-        return f"Already sent to user {telegram_user_id}"
-
-    # Try to send message
-    try:
-        success = telegram_user.send_message(broadcast.message)
-
-        if success:
-            # Create success log
-            BroadcastLog.objects.create(
-                broadcast=broadcast,
-                telegram_user=telegram_user,
-                status=BroadcastLog.LogStatus.SUCCESS,
-            )
-
-            # Increment sent count atomically
-            BroadcastMessage.objects.filter(uuid=broadcast_id).update(sent_count=F("sent_count") + 1)
-
-            # Check completion
-            _check_broadcast_completion(broadcast_id)
-
-            return f"Successfully sent to {telegram_user_id}"
-        else:
-            raise Exception("Failed to send message (API returned False)")
-
-    except Exception as e:
-        error_message = str(e)
-
-        # Create failure log
-        BroadcastLog.objects.create(
-            broadcast=broadcast,
-            telegram_user=telegram_user,
-            status=BroadcastLog.LogStatus.FAILED,
-            error_message=error_message,
-        )
+        try:
+            broadcast = BroadcastMessage.objects.get(uuid=broadcast_id)
+        except BroadcastMessage.DoesNotExist:
+            return f"Broadcast {broadcast_id} not found"
+
+        if broadcast.status != BroadcastMessage.BroadcastStatus.SENDING:
+            return f"Broadcast {broadcast_id} is {broadcast.status}"
+
+        if broadcast.last_user_id != after_id:
+            return f"Broadcast {broadcast_id} is already past user ID {after_id}"
 
-        # Increment failed count atomically
-        BroadcastMessage.objects.filter(uuid=broadcast_id).update(failed_count=F("failed_count") + 1)
+        sender = BroadcastSender(broadcast)
+        if not sender.send_chunk():
+            sender.complete()
+            return f"Completed broadcast {broadcast_id}"
+    finally:
+        cache.delete(lock_key)
 
-        # Check completion
-        _check_broadcast_completion(broadcast_id)
+    send_broadcast_chunk.delay(broadcast_id, broadcast.last_user_id)
+    return f"Sent broadcast {broadcast_id} to users up to ID {broadcast.last_user_id}"
 
-        return f"Failed to send to {telegram_user_id}: {error_message}"
+
+@shared_task
+def resume_stalled_broadcasts(stalled_after: int = 600, max_resumes: int = 3):
+    """
+    Resume the broadcasts whose chain of chunks was lost, eg. when the broker lost the next chunk.
+    A broadcast which stalled `max_resumes` times without reaching a new checkpoint is failed instead.
+    Runs periodically, schedule it from the Periodic Tasks admin.
+    """
+    stalled_before = timezone.now() - timedelta(seconds=stalled_after)
+    stalled_broadcasts = BroadcastMessage.objects.filter(
+        Q(checkpointed_at__lt=stalled_before) | Q(checkpointed_at__isnull=True, started_at__lt=stalled_before),
+        status=BroadcastMessage.BroadcastStatus.SENDING,
+    ).values_list("uuid", "last_user_id", "stalled_resumes")
+
+    count = 0
+    for broadcast_id, last_user_id, stalled_resumes in stalled_broadcasts:
+        if stalled_resumes >= max_resumes:
+            if fail_broadcast(broadcast_id):
+                logger.error(
+                    "Broadcast %s stalled %d times after user ID %s", broadcast_id, stalled_resumes, last_user_id
+                )
+            continue
+
+        logger.warning("Resuming stalled broadcast %s after user ID %s", broadcast_id, last_user_id)
+        BroadcastMessage.objects.filter(uuid=broadcast_id).update(stalled_resumes=F("stalled_resumes") + 1)
+        send_broadcast_chunk.delay(str(broadcast_id), last_user_id)
+        count += 1
+
+    return f"Resumed {count} stalled broadcasts"
 
 
 @shared_task(
@@ -123,45 +212,33 @@ def forward_tweet_to_channel(downloaded_tweet_id: str):
         return "Forwarding to channel is disabled"
 
     try:
-        tweet = DownloadedTweet.objects.get(uuid=downloaded_tweet_id)
+        tweet = DownloadedTweet.objects.select_related("tweet").get(uuid=downloaded_tweet_id)
     except DownloadedTweet.DoesNotExist:
         return f"DownloadedTweet {downloaded_tweet_id} not found"
 
-    tweet_data = tweet.tweet_data
+    tweet_data = tweet.tweet.tweet_data
     videos = tweet_data.get("videos", [])
     if not videos:
         return "No videos found in tweet data"
 
-    bot_token = settings.TWITTER_VIDEO_DOWNLOADER_BOT_TOKEN
-    headers = {"Content-Type": "application/json"}
+    telegram_api = TelegramBotAPI(settings.TWITTER_VIDEO_DOWNLOADER_BOT_TOKEN, priority="bulk")
 
     # Build inline keyboard with video quality links
-    external_links = ExternalLink.objects.filter(is_active=True).order_by("-updated_at")
-    external_link_buttons = [
-        [{"text": link.title, "web_app": {"url": link.url}}]
-        if link.is_web_app
-        else [{"text": link.title, "url": link.url}]
-        for link in external_links
-    ]
-
     inline_keyboard = [
         [{"text": f"\U0001f517 {video['quality']}", "url": video["url"]} for video in videos[:3]],
-    ] + external_link_buttons
+    ] + ExternalLink.get_inline_keyboard()
 
     # Try sendPaidMedia first (same as user-facing send_video)
-    url = f"https://api.telegram.org/bot{bot_token}/sendPaidMedia"
-    payload = json.dumps(
-        {
-            "chat_id": config.forward_channel_id,
-            "star_count": 1,
-            "media": [{"type": "video", "media": videos[0]["url"]}],
-            "caption": tweet_data.get("description", ""),
-            "parse_mode": "HTML",
-            "disable_notification": True,
-            "reply_markup": {"inline_keyboard": inline_keyboard},
-        }
-    )
-    response = requests.post(url, headers=headers, data=payload)
+    payload = {
+        "chat_id": config.forward_channel_id,
+        "star_count": 1,
+        "media": [{"type": "video", "media": VideoRelay.get_file_id(tweet.tweet_id) or videos[0]["url"]}],
+        "caption": tweet_data.get("description", ""),
+        "parse_mode": "HTML",
+        "disable_notification": True,
+        "reply_markup": {"inline_keyboard": inline_keyboard},
+    }
+    response = telegram_api.request("sendPaidMedia", payload)
 
     if response.ok:
         return f"Forwarded tweet {downloaded_tweet_id} to channel"
@@ -169,38 +246,18 @@ def forward_tweet_to_channel(downloaded_tweet_id: str):
     # Fallback to sendPhoto with thumbnail + inline keyboard
     thumbnail = tweet_data.get("thumbnail")
     if thumbnail:
-        url = f"https://api.telegram.org/bot{bot_token}/sendPhoto"
-        payload = json.dumps(
-            {
-                "chat_id": config.forward_channel_id,
-                "photo": thumbnail,
-                "parse_mode": "HTML",
-                "disable_notification": True,
-                "has_spoiler": tweet_data.get("is_nsfw", False),
-                "reply_markup": {"inline_keyboard": inline_keyboard},
-            }
-        )
-        response = requests.post(url, headers=headers, data=payload)
+        payload = {
+            "chat_id": config.forward_channel_id,
+            "photo": thumbnail,
+            "parse_mode": "HTML",
+            "disable_notification": True,
+            "has_spoiler": tweet_data.get("is_nsfw", False),
+            "reply_markup": {"inline_keyboard": inline_keyboard},
+        }
+        response = telegram_api.request("sendPhoto", payload)
 
         if response.ok:
             return f"Forwarded tweet {downloaded_tweet_id} to channel (as photo)"
 
     logger.error("Failed to forward tweet %s to channel: %s", downloaded_tweet_id, response.text)
     raise Exception(f"Failed to forward tweet to channel: {response.text}")
-
-
-def _check_broadcast_completion(broadcast_id: str):
-    """
-    Check if broadcast is completed and update status.
-    Uses select_for_update to prevent race conditions.
-    """
-    with transaction.atomic():
-        broadcast = BroadcastMessage.objects.select_for_update().get(uuid=broadcast_id)
-
-        total_processed = broadcast.sent_count + broadcast.failed_count
-
-        # Mark as completed if all messages processed
-        if total_processed >= broadcast.total_users and broadcast.status == BroadcastMessage.BroadcastStatus.SENDING:
-            broadcast.status = BroadcastMessage.BroadcastStatus.COMPLETED
-            broadcast.completed_at = timezone.now()
-            broadcast.save(update_fields=["status", "completed_at"])
@@ -0,0 +1,87 @@
+from unittest.mock import patch
+
+from django.db import DatabaseError
+from django.test import TestCase
+
+from twitter_downloader.activity import ExternalLinkClickBuffer, TelegramUserActivityBuffer
+from twitter_downloader.models import ExternalLink, TelegramUser
+
+
+class TestTelegramUserActivityBuffer(TestCase):
+    def setUp(self):
+        self.buffer = TelegramUserActivityBuffer()
+        self.telegram_user = TelegramUser.objects.create(user_id="939376599", first_name="Arter", request_count=5)
+        self.other_user = TelegramUser.objects.create(user_id="1111111", first_name="Other")
+
+    @patch.object(TelegramUserActivityBuffer, "BATCH_SIZE", 1)
+    def test_update(self):
+        with self.assertNumQueries(4, msg="Should run one UPDATE per batch, in a transaction"):
+            self.buffer.update({"939376599": 3, "1111111": 1})
+
+        self.telegram_user.refresh_from_db()
+        self.assertEqual(self.telegram_user.request_count, 8)
+        self.assertTrue(self.telegram_user.is_active)
+
+        self.other_user.refresh_from_db()
+        self.assertEqual(self.other_user.request_count, 1)
+
+    def test_record_without_redis(self):
+        self.buffer.record(939376599)
+
+        self.telegram_user.refresh_from_db()
+        self.assertEqual(self.telegram_user.request_count, 6, "Should update right away without Redis")
+
+    @patch("backend.utils.cache.get_redis_client")
+    def test_record_with_redis(self, mock_get_redis_client):
+        with self.assertNumQueries(0):
+            self.buffer.record(939376599)
+
+        mock_get_redis_client.return_value.hincrby.assert_called_once_with(self.buffer.KEY, "939376599", 1)
+
+    @patch("backend.utils.cache.get_redis_client")
+    def test_flush(self, mock_get_redis_client):
+        mock_get_redis_client.return_value.eval.return_value = [b"939376599", b"2", b"1111111", b"1"]
+
+        self.assertEqual(self.buffer.flush(), 2)
+
+        self.telegram_user.refresh_from_db()
+        self.assertEqual(self.telegram_user.request_count, 7)
+        self.other_user.refresh_from_db()
+        self.assertEqual(self.other_user.request_count, 1)
+
+    @patch("backend.utils.cache.get_redis_client")
+    def test_failed_flush_is_buffered_again(self, mock_get_redis_client):
+        mock_get_redis_client.return_value.eval.return_value = [b"939376599", b"2"]
+        pipeline = mock_get_redis_client.return_value.pipeline.return_value
+
+        with patch.object(TelegramUserActivityBuffer, "update", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+
+        pipeline.hincrby.assert_called_once_with(self.buffer.KEY, "939376599", 2)
+        pipeline.execute.assert_called_once()
+
+    def test_flush_without_redis(self):
+        self.assertEqual(self.buffer.flush(), 0)
+
+
+class TestExternalLinkClickBuffer(TestCase):
+    def setUp(self):
+        self.buffer = ExternalLinkClickBuffer()
+        self.external_link = ExternalLink.objects.create(title="Animemoe", url="https://animemoe.us", counter=10)
+
+    def test_update(self):
+        with self.assertNumQueries(3, msg="Should run one UPDATE, in a transaction"):
+            self.buffer.update({str(self.external_link.pk): 5, "999999": 1})
+
+        self.external_link.refresh_from_db()
+        self.assertEqual(self.external_link.counter, 15)
+
+    @patch("backend.utils.cache.get_redis_client")
+    def test_flush(self, mock_get_redis_client):
+        mock_get_redis_client.return_value.eval.return_value = [str(self.external_link.pk).encode(), b"2"]
+
+        self.assertEqual(self.buffer.flush(), 1)
+
+        self.external_link.refresh_from_db()
+        self.assertEqual(self.external_link.counter, 12)
@@ -0,0 +1,35 @@
+from unittest.mock import patch
+
+from django.urls import reverse
+
+from twitter_downloader.models import BroadcastMessage
+
+
+class TestBroadcastMessageAdmin:
+    def test_changelist(self, admin_client):
+        BroadcastMessage.objects.create(
+            message="Hello", status=BroadcastMessage.BroadcastStatus.SENDING, total_users=100, sent_count=10
+        )
+
+        url = reverse("admin:twitter_downloader_broadcastmessage_changelist")
+        response = admin_client.get(url)
+        assert response.status_code == 200
+
+    def test_pause_and_resume_actions(self, admin_client, django_capture_on_commit_callbacks):
+        broadcast = BroadcastMessage.objects.create(message="Hello", status=BroadcastMessage.BroadcastStatus.SENDING)
+        url = reverse("admin:twitter_downloader_broadcastmessage_changelist")
+
+        response = admin_client.post(url, data={"action": "pause_broadcast", "_selected_action": [broadcast.pk]})
+        assert response.status_code == 302
+        broadcast.refresh_from_db()
+        assert broadcast.status == BroadcastMessage.BroadcastStatus.PAUSED
+
+        with (
+            patch("twitter_downloader.tasks.send_broadcast_chunk.delay") as mock_delay,
+            django_capture_on_commit_callbacks(execute=True),
+        ):
+            response = admin_client.post(url, data={"action": "resume_broadcast", "_selected_action": [broadcast.pk]})
+        assert response.status_code == 302
+        broadcast.refresh_from_db()
+        assert broadcast.status == BroadcastMessage.BroadcastStatus.SENDING
+        mock_delay.assert_called_once_with(str(broadcast.pk), 0)
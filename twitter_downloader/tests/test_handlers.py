@@ -0,0 +1,112 @@
+import json
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from twitter_downloader.handlers import TelegramUpdateHandler
+from twitter_downloader.models import DownloadedTweet, Settings, TelegramUser, Tweet
+
+
+def _text_message_update(text: str) -> dict:
+    return {
+        "update_id": 10000,
+        "message": {
+            "message_id": 1365,
+            "date": 1441645532,
+            "chat": {"id": 939376599, "first_name": "Arter", "last_name": "Tendean", "username": "artertendean"},
+            "from": {"id": 939376599, "first_name": "Arter", "last_name": "Tendean", "username": "artertendean"},
+            "text": text,
+        },
+    }
+
+
+@patch("twitter_downloader.views.process_telegram_update.delay")
+class TestTelegramWebhookView(TestCase):
+    def setUp(self):
+        self.url = reverse("twitter_downloader:telegram-webhook")
+
+    def test_update_is_enqueued(self, mock_delay):
+        response = self.client.post(self.url, data=_text_message_update("/start"), content_type="application/json")
+        self.assertEqual(response.status_code, 200, "Should return 200 OK")
+
+        mock_delay.assert_called_once()
+        update = mock_delay.call_args.args[0]
+        self.assertEqual(update["text_message"], "/start")
+        self.assertEqual(update["user"]["id"], 939376599)
+        json.dumps(update)  # Must be serializable by the Celery json serializer
+
+        self.assertEqual(TelegramUser.objects.count(), 0, "Should leave the processing to the worker")
+
+    def test_invalid_update_is_ignored(self, mock_delay):
+        response = self.client.post(self.url, data={"update_id": 1}, content_type="application/json")
+        self.assertEqual(response.status_code, 200, "Should return 200 OK to avoid redeliveries")
+        mock_delay.assert_not_called()
+
+    def test_invalid_secret_token(self, mock_delay):
+        Settings.objects.create(secret_token="secret")
+
+        response = self.client.post(
+            self.url,
+            data=_text_message_update("/start"),
+            content_type="application/json",
+            HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN="wrong",
+        )
+        self.assertEqual(response.status_code, 401, "Should return 401 Unauthorized")
+        mock_delay.assert_not_called()
+
+
+@patch("twitter_downloader.handlers.forward_tweet_to_channel.delay")
+@patch("twitter_downloader.models.TelegramUser.send_chat_action", return_value=True)
+@patch("twitter_downloader.models.TelegramUser.send_video", return_value=True)
+@patch("twitter_downloader.models.TelegramUser.send_message", return_value=True)
+class TestTelegramUpdateHandler(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _update(self, text: str) -> dict:
+        message = _text_message_update(text)["message"]
+        return {"user": message["from"], "text_message": message["text"]}
+
+    def test_start_command_updates_user(self, mock_send_message, mock_send_video, mock_chat_action, mock_forward):
+        TelegramUpdateHandler(self._update("/start")).handle()
+        TelegramUpdateHandler(self._update("/start")).handle()
+
+        telegram_user = TelegramUser.objects.get(user_id=939376599)
+        self.assertEqual(telegram_user.request_count, 2)
+        self.assertEqual(mock_send_message.call_count, 4)
+
+    @patch("twitter_downloader.utils.TwitterDownloaderAPIV4.get_tweet_data")
+    def test_tweet_link(self, mock_get_tweet_data, mock_send_message, mock_send_video, mock_chat_action, mock_forward):
+        mock_get_tweet_data.return_value = {"success": True, "videos": [{"url": "https://video.twimg.com/1.mp4"}]}
+
+        TelegramUpdateHandler(self._update("https://x.com/user/status/1829443959665443131")).handle()
+
+        self.assertEqual(DownloadedTweet.objects.count(), 1, "Should save the downloaded tweet")
+        self.assertEqual(Tweet.objects.get().id, 1829443959665443131)
+        mock_send_video.assert_called_once()
+        mock_forward.assert_called_once()
+
+        TelegramUpdateHandler(self._update("https://twitter.com/user/status/1829443959665443131")).handle()
+        self.assertEqual(DownloadedTweet.objects.count(), 2)
+        self.assertEqual(Tweet.objects.count(), 1, "Should save the tweet data once")
+
+    @patch("twitter_downloader.models.TelegramUser.send_banned_message", return_value=True)
+    def test_banned_user(self, mock_banned, mock_send_message, mock_send_video, mock_chat_action, mock_forward):
+        TelegramUser.objects.create(user_id=939376599, first_name="Arter", is_banned=True)
+
+        TelegramUpdateHandler(self._update("/start")).handle()
+
+        mock_banned.assert_called_once()
+        mock_send_message.assert_not_called()
+
+    @patch("twitter_downloader.models.TelegramUser.send_maintenance_message", return_value=True)
+    def test_maintenance(self, mock_maintenance, mock_send_message, mock_send_video, mock_chat_action, mock_forward):
+        Settings.objects.create(is_maintenance=True)
+
+        TelegramUpdateHandler(self._update("https://x.com/user/status/1829443959665443131")).handle()
+
+        mock_maintenance.assert_called_once()
+        mock_chat_action.assert_not_called()
+        self.assertEqual(TelegramUser.objects.get(user_id=939376599).request_count, 1)
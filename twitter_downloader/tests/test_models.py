@@ -1,9 +1,12 @@
 import time
+from datetime import timedelta
 from unittest.mock import Mock, patch
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
 
-from twitter_downloader.models import DownloadedTweet, ExternalLink, Settings, TelegramUser
+from twitter_downloader.models import DownloadedTweet, ExternalLink, Settings, TelegramUser, Tweet
 
 
 def _mock_ok_response(*args, **kwargs):
@@ -14,37 +17,36 @@ def _mock_ok_response(*args, **kwargs):
     return mock_response
 
 
-@patch("models.base.requests.request", side_effect=_mock_ok_response)
-@patch("twitter_downloader.models.requests.request", side_effect=_mock_ok_response)
+@patch("backend.utils.telegram.requests.Session.post", side_effect=_mock_ok_response)
 class TestTelegramUserModel(TestCase):
     def setUp(self):
         self.telegram_user = TelegramUser.objects.create(
             user_id="939376599", first_name="Arter", last_name="Tendean", username="artertendean"
         )
 
-    def test_send_chat_action(self, mock_tw_request, mock_base_request):
+    def test_send_chat_action(self, mock_request):
         result = self.telegram_user.send_chat_action("typing")
         self.assertEqual(result, True, "Test send chat action")
 
-    def test_send_message(self, mock_tw_request, mock_base_request):
+    def test_send_message(self, mock_request):
         result = self.telegram_user.send_message("Test Telegram user model")
         self.assertEqual(result, True)
 
-    def test_send_document(self, mock_tw_request, mock_base_request):
+    def test_send_document(self, mock_request):
         result = self.telegram_user.send_document(
             "https://avatars.githubusercontent.com/u/9919", caption="Test document caption"
         )
         self.assertEqual(result, True)
 
-    def test_send_maintenance_message(self, mock_tw_request, mock_base_request):
+    def test_send_maintenance_message(self, mock_request):
         result = self.telegram_user.send_maintenance_message()
         self.assertEqual(result, True, "Test maintenance message")
 
-    def test_send_banned_message(self, mock_tw_request, mock_base_request):
+    def test_send_banned_message(self, mock_request):
         result = self.telegram_user.send_banned_message()
         self.assertEqual(result, True, "Test banned message")
 
-    def test_send_photo(self, mock_tw_request, mock_base_request):
+    def test_send_photo(self, mock_request):
         result = self.telegram_user.send_photo(
             {
                 "thumbnail": "https://avatars.githubusercontent.com/u/9919",
@@ -53,7 +55,7 @@ class TestTelegramUserModel(TestCase):
         )
         self.assertEqual(result, True, "Test send photo")
 
-    def test_send_video(self, mock_tw_request, mock_base_request):
+    def test_send_video(self, mock_request):
         result = self.telegram_user.send_video(
             {
                 "thumbnail": "https://avatars.githubusercontent.com/u/9919",
@@ -64,11 +66,11 @@ class TestTelegramUserModel(TestCase):
 
         self.assertEqual(result, True, "Test send video")
 
-    def test_send_download_button_with_safelink(self, mock_tw_request, mock_base_request):
+    def test_send_download_button_with_safelink(self, mock_request):
         result = self.telegram_user.send_download_button_with_safelink("Arter Tendean", "https://animemoe.us")
         self.assertEqual(result, True, "Sould return 200 OK (True)")
 
-    def test_send_big_video(self, mock_tw_request, mock_base_request):
+    def test_send_big_video(self, mock_request):
         result = self.telegram_user.send_video(
             {
                 "thumbnail": "https://avatars.githubusercontent.com/u/9919",
@@ -85,7 +87,7 @@ class TestTelegramUserModel(TestCase):
 
         self.assertEqual(result, True, "Test send video with big file size")
 
-    def test_image_with_inline_url(self, mock_tw_request, mock_base_request):
+    def test_image_with_inline_url(self, mock_request):
         result = self.telegram_user.send_image_with_inline_keyboard(
             image_url="https://avatars.githubusercontent.com/u/9919",
             inline_text="Arter Tendean",
@@ -94,16 +96,72 @@ class TestTelegramUserModel(TestCase):
         self.assertEqual(result, True, "Test send image with inline url")
 
 
-@patch("models.base.requests.request", side_effect=_mock_ok_response)
-@patch("twitter_downloader.models.requests.request", side_effect=_mock_ok_response)
+class TestTelegramUserCache(TestCase):
+    user_data = {"id": 939376599, "first_name": "Arter", "last_name": "Tendean", "username": "artertendean"}
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_get_or_create_cached(self):
+        telegram_user, created = TelegramUser.get_or_create_cached(self.user_data, is_active=True)
+        self.assertTrue(created)
+        self.assertTrue(telegram_user.is_active)
+
+        with self.assertNumQueries(0, msg="Should serve known users from the cache"):
+            cached_user, created = TelegramUser.get_or_create_cached(self.user_data)
+
+        self.assertFalse(created)
+        self.assertEqual(cached_user.pk, telegram_user.pk)
+        self.assertEqual(cached_user.username, "artertendean")
+        self.assertFalse(cached_user.is_banned)
+
+    def test_profile_is_only_saved_when_changed(self):
+        TelegramUser.get_or_create_cached(self.user_data)
+
+        with self.assertNumQueries(1):
+            telegram_user, _ = TelegramUser.get_or_create_cached({**self.user_data, "username": "arter"})
+        self.assertEqual(telegram_user.username, "arter")
+        self.assertEqual(TelegramUser.objects.get(user_id="939376599").username, "arter")
+
+        with self.assertNumQueries(0):
+            TelegramUser.get_or_create_cached({**self.user_data, "username": "arter"})
+
+    def test_saving_the_user_invalidates_the_cache(self):
+        TelegramUser.get_or_create_cached(self.user_data)
+
+        telegram_user = TelegramUser.objects.get(user_id="939376599")
+        telegram_user.is_banned = True
+        with self.captureOnCommitCallbacks(execute=True):
+            telegram_user.save()
+
+        cached_user, _ = TelegramUser.get_or_create_cached(self.user_data)
+        self.assertTrue(cached_user.is_banned)
+
+    def test_saving_a_cached_user_keeps_the_other_fields(self):
+        TelegramUser.get_or_create_cached(self.user_data)
+        TelegramUser.objects.filter(user_id="939376599").update(request_count=10)
+
+        cached_user, _ = TelegramUser.get_or_create_cached(self.user_data)
+        cached_user.first_name = "Art"
+        cached_user.save()
+
+        telegram_user = TelegramUser.objects.get(user_id="939376599")
+        self.assertEqual(telegram_user.first_name, "Art")
+        self.assertEqual(telegram_user.request_count, 10, "Should only save the cached fields")
+
+
+@patch("backend.utils.telegram.requests.Session.post", side_effect=_mock_ok_response)
 class TestDownloadedTweet(TestCase):
     def setUp(self):
         self.telegram_user = TelegramUser.objects.create(
             user_id="939376599", first_name="Arter", last_name="Tendean", username="artertendean"
         )
-        self.downloaded_tweet = DownloadedTweet.objects.create(
-            telegram_user=self.telegram_user,
-            tweet_url="http://twitter.com/",
+        self.tweet = Tweet.objects.create(
+            id=1832089399921619103,
+            url="https://x.com/user/status/1832089399921619103",
             tweet_data={
                 "id": "1832089399921619103",
                 "videos": [
@@ -130,22 +188,89 @@ class TestDownloadedTweet(TestCase):
                 "description": "I don't understand how some people still hate cats😭😭 https://t.co/qTOc612wOX",
             },
         )
+        self.downloaded_tweet = DownloadedTweet.objects.create(telegram_user=self.telegram_user, tweet=self.tweet)
 
-    def test_sent_to_telegram_user(self, mock_tw_request, mock_base_request):
+    def test_sent_to_telegram_user(self, mock_request):
         result = self.downloaded_tweet.send_to_telegram_user()
         self.assertEqual(result, True, "Should be able to send message")
 
+    def test_tweet_data_is_saved_once(self, mock_request):
+        tweet = Tweet.save_tweet_data("1832089399921619103", self.tweet.url, {"videos": []})
+        DownloadedTweet.objects.create(telegram_user=self.telegram_user, tweet=tweet)
+
+        self.assertEqual(Tweet.objects.count(), 1)
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.tweet_data, tweet.tweet_data, "Should keep the data of the latest download")
+        self.assertEqual(self.tweet.tweet_data, {"videos": []})
+
+    def test_delete_tweets_without_downloads(self, mock_request):
+        cutoff = timezone.now() + timedelta(days=1)
+        Tweet.save_tweet_data("1", "https://x.com/user/status/1", {})
+
+        with self.assertNumQueries(1, msg="Should delete the tweets with a single DELETE"):
+            self.assertEqual(Tweet.delete_without_downloads(cutoff), 1)
+        self.assertEqual(list(Tweet.objects.values_list("id", flat=True)), [self.tweet.id])
+
+    def test_most_downloaded(self, mock_request):
+        other_tweet = Tweet.save_tweet_data("1", "https://x.com/user/status/1", {})
+        for _ in range(2):
+            DownloadedTweet.objects.create(telegram_user=self.telegram_user, tweet=other_tweet)
+
+        tweets = list(Tweet.get_most_downloaded())
+        self.assertEqual([(tweet.id, tweet.download_count) for tweet in tweets], [(1, 2), (self.tweet.id, 1)])
+
+        DownloadedTweet.objects.filter(tweet=other_tweet).update(created_at=timezone.now() - timedelta(days=2))
+        tweets = list(Tweet.get_most_downloaded(since=timezone.now() - timedelta(days=1)))
+        self.assertEqual([(tweet.id, tweet.download_count) for tweet in tweets], [(self.tweet.id, 1)])
+
 
 class TestExternalLink(TestCase):
     def setUp(self):
+        cache.delete(ExternalLink.get_keyboard_cache_key())
         self.external_link_1 = ExternalLink.objects.create(title="Test External Link", url="https://api.animemoe.us")
 
     def test_get_external_link(self):
         queryset = ExternalLink.objects.all()
         self.assertEqual(queryset.count(), 1, "Should be able to get the external link data")
 
+    @override_settings(TWITTER_DOWNLOADER_BASE_URL="https://animemoe.us")
+    def test_inline_keyboard_is_cached(self):
+        web_app = ExternalLink.objects.create(title="Web App", url="https://animemoe.us/app", is_web_app=True)
+        ExternalLink.objects.create(title="Inactive", url="https://animemoe.us/inactive", is_active=False)
+
+        keyboard = ExternalLink.get_inline_keyboard()
+        self.assertEqual(len(keyboard), 2, "Should only include the active links")
+        self.assertEqual(keyboard[0], [{"text": "Web App", "web_app": {"url": web_app.url}}])
+        self.assertEqual(
+            keyboard[1][0]["url"],
+            f"https://animemoe.us/twitter-downloader/external-links/{self.external_link_1.pk}/",
+            "Should count the clicks through the redirect view",
+        )
+
+        with self.assertNumQueries(0):
+            self.assertEqual(ExternalLink.get_inline_keyboard(), keyboard)
+
+        with self.settings(TWITTER_DOWNLOADER_BASE_URL="https://staging.animemoe.us/"):
+            self.assertEqual(
+                ExternalLink.get_inline_keyboard()[1][0]["url"],
+                f"https://staging.animemoe.us/twitter-downloader/external-links/{self.external_link_1.pk}/",
+                "Should not serve the keyboard cached for another base URL",
+            )
+
+    def test_cache_is_invalidated_on_save(self):
+        ExternalLink.get_inline_keyboard()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.external_link_1.title = "Renamed"
+            self.external_link_1.save()
+        self.assertEqual(ExternalLink.get_inline_keyboard()[0][0]["text"], "Renamed")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.external_link_1.delete()
+        self.assertEqual(ExternalLink.get_inline_keyboard(), [])
+
 
-@patch("twitter_downloader.models.requests.request", side_effect=_mock_ok_response)
+@patch("backend.utils.telegram.requests.Session.post", side_effect=_mock_ok_response)
 class TestSettings(TestCase):
     def test_settings(self, mock_request):
         settings = Settings.get_solo()
@@ -155,3 +280,49 @@ class TestSettings(TestCase):
         time.sleep(1)
 
         self.assertEqual(settings.set_webhook(), True, "Should set the webhook url successfully")
+
+
+@patch.object(Settings, "is_cache_shared", staticmethod(lambda: True))
+class TestCachedSettings(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_get_solo_is_kept_in_memory(self):
+        Settings.get_solo()
+
+        with self.assertNumQueries(0):
+            settings = Settings.get_solo()
+        self.assertFalse(settings.is_maintenance)
+
+    def test_save_invalidates_the_settings(self):
+        settings = Settings.get_solo()
+        settings.is_maintenance = True
+        settings.save()
+
+        self.assertTrue(Settings.get_solo().is_maintenance)
+
+    def test_get_solo_returns_a_copy(self):
+        settings = Settings.get_solo()
+        settings.is_maintenance = True
+
+        self.assertFalse(Settings.get_solo().is_maintenance, "Should not change the settings kept in memory")
+
+    @patch.object(Settings, "SOLO_VERSION_CHECK_INTERVAL", 0)
+    def test_settings_saved_by_another_process_are_reloaded(self):
+        Settings.get_solo()
+
+        with self.assertNumQueries(0, msg="Should only check the version while it doesn't change"):
+            Settings.get_solo()
+
+        Settings.objects.filter(pk=1).update(is_maintenance=True)
+        cache.set(Settings.get_solo_version_key(), "changed by another process", None)
+
+        self.assertTrue(Settings.get_solo().is_maintenance)
+
+    def test_get_solo_is_read_from_the_database_without_a_shared_cache(self):
+        Settings.get_solo()
+
+        with patch.object(Settings, "is_cache_shared", staticmethod(lambda: False)):
+            Settings.objects.filter(pk=1).update(is_maintenance=True)
+            with self.assertNumQueries(1):
+                self.assertTrue(Settings.get_solo().is_maintenance)
@@ -0,0 +1,194 @@
+import threading
+import time
+from unittest.mock import Mock, patch
+
+from django.test import SimpleTestCase
+
+from twitter_downloader.providers import (
+    ProviderError,
+    ProviderHealth,
+    TweetProvider,
+    TweetProviderRouter,
+    TwitterDownloaderAPIV2Provider,
+    TwitterDownloaderAPIV3Provider,
+)
+
+TWEET_URL = "https://x.com/user/status/1829443959665443131"
+
+
+class FakeProvider(TweetProvider):
+    def __init__(
+        self, name: str, delay: float = 0, error: bool = False, success: bool = True, upstream: str | None = None
+    ):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.success = success
+        self.upstream_name = upstream or name
+        self.calls = 0
+
+    @property
+    def upstream(self) -> str:
+        return self.upstream_name
+
+    def fetch(self, tweet_url: str) -> dict:
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise ProviderError(f"{self.name} is down")
+        if not self.success:
+            return {"success": False, "tweet": tweet_url, "error": "No video links found."}
+        return {"success": True, "tweet": tweet_url, "videos": [{"url": f"https://{self.name}/1.mp4"}]}
+
+
+class TestTweetProviderRouter(SimpleTestCase):
+    def _get_tweet_data(self, router: TweetProviderRouter, providers: list[TweetProvider]) -> dict:
+        with patch.object(router, "get_providers", return_value=providers):
+            return router.get_tweet_data(TWEET_URL)
+
+    def test_primary_provider(self):
+        primary, secondary = FakeProvider("primary"), FakeProvider("secondary")
+
+        tweet_data = self._get_tweet_data(TweetProviderRouter(), [primary, secondary])
+
+        self.assertEqual(tweet_data["provider"], "primary")
+        self.assertEqual(secondary.calls, 0)
+
+    def test_failover_to_next_provider(self):
+        primary, secondary = FakeProvider("primary", error=True), FakeProvider("secondary")
+
+        tweet_data = self._get_tweet_data(TweetProviderRouter(), [primary, secondary])
+
+        self.assertEqual(tweet_data["provider"], "secondary")
+
+    def test_all_providers_failing(self):
+        providers = [FakeProvider("primary", error=True), FakeProvider("secondary", error=True)]
+
+        tweet_data = self._get_tweet_data(TweetProviderRouter(), providers)
+
+        self.assertFalse(tweet_data["success"])
+        self.assertTrue(tweet_data["retryable"])
+
+    def test_hedged_request_when_primary_is_slow(self):
+        router = TweetProviderRouter()
+        primary, secondary = FakeProvider("primary", delay=1), FakeProvider("secondary")
+        router.get_health(primary).default_hedge_delay = 0.05
+
+        start = time.monotonic()
+        tweet_data = self._get_tweet_data(router, [primary, secondary])
+
+        self.assertEqual(tweet_data["provider"], "secondary")
+        self.assertLess(time.monotonic() - start, 0.5, "Should not wait for the slow provider")
+
+    def test_no_hedged_request_to_the_same_upstream(self):
+        router = TweetProviderRouter()
+        primary = FakeProvider("primary", delay=0.2, upstream="api")
+        secondary = FakeProvider("secondary", upstream="api")
+        router.get_health(primary).default_hedge_delay = 0.05
+
+        tweet_data = self._get_tweet_data(router, [primary, secondary])
+
+        self.assertEqual(tweet_data["provider"], "primary")
+        self.assertEqual(secondary.calls, 0, "Should not hedge to a provider of the same upstream")
+
+    def test_unsuccessful_hedged_answer_does_not_win(self):
+        router = TweetProviderRouter()
+        primary, secondary = FakeProvider("primary", delay=0.2), FakeProvider("secondary", success=False)
+        router.get_health(primary).default_hedge_delay = 0.05
+
+        tweet_data = self._get_tweet_data(router, [primary, secondary])
+
+        self.assertTrue(tweet_data["success"])
+        self.assertEqual(tweet_data["provider"], "primary")
+
+    def test_unsuccessful_answer_is_returned_when_nothing_else_succeeds(self):
+        providers = [FakeProvider("primary", success=False), FakeProvider("secondary")]
+
+        tweet_data = self._get_tweet_data(TweetProviderRouter(), providers)
+
+        self.assertFalse(tweet_data["success"])
+        self.assertNotIn("retryable", tweet_data)
+        self.assertEqual(providers[1].calls, 0, "A tweet without a video isn't a provider failure")
+
+    def test_open_circuit_breaker_skips_provider(self):
+        router = TweetProviderRouter()
+        primary, secondary = FakeProvider("primary", error=True), FakeProvider("secondary")
+
+        for _ in range(5):
+            self._get_tweet_data(router, [primary, secondary])
+        self.assertEqual(primary.calls, 5)
+
+        tweet_data = self._get_tweet_data(router, [primary, secondary])
+        self.assertEqual(tweet_data["provider"], "secondary")
+        self.assertEqual(primary.calls, 5, "Should skip the provider while its breaker is open")
+
+
+class TestProviderHealth(SimpleTestCase):
+    def test_half_open_after_cooldown(self):
+        health = ProviderHealth(max_consecutive_failures=2, cooldown=0.05)
+        health.record_failure()
+        health.record_failure()
+        self.assertFalse(health.allow_request())
+
+        time.sleep(0.06)
+        self.assertTrue(health.allow_request(), "Should let a trial request through")
+        self.assertFalse(health.allow_request(), "Should let a single trial request through")
+
+        health.record_success(0.1)
+        self.assertTrue(health.allow_request())
+
+    def test_p95(self):
+        health = ProviderHealth(min_requests=10, default_hedge_delay=5)
+        self.assertEqual(health.p95, 5, "Should use the default until there are enough samples")
+
+        for latency in range(1, 21):
+            health.record_success(latency / 10)
+        self.assertEqual(health.p95, 2.0)
+
+    def test_thread_safety(self):
+        health = ProviderHealth(window=1000)
+        threads = [threading.Thread(target=lambda: [health.record_success(0.1) for _ in range(100)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(health.outcomes), 400)
+
+
+class TestTwitterDownloaderAPIV3Provider(SimpleTestCase):
+    @patch("twitter_downloader.providers.TwitterDownloaderAPIV3.get_tweet_data")
+    def test_normalize(self, mock_get_tweet_data):
+        mock_get_tweet_data.retry_with.return_value.return_value = {
+            "tweet_id": "1829443959665443131",
+            "text": "Tweet text",
+            "is_nsfw": True,
+            "photos": [],
+            "videos": [
+                {
+                    "thumbnail": "https://pbs.twimg.com/thumb.jpg",
+                    "variants": [
+                        {"url": "https://video.twimg.com/320x568/1.mp4", "bitrate": 632000, "size": "320x568"},
+                        {"url": "https://video.twimg.com/720x1280/1.mp4", "bitrate": 2176000, "size": "720x1280"},
+                    ],
+                }
+            ],
+        }
+
+        tweet_data = TwitterDownloaderAPIV3Provider().fetch(TWEET_URL)
+
+        self.assertTrue(tweet_data["success"])
+        self.assertEqual(tweet_data["description"], "Tweet text")
+        self.assertEqual(tweet_data["thumbnail"], "https://pbs.twimg.com/thumb.jpg")
+        self.assertTrue(tweet_data["is_nsfw"])
+        self.assertEqual([video["quality"] for video in tweet_data["videos"]], ["HD", "SD"])
+        self.assertEqual(tweet_data["videos"][0]["width"], 720)
+        self.assertEqual(tweet_data["videos"][0]["height"], 1280)
+
+
+class TestTwitterDownloaderAPIV2Provider(SimpleTestCase):
+    @patch("twitter_downloader.utils.requests.get", return_value=Mock(status_code=429))
+    def test_rate_limited_request_is_not_retried(self, mock_get):
+        with self.assertRaises(ProviderError):
+            TwitterDownloaderAPIV2Provider().fetch(TWEET_URL)
+
+        mock_get.assert_called_once()
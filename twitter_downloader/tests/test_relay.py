@@ -0,0 +1,137 @@
+from unittest.mock import MagicMock, Mock, patch
+
+from celery.exceptions import SoftTimeLimitExceeded
+from django.core.cache import cache
+from django.test import TestCase
+
+from backend.utils.telegram import MultipartStream
+from twitter_downloader.models import TelegramUser
+from twitter_downloader.relay import VideoRelay
+from twitter_downloader.tasks import relay_tweet_video
+
+TWEET_ID = 1829443959665443131
+TWEET_DATA = {
+    "description": "Tweet text",
+    "videos": [
+        {"url": "https://video.twimg.com/720x1280/1.mp4", "quality": "HD"},
+        {"url": "https://video.twimg.com/320x568/1.mp4", "quality": "SD"},
+    ],
+}
+
+
+def _mock_source(url, **kwargs):
+    size = 60 * 1024 * 1024 if "720x1280" in url else 10
+    source = MagicMock(ok=True, status_code=200, headers={"Content-Length": str(size), "Content-Type": "video/mp4"})
+    source.__enter__.return_value = source
+    source.iter_content.return_value = iter([b"x" * 4, b"x" * 6])
+    return source
+
+
+def _mock_error(description, status_code=400):
+    return Mock(ok=False, status_code=status_code, json=Mock(return_value={"ok": False, "description": description}))
+
+
+@patch("twitter_downloader.relay.requests.get", side_effect=_mock_source)
+@patch("twitter_downloader.models.TelegramUser.send_chat_action", return_value=True)
+@patch("backend.utils.telegram.requests.Session.post")
+class TestVideoRelay(TestCase):
+    def setUp(self):
+        cache.delete(VideoRelay.FILE_ID_CACHE_KEY.format(tweet_id=TWEET_ID))
+        self.telegram_user = TelegramUser.objects.create(user_id="939376599", first_name="Arter")
+        self.uploads = []
+
+    def _mock_telegram(self, url, json=None, data=None, **kwargs):
+        method = url.rsplit("/", 1)[1]
+        if method == "sendPaidMedia":
+            if json["media"][0]["media"].startswith("https://"):
+                return _mock_error("Bad Request: failed to get HTTP URL content")
+            return Mock(ok=True, status_code=200)
+
+        if isinstance(data, MultipartStream):
+            self.uploads.append(b"".join(data))
+            return Mock(ok=True, status_code=200, json=Mock(return_value={"result": {"video": {"file_id": "file-1"}}}))
+        if json.get("video") == "file-1":
+            return Mock(ok=True, status_code=200)
+        return _mock_error("Bad Request: wrong file identifier/HTTP URL specified")
+
+    @patch("twitter_downloader.tasks.relay_tweet_video.delay")
+    def test_video_is_relayed_when_telegram_cant_fetch_it(self, mock_delay, mock_post, mock_chat_action, mock_get):
+        mock_post.side_effect = self._mock_telegram
+
+        self.assertTrue(self.telegram_user.send_video(TWEET_DATA, tweet_id=TWEET_ID))
+        mock_delay.assert_called_once_with(self.telegram_user.user_id, TWEET_DATA, TWEET_ID)
+        mock_get.assert_not_called()
+
+        relay_tweet_video(*mock_delay.call_args.args)
+
+        self.assertEqual(
+            [call.args[0] for call in mock_get.call_args_list],
+            ["https://video.twimg.com/720x1280/1.mp4", "https://video.twimg.com/320x568/1.mp4"],
+            "Should skip the variants over the upload limit",
+        )
+        self.assertEqual(len(self.uploads), 1)
+        self.assertIn(b"xxxxxxxxxx", self.uploads[0])
+        self.assertEqual(VideoRelay.get_file_id(TWEET_ID), "file-1", "Should cache the file_id of the tweet")
+
+    def test_cached_file_id_is_reused(self, mock_post, mock_chat_action, mock_get):
+        mock_post.side_effect = self._mock_telegram
+        VideoRelay.set_file_id(TWEET_ID, "file-1")
+
+        self.assertTrue(self.telegram_user.send_video(TWEET_DATA, tweet_id=TWEET_ID))
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(mock_post.call_args.kwargs["json"]["media"][0]["media"], "file-1")
+        mock_get.assert_not_called()
+
+    def test_expired_file_id_is_uploaded_again(self, mock_post, mock_chat_action, mock_get):
+        mock_post.side_effect = self._mock_telegram
+        VideoRelay.set_file_id(TWEET_ID, "expired")
+
+        response = VideoRelay(self.telegram_user.telegram_api).send_video(
+            {"chat_id": 1}, TWEET_DATA["videos"], TWEET_ID
+        )
+
+        self.assertTrue(response.ok)
+        self.assertEqual(len(self.uploads), 1)
+        self.assertEqual(VideoRelay.get_file_id(TWEET_ID), "file-1")
+
+    def test_file_id_is_kept_on_other_errors(self, mock_post, mock_chat_action, mock_get):
+        mock_post.return_value = _mock_error("Forbidden: bot was blocked by the user", status_code=403)
+        VideoRelay.set_file_id(TWEET_ID, "file-1")
+
+        response = VideoRelay(self.telegram_user.telegram_api).send_video(
+            {"chat_id": 1}, TWEET_DATA["videos"], TWEET_ID
+        )
+
+        self.assertFalse(response.ok)
+        mock_get.assert_not_called()
+        self.assertEqual(VideoRelay.get_file_id(TWEET_ID), "file-1")
+
+    @patch("twitter_downloader.tasks.relay_tweet_video.delay")
+    @patch("twitter_downloader.models.TelegramUser.send_photo", return_value=True)
+    def test_photo_fallback(self, mock_send_photo, mock_delay, mock_post, mock_chat_action, mock_get):
+        mock_post.return_value = _mock_error("Bad Request: message caption is too long")
+
+        self.assertTrue(self.telegram_user.send_video(TWEET_DATA, tweet_id=TWEET_ID))
+
+        mock_send_photo.assert_called_once_with(TWEET_DATA)
+        mock_delay.assert_not_called()
+
+    @patch("twitter_downloader.models.TelegramUser.send_photo", return_value=True)
+    def test_photo_fallback_when_the_relay_fails(self, mock_send_photo, mock_post, mock_chat_action, mock_get):
+        mock_post.return_value = _mock_error("Bad Request: failed to get HTTP URL content")
+        mock_get.side_effect = None
+        mock_get.return_value.__enter__.return_value = Mock(ok=False, status_code=404, headers={})
+
+        relay_tweet_video(self.telegram_user.user_id, TWEET_DATA, TWEET_ID)
+
+        mock_send_photo.assert_called_once_with(TWEET_DATA)
+        self.assertIsNone(VideoRelay.get_file_id(TWEET_ID))
+
+    @patch("twitter_downloader.models.TelegramUser.send_photo", return_value=True)
+    def test_photo_fallback_when_the_relay_times_out(self, mock_send_photo, mock_post, mock_chat_action, mock_get):
+        mock_get.side_effect = SoftTimeLimitExceeded()
+
+        relay_tweet_video(self.telegram_user.user_id, TWEET_DATA, TWEET_ID)
+
+        mock_send_photo.assert_called_once_with(TWEET_DATA)
@@ -0,0 +1,303 @@
+import itertools
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest.mock import Mock, patch
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from backend.utils.partitions import add_months, delete_in_chunks
+from twitter_downloader.broadcasts import BroadcastSender
+from twitter_downloader.models import BroadcastLog, BroadcastMessage, DownloadedTweet, TelegramUser, Tweet
+from twitter_downloader.tasks import (
+    broadcast_message_to_all_users,
+    delete_old_data,
+    resume_stalled_broadcasts,
+    send_broadcast_chunk,
+)
+
+
+def _mock_response(*args, json=None, **kwargs):
+    if json["chat_id"] == "1003":
+        return Mock(ok=False, status_code=403, text='{"description": "Forbidden: bot was blocked by the user"}')
+    return Mock(ok=True, status_code=200, text='{"ok":true}')
+
+
+@patch.object(BroadcastSender, "CHUNK_SIZE", 2)
+@patch("backend.utils.telegram.requests.Session.post", side_effect=_mock_response)
+@patch("twitter_downloader.tasks.send_broadcast_chunk.delay", side_effect=lambda *args: send_broadcast_chunk(*args))
+class TestBroadcast(TestCase):
+    def setUp(self):
+        for i in range(1, 6):
+            TelegramUser.objects.create(user_id=str(1000 + i), first_name=f"User {i}", is_active=True)
+        TelegramUser.objects.create(user_id="2000", first_name="Banned", is_active=True, is_banned=True)
+        TelegramUser.objects.create(user_id="3000", first_name="Inactive", is_active=False)
+
+        self.broadcast = BroadcastMessage.objects.create(message="Hello everyone!")
+        self.broadcast.status = BroadcastMessage.BroadcastStatus.SENDING
+        self.broadcast.total_users = 5
+        self.broadcast.save()
+
+    def test_broadcast_to_all_users(self, mock_delay, mock_post):
+        broadcast_message_to_all_users(str(self.broadcast.uuid))
+
+        self.broadcast.refresh_from_db()
+        self.assertEqual(self.broadcast.status, BroadcastMessage.BroadcastStatus.COMPLETED)
+        self.assertIsNotNone(self.broadcast.completed_at)
+        self.assertEqual(self.broadcast.sent_count, 4)
+        self.assertEqual(self.broadcast.failed_count, 1)
+
+        self.assertEqual(mock_post.call_count, 5, "Should only send to the active and non-banned users")
+        self.assertEqual(mock_delay.call_count, 4, "Should send 3 chunks then complete the broadcast")
+        self.assertEqual(BroadcastLog.objects.filter(status=BroadcastLog.LogStatus.SUCCESS).count(), 4)
+
+        failed_log = BroadcastLog.objects.get(status=BroadcastLog.LogStatus.FAILED)
+        self.assertEqual(failed_log.telegram_user.user_id, "1003")
+        self.assertIn("blocked", failed_log.error_message)
+
+    def test_retried_chunk_skips_processed_users(self, mock_delay, mock_post):
+        first_user = TelegramUser.objects.order_by("id").first()
+        BroadcastLog.objects.create(
+            broadcast=self.broadcast, telegram_user=first_user, status=BroadcastLog.LogStatus.SUCCESS
+        )
+
+        sender = BroadcastSender(self.broadcast)
+        self.assertTrue(sender.send_chunk())
+
+        self.assertEqual(mock_post.call_count, 1, "Should not send twice to the same user")
+        self.assertEqual(BroadcastLog.objects.count(), 2)
+
+        self.broadcast.refresh_from_db()
+        self.assertEqual(self.broadcast.last_user_id, TelegramUser.objects.order_by("id")[1].id)
+        self.assertEqual(self.broadcast.processed_chunks, 1)
+        self.assertIsNotNone(self.broadcast.checkpointed_at)
+        self.assertIsNotNone(self.broadcast.throughput)
+
+    def test_queries_per_chunk(self, mock_delay, mock_post):
+        sender = BroadcastSender(self.broadcast)
+
+        # Select the chunk, select the processed users, insert the logs and update the counters in a transaction,
+        # then save the checkpoint
+        with self.assertNumQueries(7):
+            sender.send_chunk()
+
+    def test_logged_users_are_not_counted_again(self, mock_delay, mock_post):
+        sender = BroadcastSender(self.broadcast)
+        sender.send_chunk()
+        self.broadcast.refresh_from_db()
+        self.assertEqual((self.broadcast.sent_count, self.broadcast.failed_count), (2, 0))
+
+        # A redelivered chunk logging the users 1001 and 1002 again, eg. when both deliveries ran concurrently
+        futures = {}
+        for user in TelegramUser.objects.filter(user_id__in=["1001", "1002", "1003"]).order_by("id"):
+            future = Future()
+            future.set_result("" if user.user_id != "1003" else "Forbidden")
+            futures[future] = user.id
+        sender.save_logs(futures, set())
+
+        self.broadcast.refresh_from_db()
+        self.assertEqual((self.broadcast.sent_count, self.broadcast.failed_count), (2, 1))
+        self.assertEqual(BroadcastLog.objects.count(), 3)
+
+    @patch.object(BroadcastSender, "CONCURRENCY", 1)
+    @patch.object(BroadcastSender, "LOG_BATCH_SIZE", 2)
+    def test_failed_chunk_keeps_the_logs_of_the_sent_messages(self, mock_delay, mock_post):
+        def fail_on_last_user(*args, json=None, **kwargs):
+            if json["chat_id"] == "1005":
+                raise RuntimeError("Worker is shutting down")
+            return _mock_response(json=json)
+
+        mock_post.side_effect = fail_on_last_user
+        with patch.object(BroadcastSender, "CHUNK_SIZE", 5), self.assertRaises(RuntimeError):
+            BroadcastSender(self.broadcast).send_chunk()
+
+        self.assertEqual(BroadcastLog.objects.count(), 4, "Should log the messages sent before the error")
+        self.broadcast.refresh_from_db()
+        self.assertEqual(self.broadcast.last_user_id, 0, "Should not move the checkpoint")
+        self.assertEqual(self.broadcast.sent_count + self.broadcast.failed_count, 4)
+
+        # The retry of the chunk only sends to the users left
+        mock_post.reset_mock(side_effect=True)
+        mock_post.side_effect = _mock_response
+        with patch.object(BroadcastSender, "CHUNK_SIZE", 5):
+            self.assertTrue(BroadcastSender(self.broadcast).send_chunk())
+        self.assertEqual([call.kwargs["json"]["chat_id"] for call in mock_post.call_args_list], ["1005"])
+        self.assertEqual(BroadcastLog.objects.count(), 5)
+
+    def test_resume_from_checkpoint(self, mock_delay, mock_post):
+        users = list(TelegramUser.objects.filter(is_banned=False, is_active=True).order_by("id"))
+        self.broadcast.last_user_id = users[1].id
+        self.broadcast.sent_count = 2
+        self.broadcast.save()
+
+        send_broadcast_chunk(str(self.broadcast.uuid), users[1].id)
+
+        sent_chat_ids = [call.kwargs["json"]["chat_id"] for call in mock_post.call_args_list]
+        self.assertEqual(sent_chat_ids, [user.user_id for user in users[2:]], "Should resume after the checkpoint")
+
+        self.broadcast.refresh_from_db()
+        self.assertEqual(self.broadcast.status, BroadcastMessage.BroadcastStatus.COMPLETED)
+        self.assertEqual(self.broadcast.sent_count, 4)
+        self.assertEqual(self.broadcast.failed_count, 1)
+
+    def test_outdated_chain_stops(self, mock_delay, mock_post):
+        self.broadcast.last_user_id = TelegramUser.objects.order_by("id")[1].id
+        self.broadcast.save()
+
+        send_broadcast_chunk(str(self.broadcast.uuid), 0)
+
+        mock_post.assert_not_called()
+        mock_delay.assert_not_called()
+
+    def test_pause_and_resume(self, mock_delay, mock_post):
+        self.broadcast.pause_broadcast()
+        send_broadcast_chunk(str(self.broadcast.uuid))
+        mock_post.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.broadcast.resume_broadcast()
+
+        self.broadcast.refresh_from_db()
+        self.assertEqual(self.broadcast.status, BroadcastMessage.BroadcastStatus.COMPLETED)
+        self.assertEqual(mock_post.call_count, 5)
+
+    def test_resume_stalled_broadcasts(self, mock_delay, mock_post):
+        BroadcastMessage.objects.filter(uuid=self.broadcast.uuid).update(
+            started_at=timezone.now() - timedelta(hours=1),
+            checkpointed_at=timezone.now() - timedelta(hours=1),
+        )
+        BroadcastMessage.objects.create(
+            message="Still sending",
+            status=BroadcastMessage.BroadcastStatus.SENDING,
+            started_at=timezone.now(),
+            checkpointed_at=timezone.now(),
+        )
+
+        resume_stalled_broadcasts()
+
+        self.broadcast.refresh_from_db()
+        self.assertEqual(self.broadcast.status, BroadcastMessage.BroadcastStatus.COMPLETED)
+        self.assertEqual(mock_post.call_count, 5, "Should only resume the stalled broadcast")
+        self.assertEqual(self.broadcast.stalled_resumes, 0, "Should reset the resumes on the next checkpoint")
+
+    def test_stalled_broadcast_fails_after_max_resumes(self, mock_delay, mock_post):
+        BroadcastMessage.objects.filter(uuid=self.broadcast.uuid).update(
+            started_at=timezone.now() - timedelta(hours=1), stalled_resumes=3
+        )
+
+        resume_stalled_broadcasts(max_resumes=3)
+
+        self.broadcast.refresh_from_db()
+        self.assertEqual(self.broadcast.status, BroadcastMessage.BroadcastStatus.FAILED)
+        mock_delay.assert_not_called()
+
+    @patch.object(BroadcastSender, "send_chunk", side_effect=RuntimeError("Database is down"))
+    def test_broadcast_fails_when_retries_are_exhausted(self, mock_send_chunk, mock_delay, mock_post):
+        result = send_broadcast_chunk.apply(args=[str(self.broadcast.uuid)])
+
+        self.assertTrue(result.failed())
+        self.assertEqual(mock_send_chunk.call_count, 4, "Should retry the chunk 3 times")
+        self.broadcast.refresh_from_db()
+        self.assertEqual(self.broadcast.status, BroadcastMessage.BroadcastStatus.FAILED)
+
+        resume_stalled_broadcasts(stalled_after=0)
+        mock_delay.assert_not_called()
+
+    def test_broadcast_not_sending(self, mock_delay, mock_post):
+        self.broadcast.status = BroadcastMessage.BroadcastStatus.DRAFT
+        self.broadcast.save()
+
+        send_broadcast_chunk(str(self.broadcast.uuid))
+
+        mock_post.assert_not_called()
+        mock_delay.assert_not_called()
+
+
+class TestBroadcastMessageModel(TestCase):
+    @patch("twitter_downloader.tasks.broadcast_message_to_all_users.delay")
+    def test_start_broadcast_after_commit(self, mock_delay):
+        broadcast = BroadcastMessage.objects.create(message="Hello")
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            broadcast.start_broadcast()
+            mock_delay.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+        mock_delay.assert_called_once_with(str(broadcast.uuid))
+        broadcast.refresh_from_db()
+        self.assertEqual(broadcast.status, BroadcastMessage.BroadcastStatus.SENDING)
+
+    def test_throughput_and_eta(self):
+        broadcast = BroadcastMessage(
+            message="Hello",
+            status=BroadcastMessage.BroadcastStatus.SENDING,
+            total_users=1000,
+            sent_count=190,
+            failed_count=10,
+            sending_seconds=10,
+        )
+
+        self.assertEqual(broadcast.throughput, 20)
+        self.assertEqual(broadcast.eta, timedelta(seconds=40))
+
+    def test_not_started(self):
+        broadcast = BroadcastMessage(message="Hello", total_users=1000)
+
+        self.assertIsNone(broadcast.throughput)
+        self.assertIsNone(broadcast.eta)
+
+
+class TestDeleteOldData(TestCase):
+    def setUp(self):
+        self.telegram_user = TelegramUser.objects.create(user_id="1001", first_name="Arter")
+        self.partitions = DownloadedTweet.get_partitions()
+        self.old_month = add_months(timezone.now().date(), -3)
+        self.tweet_ids = itertools.count(1)
+
+    def _create_tweet(self, created_at) -> DownloadedTweet:
+        tweet_id = next(self.tweet_ids)
+        tweet = Tweet.save_tweet_data(tweet_id, f"https://x.com/a/status/{tweet_id}", {})
+        Tweet.objects.filter(id=tweet.id).update(created_at=created_at)
+        tweet = DownloadedTweet.objects.create(telegram_user=self.telegram_user, tweet=tweet)
+        DownloadedTweet.objects.filter(uuid=tweet.uuid).update(created_at=created_at)
+        return tweet
+
+    def test_partitioned_table(self):
+        self.assertTrue(self.partitions.is_partitioned())
+        self.assertEqual(self.partitions.create_ahead(), [], "Should be created ahead by the migration")
+
+        self.partitions.create(self.old_month)
+        old_tweet = self._create_tweet(timezone.now() - timedelta(days=90))
+        default_tweet = self._create_tweet(timezone.now() - timedelta(days=400))
+        recent_tweet = self._create_tweet(timezone.now() - timedelta(days=1))
+
+        # Run the deferred foreign key checks, a table with pending trigger events can't be dropped
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        delete_old_data()
+
+        self.assertNotIn(self.partitions.get_partition_name(self.old_month), self.partitions.get_partitions())
+        self.assertFalse(DownloadedTweet.objects.filter(uuid__in=[old_tweet.uuid, default_tweet.uuid]).exists())
+        self.assertTrue(DownloadedTweet.objects.filter(uuid=recent_tweet.uuid).exists())
+        self.assertEqual(list(Tweet.objects.values_list("id", flat=True)), [recent_tweet.tweet_id])
+
+    def test_create_ahead(self):
+        created = self.partitions.create_ahead(today=add_months(timezone.now().date(), 6))
+        self.assertEqual(len(created), 4, "Should create the partitions of the month and the 3 next ones")
+
+    @patch("backend.utils.partitions.MonthlyPartitions.is_partitioned", return_value=False)
+    def test_chunked_delete_fallback(self, mock_is_partitioned):
+        old_tweets = [self._create_tweet(timezone.now() - timedelta(days=31 + i)) for i in range(3)]
+        recent_tweet = self._create_tweet(timezone.now() - timedelta(days=1))
+
+        with patch("twitter_downloader.tasks.delete_in_chunks", wraps=delete_in_chunks) as mock_delete:
+            self.assertEqual(delete_old_data(), "Deleted 3 downloaded tweets, 3 tweets")
+        self.assertEqual(mock_delete.call_count, 1, "Should delete the downloads in chunks")
+
+        self._create_tweet(timezone.now() - timedelta(days=31))
+        with self.assertNumQueries(5, msg="Should delete each chunk with one DELETE, without loading the tweets"):
+            delete_in_chunks(DownloadedTweet.objects.filter(created_at__lt=timezone.now() - timedelta(days=30)))
+        self.assertFalse(DownloadedTweet.objects.filter(uuid__in=[tweet.uuid for tweet in old_tweets]).exists())
+        self.assertTrue(DownloadedTweet.objects.filter(uuid=recent_tweet.uuid).exists())
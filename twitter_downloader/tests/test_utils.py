@@ -1,3 +1,11 @@
+import threading
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from twitter_downloader.utils import get_cached_tweet_data, tweet_data_cache
+
 # from django.conf import settings
 # from django.test import TestCase
 
@@ -182,3 +190,92 @@
 #             validate_telegram_mini_app_data(init_data, telegram_bot_token)
 
 #         self.assertIn("The given data hash is not valid!", str(cm.exception))
+
+
+@patch("twitter_downloader.utils.TwitterDownloaderAPIV4.get_tweet_data")
+class TestGetCachedTweetData(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_url_variants_share_cache(self, mock_get_tweet_data):
+        mock_get_tweet_data.return_value = {"success": True, "videos": [{"url": "https://video.twimg.com/1.mp4"}]}
+
+        for url in [
+            "https://x.com/user/status/1829443959665443131",
+            "https://twitter.com/user/status/1829443959665443131?t=kZOlgjU0EJ-FAEol6Ij22Q&s=35",
+            "https://x.com/other/status/1829443959665443131/video/1",
+        ]:
+            self.assertTrue(get_cached_tweet_data(url).get("success"))
+
+        self.assertEqual(mock_get_tweet_data.call_count, 1, "Should fetch the tweet once")
+
+    def test_no_video_is_cached(self, mock_get_tweet_data):
+        mock_get_tweet_data.return_value = {"success": False, "error": "No video links found."}
+
+        get_cached_tweet_data("https://x.com/user/status/1")
+        self.assertFalse(get_cached_tweet_data("https://x.com/user/status/1").get("success"))
+        self.assertEqual(mock_get_tweet_data.call_count, 1, "Should cache tweets without a video")
+
+    def test_network_error_is_not_cached(self, mock_get_tweet_data):
+        mock_get_tweet_data.return_value = {"success": False, "error": "Network error", "retryable": True}
+
+        get_cached_tweet_data("https://x.com/user/status/1")
+        get_cached_tweet_data("https://x.com/user/status/1")
+        self.assertEqual(mock_get_tweet_data.call_count, 2, "Should not cache retryable errors")
+
+    def test_concurrent_lookups_share_upstream_call(self, mock_get_tweet_data):
+        started, release = threading.Event(), threading.Event()
+
+        def slow_get_tweet_data(tweet_url):
+            started.set()
+            release.wait(timeout=5)
+            return {"success": True, "videos": [{"url": "https://video.twimg.com/1.mp4"}]}
+
+        mock_get_tweet_data.side_effect = slow_get_tweet_data
+        results = []
+
+        def lookup():
+            results.append(get_cached_tweet_data("https://x.com/user/status/1829443959665443131"))
+
+        owner = threading.Thread(target=lookup)
+        owner.start()
+        started.wait(timeout=5)
+
+        waiters = [threading.Thread(target=lookup) for _ in range(3)]
+        for waiter in waiters:
+            waiter.start()
+        release.set()
+        for thread in [owner, *waiters]:
+            thread.join(timeout=10)
+
+        self.assertEqual(mock_get_tweet_data.call_count, 1, "Should call upstream once")
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result.get("success") for result in results))
+
+    def test_waiters_get_uncached_results(self, mock_get_tweet_data):
+        # Another process is fetching the tweet and ends with a network error, which isn't cached
+        cache.add("twitter_downloader_tweet_data_lock:1", "other", timeout=60)
+        cache.set("twitter_downloader_tweet_data_flight:1", {"success": False, "retryable": True})
+
+        tweet_data = tweet_data_cache.fetch("1", mock_get_tweet_data)
+
+        self.assertFalse(tweet_data.get("success"))
+        mock_get_tweet_data.assert_not_called()
+
+    @patch("twitter_downloader.utils.cache.add", return_value=None)
+    def test_unavailable_cache_is_not_waited_for(self, mock_add, mock_get_tweet_data):
+        # django-redis with IGNORE_EXCEPTIONS returns None when Redis is down
+        mock_get_tweet_data.return_value = {"success": True, "videos": [{"url": "https://video.twimg.com/1.mp4"}]}
+
+        with patch("twitter_downloader.utils.time.sleep") as mock_sleep:
+            self.assertTrue(tweet_data_cache.fetch("1", mock_get_tweet_data).get("success"))
+
+        mock_sleep.assert_not_called()
+        mock_get_tweet_data.assert_called_once()
+
+    @patch("twitter_downloader.utils.cache.add", side_effect=ConnectionError)
+    def test_cache_errors_are_not_waited_for(self, mock_add, mock_get_tweet_data):
+        mock_get_tweet_data.return_value = {"success": True, "videos": [{"url": "https://video.twimg.com/1.mp4"}]}
+
+        self.assertTrue(tweet_data_cache.fetch("1", mock_get_tweet_data).get("success"))
+        mock_get_tweet_data.assert_called_once()
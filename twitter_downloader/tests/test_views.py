@@ -1,3 +1,13 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from twitter_downloader.models import ExternalLink
+
 # from django.test import TestCase
 # from django.urls import reverse
 
@@ -215,3 +225,37 @@
 #     #     self.assertEqual(response.status_code, 200, "Response status code should be 200 (OK)")
 
 #     # TODO: add test for invalid UUID
+
+
+class TestExternalLinkView(TestCase):
+    def setUp(self):
+        cache.delete(ExternalLink.get_keyboard_cache_key())
+        self.external_link = ExternalLink.objects.create(title="Animemoe", url="https://animemoe.us")
+        self.url = reverse("twitter-downloader:external-link", kwargs={"pk": self.external_link.pk})
+
+    @patch("backend.utils.cache.get_redis_client")
+    def test_redirect(self, mock_get_redis_client):
+        ExternalLink.get_inline_keyboard()
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+
+        queries = [query["sql"] for query in context.captured_queries if "SAVEPOINT" not in query["sql"]]
+        self.assertEqual(queries, [], "Should not query the database")
+        self.assertRedirects(response, "https://animemoe.us", fetch_redirect_response=False)
+        mock_get_redis_client.return_value.hincrby.assert_called_once_with(
+            "twitter_downloader_external_link_clicks", str(self.external_link.pk), 1
+        )
+
+    def test_click_without_redis(self):
+        self.client.get(self.url)
+
+        self.external_link.refresh_from_db()
+        self.assertEqual(self.external_link.counter, 1, "Should update right away without Redis")
+
+    def test_inactive_link(self):
+        self.external_link.is_active = False
+        self.external_link.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 404)
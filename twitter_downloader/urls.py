@@ -1,8 +1,9 @@
 from django.urls import path
 
-from .views import SafelinkView, TelegramWebhookView, ValidateTelegramMiniAppDataView
+from .views import ExternalLinkView, SafelinkView, TelegramWebhookView, ValidateTelegramMiniAppDataView
 
 urlpatterns = [
+    path("external-links/<int:pk>/", ExternalLinkView.as_view(), name="external-link"),
     path("safelink/", SafelinkView.as_view(), name="safelink"),
     path("telegram-webhook/", TelegramWebhookView.as_view(), name="telegram-webhook"),
     path(
@@ -1,15 +1,26 @@
 import logging
 import random
 import re
+import time
+import uuid
+from collections.abc import Callable
 
 import requests
 import tenacity
 from django.conf import settings
+from django.core.cache import cache
+from prometheus_client import Counter
 from saiyaku import retry
 from tenacity import stop_after_attempt
 
 logger = logging.getLogger(__name__)
 
+tweet_data_cache_requests = Counter(
+    "twitter_downloader_tweet_data_cache_requests_total",
+    "Tweet data cache lookups, labeled by whether they were served from the cache",
+    ["result"],
+)
+
 
 class TooManyRequestException(Exception):
     pass
@@ -110,16 +121,17 @@ class TwitterDownloaderAPIV2:
         "X-RapidAPI-Host": settings.TWITTER_DOWNLOADER_HOST,
     }
 
-    def __init__(self, tweet_url: str):
+    def __init__(self, tweet_url: str, retry_rate_limited: bool = True):
         """
         Initialize the TwitterDownloaderAPIV2 instance.
 
         Args:
             tweet_url (str): The URL of the tweet to fetch data for.
+            retry_rate_limited (bool): Whether to retry the rate limited requests, or to make a single attempt.
         """
 
         self.tweet_url = tweet_url
-        self.tweet_data = self._get_tweet_data()
+        self.tweet_data = self._get_tweet_data() if retry_rate_limited else self._get_tweet_data.__wrapped__(self)
         self.id = self.tweet_data.get("id")
         self.created_at = self.tweet_data.get("created_at")
         self.description = self.tweet_data.get("description")
@@ -433,7 +445,8 @@ class TwitterDownloaderAPIV4:
                 Or on error:
                 {
                     "success": False,
-                    "error": str (error message)
+                    "error": str (error message),
+                    "retryable": bool (only set for network and parsing errors)
                 }
 
         Raises:
@@ -456,6 +469,7 @@ class TwitterDownloaderAPIV4:
             return {
                 "success": False,
                 "error": f"Network error when connecting to Twitter API: {str(e)}",
+                "retryable": True,
             }
 
         try:
@@ -465,6 +479,7 @@ class TwitterDownloaderAPIV4:
             return {
                 "success": False,
                 "error": "Failed to parse API response. Please try again later.",
+                "retryable": True,
             }
 
         # Check if the request was successful
@@ -478,3 +493,150 @@ class TwitterDownloaderAPIV4:
 
         logger.info(f"Successfully retrieved video data for tweet: {tweet_url}")
         return response_data
+
+
+class TweetDataCache:
+    """
+    Cache of `TwitterDownloaderAPIV4.get_tweet_data` results keyed by tweet ID, so the
+    x.com, twitter.com and query string variants of a tweet URL share the same entry.
+
+    Tweets without a video are cached for a shorter time (negative caching), network
+    and parsing errors are not cached at all.
+
+    `fetch` is single-flight across processes: the first caller takes a short-lived lock
+    in the shared cache (Redis in production) and calls the upstream worker, concurrent
+    callers for the same tweet wait for its result instead of calling upstream too.
+    """
+
+    KEY_PREFIX = "twitter_downloader_tweet_data"
+    # Longer than the upstream request timeout, so the lock outlives a slow fetch
+    LOCK_TIMEOUT = 60
+    # How long a waiter waits for the lock owner before fetching the tweet itself
+    WAIT_TIMEOUT = 45
+    POLL_INTERVAL = 0.05
+    MAX_POLL_INTERVAL = 1.0
+    # Lets waiters pick up results that aren't cached (eg. network errors)
+    FLIGHT_RESULT_TIMEOUT = 10
+
+    def __init__(self, timeout: int = 60 * 60, negative_timeout: int = 60 * 5):
+        self.timeout = timeout
+        self.negative_timeout = negative_timeout
+
+    def make_key(self, tweet_id: str) -> str:
+        return f"{self.KEY_PREFIX}:{tweet_id}"
+
+    def get(self, tweet_id: str) -> dict | None:
+        return cache.get(self.make_key(tweet_id))
+
+    def set(self, tweet_id: str, tweet_data: dict) -> None:
+        if tweet_data.get("success"):
+            cache.set(self.make_key(tweet_id), tweet_data, timeout=self.timeout)
+        elif not tweet_data.get("retryable"):
+            cache.set(self.make_key(tweet_id), tweet_data, timeout=self.negative_timeout)
+
+    def delete(self, tweet_id: str) -> None:
+        cache.delete(self.make_key(tweet_id))
+
+    def acquire_lock(self, lock_key: str, token: str) -> bool | None:
+        """
+        Returns:
+            bool | None: Whether the lock was taken, or None if the cache is unavailable. django-redis
+            returns None instead of raising when `IGNORE_EXCEPTIONS` is set, as in production.
+        """
+
+        try:
+            return cache.add(lock_key, token, timeout=self.LOCK_TIMEOUT)
+        except Exception:
+            logger.exception("Failed to take the lock %s", lock_key)
+            return None
+
+    def fetch(self, tweet_id: str, fetch_tweet_data: Callable[[], dict]) -> dict:
+        """
+        Call `fetch_tweet_data` and cache its result, unless another caller is already fetching
+        the same tweet, in which case its result is returned.
+
+        Args:
+            tweet_id (str): The tweet ID
+            fetch_tweet_data (Callable): Fetches the tweet data from upstream
+
+        Returns:
+            dict: See `TwitterDownloaderAPIV4.get_tweet_data`
+        """
+
+        lock_key = f"{self.KEY_PREFIX}_lock:{tweet_id}"
+        flight_key = f"{self.KEY_PREFIX}_flight:{tweet_id}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.WAIT_TIMEOUT
+        poll_interval = self.POLL_INTERVAL
+
+        while True:
+            locked = self.acquire_lock(lock_key, token)
+            if locked is None:
+                # Nobody can hold the lock, don't wait for it
+                logger.warning("The cache is unavailable, fetching the tweet %s without the lock", tweet_id)
+                return fetch_tweet_data()
+            if locked:
+                break
+
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, self.MAX_POLL_INTERVAL)
+
+            results = cache.get_many([self.make_key(tweet_id), flight_key])
+            tweet_data = results.get(self.make_key(tweet_id)) or results.get(flight_key)
+            if tweet_data is not None:
+                tweet_data_cache_requests.labels(result="coalesced").inc()
+                return tweet_data
+
+            if time.monotonic() >= deadline:
+                logger.warning("Timed out waiting for the tweet %s to be fetched, fetching it again", tweet_id)
+                tweet_data = fetch_tweet_data()
+                self.set(tweet_id, tweet_data)
+                return tweet_data
+
+        try:
+            # The previous owner may have cached the tweet between our last check and taking the lock
+            tweet_data = self.get(tweet_id)
+            if tweet_data is not None:
+                tweet_data_cache_requests.labels(result="coalesced").inc()
+                return tweet_data
+
+            tweet_data = fetch_tweet_data()
+            self.set(tweet_id, tweet_data)
+            cache.set(flight_key, tweet_data, timeout=self.FLIGHT_RESULT_TIMEOUT)
+        finally:
+            # Don't release a lock that expired and was taken by another caller
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+        return tweet_data
+
+
+tweet_data_cache = TweetDataCache()
+
+
+def get_cached_tweet_data(tweet_url: str) -> dict:
+    """
+    Fetch the tweet data through `TweetProviderRouter`, serving tweets requested recently
+    from the tweet data cache instead of calling the upstream providers again. Concurrent
+    lookups of the same tweet share a single upstream call.
+
+    Args:
+        tweet_url (str): The Twitter/X tweet URL to retrieve.
+
+    Returns:
+        dict: See `TwitterDownloaderAPIV4.get_tweet_data`
+    """
+    from .providers import tweet_provider_router
+
+    try:
+        tweet_id = get_tweet_id_from_url(tweet_url)
+    except ValueError:
+        return tweet_provider_router.get_tweet_data(tweet_url)
+
+    tweet_data = tweet_data_cache.get(tweet_id)
+    if tweet_data is not None:
+        tweet_data_cache_requests.labels(result="hit" if tweet_data.get("success") else "negative_hit").inc()
+        return tweet_data
+
+    tweet_data_cache_requests.labels(result="miss").inc()
+    return tweet_data_cache.fetch(tweet_id, lambda: tweet_provider_router.get_tweet_data(tweet_url))
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.21 on 2026-10-17 10:12
+
+import django.core.validators
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import pgvector.django.indexes
+
+
+class Migration(migrations.Migration):
+    # Building the HNSW index concurrently keeps the table writable while the index is built
+    atomic = False
+
+    dependencies = [
+        ("waifu", "0007_setting"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="setting",
+            name="similar_images_ef_search",
+            field=models.PositiveIntegerField(
+                default=40,
+                help_text="HNSW ef_search used by the similar images endpoint. Higher is more accurate but slower.",
+                validators=[
+                    django.core.validators.MinValueValidator(1),
+                    django.core.validators.MaxValueValidator(1000),
+                ],
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="image",
+            index=pgvector.django.indexes.HnswIndex(
+                ef_construction=64,
+                fields=["embedding"],
+                m=16,
+                name="waifu_image_embedding_hnsw",
+                opclasses=["vector_cosine_ops"],
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.21 on 2026-10-17 04:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("waifu", "0008_setting_similar_images_ef_search_image_embedding_hnsw"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="signed_original_image",
+            field=models.CharField(blank=True, default="", max_length=1000),
+        ),
+        migrations.AddField(
+            model_name="image",
+            name="signed_thumbnail",
+            field=models.CharField(blank=True, default="", max_length=1000),
+        ),
+        migrations.AddField(
+            model_name="image",
+            name="signed_urls_expire_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
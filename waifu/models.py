@@ -1,15 +1,18 @@
 import base64
 import random
+from datetime import timedelta
 from io import BytesIO
 
 import requests
 from django.conf import settings
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
-from pgvector.django import VectorField
+from django.utils import timezone
+from pgvector.django import HnswIndex, VectorField
 from PIL import Image as PILImage
-from solo.models import SingletonModel
 
-from models.base import BaseTelegramUserModel
+from backend.utils.pgvector import HNSW_EF_SEARCH_MAX, HNSW_EF_SEARCH_MIN
+from models.base import BaseTelegramUserModel, CachedSingletonModel
 
 
 class Image(models.Model):
@@ -18,6 +21,11 @@ class Image(models.Model):
     thumbnail = models.CharField(max_length=500, blank=True)
     blur_data_url = models.TextField(blank=True, default="")  # base64 string
 
+    # Pre-refreshed (signed) Discord URLs, kept up to date by the `refresh_expiring_image_urls` task
+    signed_original_image = models.CharField(max_length=1000, blank=True, default="")
+    signed_thumbnail = models.CharField(max_length=1000, blank=True, default="")
+    signed_urls_expire_at = models.DateTimeField(blank=True, null=True, db_index=True)
+
     is_nsfw = models.BooleanField(default=False)
 
     width = models.IntegerField(default=0)
@@ -33,9 +41,37 @@ class Image(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            HnswIndex(
+                name="waifu_image_embedding_hnsw",
+                fields=["embedding"],
+                m=16,
+                ef_construction=64,
+                opclasses=["vector_cosine_ops"],
+            ),
+        ]
+
     def __str__(self):
         return f"{self.image_id}"
 
+    def get_image_urls(self) -> tuple[str, str]:
+        """
+        Return the (original_image, thumbnail) URLs to serve.
+        The pre-refreshed signed URLs are used while they are valid, otherwise the stored ones.
+        """
+
+        from discord.utils import DiscordAttachmentURLRefresher
+
+        original_image, thumbnail = self.original_image, self.thumbnail
+        if self.signed_urls_expire_at and self.signed_urls_expire_at > timezone.now() + timedelta(
+            seconds=DiscordAttachmentURLRefresher.EXPIRY_MARGIN
+        ):
+            original_image = self.signed_original_image or original_image
+            thumbnail = self.signed_thumbnail or thumbnail
+
+        return original_image, thumbnail
+
     def generate_blur_data_url(self):
         """
         Generates a blurred data URL from the original image.
@@ -57,9 +93,7 @@ class Image(models.Model):
         from waifu.utils import refresh_expired_urls
 
         # Get the image URL
-        image_url = self.original_image
-        if refresh_expired_urls([self.original_image]).get(self.original_image):
-            image_url = refresh_expired_urls([self.original_image]).get(self.original_image)
+        image_url = refresh_expired_urls([self.original_image]).get(self.original_image) or self.original_image
 
         # Fetch the image from URL using requests
         response = requests.get(image_url)
@@ -175,10 +209,15 @@ class DiscordWebhook(models.Model):
         )
 
 
-class Setting(SingletonModel):
+class Setting(CachedSingletonModel):
     openrouter_base_url = models.URLField(default="https://openrouter.ai", max_length=5000)
     embedding_model = models.CharField(max_length=255, default="google/gemini-embedding-2")
     embedding_api_key = models.CharField(max_length=255, blank=True, default="")
+    similar_images_ef_search = models.PositiveIntegerField(
+        default=40,
+        validators=[MinValueValidator(HNSW_EF_SEARCH_MIN), MaxValueValidator(HNSW_EF_SEARCH_MAX)],
+        help_text="HNSW ef_search used by the similar images endpoint. Higher is more accurate but slower.",
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -1,4 +1,6 @@
-from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.pagination import PageNumberPagination
+
+from backend.utils.pagination import SnapshotCursorPagination
 
 
 class WaifuListPagination(PageNumberPagination):
@@ -7,7 +9,7 @@ class WaifuListPagination(PageNumberPagination):
     page_size_query_param = "count"
 
 
-class WaifuSimilarPagination(CursorPagination):
+class WaifuSimilarPagination(SnapshotCursorPagination):
     page_size = 20
     page_size_query_param = "count"
-    ordering = ("-similarity_score", "-id")
+    max_results = 1000
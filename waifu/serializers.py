@@ -2,20 +2,43 @@ from rest_framework import serializers
 
 from waifu.models import Image
 
+# Internal, the signed URLs are served in place of `original_image` and `thumbnail`
+SIGNED_URL_FIELDS = ("signed_original_image", "signed_thumbnail", "signed_urls_expire_at")
+
+
+class ImageURLSerializerMixin:
+    """Serve the pre-refreshed Discord URLs of an image while they are still valid."""
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data["original_image"], data["thumbnail"] = instance.get_image_urls()
+        return data
+
+
+class WaifuListSerialzer(ImageURLSerializerMixin, serializers.ModelSerializer):
+    """
+    Slim representation for list pages, without the embedding vector.
+    The base64 `blur_data_url` is omitted when the `include_blur_data_url` context is False.
+    """
 
-class WaifuListSerialzer(serializers.ModelSerializer):
     class Meta:
         model = Image
-        fields = "__all__"
+        exclude = (*SIGNED_URL_FIELDS, "embedding")
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self.context.get("include_blur_data_url", True):
+            fields.pop("blur_data_url")
+        return fields
 
 
-class WaifuDetailSerializer(serializers.ModelSerializer):
+class WaifuDetailSerializer(ImageURLSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Image
-        fields = "__all__"
+        exclude = SIGNED_URL_FIELDS
 
 
-class RandomWaifuSerializer(serializers.ModelSerializer):
+class RandomWaifuSerializer(ImageURLSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Image
-        fields = "__all__"
+        exclude = SIGNED_URL_FIELDS
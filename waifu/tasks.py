@@ -1,9 +1,14 @@
 import logging
-import random
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
 
 import pyscord_storage
 import requests
 from celery import shared_task
+from django.db.models import F, Q
+from django.utils import timezone
+
+from discord.utils import DISCORD_CDN_HOSTS, get_discord_url_expiry
 
 from .models import DiscordWebhook, Image
 
@@ -50,26 +55,83 @@ def waifu_generate_missing_image_embeddings(batch_size: int = 100) -> str:
 
 
 @shared_task()
-def send_waifu():
+def refresh_expiring_image_urls(
+    lead_time: int = 60 * 60, batch_size: int = 500, retry_delay: int = 60 * 15, retry_batch_size: int = 100
+) -> str:
+    """
+    Pre-refresh the Discord URLs of images that expire within `lead_time` seconds, so the API
+    can serve the stored signed URLs instead of refreshing them while handling a request.
+    Should be scheduled more often than `lead_time`, eg. every 15 minutes.
+
+    Args:
+        lead_time (int): Refresh URLs expiring within this many seconds.
+        batch_size (int): Maximum number of images handled per run, the oldest first.
+        retry_delay (int): Seconds to wait before retrying images Discord failed to refresh.
+        retry_batch_size (int): Maximum number of the images Discord failed to refresh retried per run,
+            so they can't hold back the refresh of the other images.
+    """
     from waifu.utils import refresh_expired_urls
 
+    now = timezone.now()
+    is_discord_image = Q()
+    for host in DISCORD_CDN_HOSTS:
+        is_discord_image |= Q(original_image__contains=host) | Q(thumbnail__contains=host)
+
+    expiring = (
+        Image.objects.filter(is_discord_image)
+        .filter(
+            Q(signed_urls_expire_at__isnull=True) | Q(signed_urls_expire_at__lt=now + timedelta(seconds=lead_time))
+        )
+        .order_by(F("signed_urls_expire_at").asc(nulls_first=True))
+        .only("id", "original_image", "thumbnail")
+    )
+    # The images Discord failed to refresh have no signed URL
+    failed = Q(signed_original_image="", signed_urls_expire_at__isnull=False)
+    images = list(expiring.filter(failed)[: min(retry_batch_size, batch_size)])
+    images += list(expiring.exclude(failed)[: batch_size - len(images)])
+    if not images:
+        return "No image URLs to refresh."
+
+    urls = [url for image in images for url in (image.original_image, image.thumbnail)]
+    # Stored URLs valid for less than `lead_time` seconds are refreshed too
+    refreshed_urls = refresh_expired_urls(urls, expiry_margin=lead_time)
+
+    refreshed_count = 0
+    for image in images:
+        image.signed_original_image = refreshed_urls.get(image.original_image, "")
+        image.signed_thumbnail = refreshed_urls.get(image.thumbnail, "")
+        expiries = [
+            get_discord_url_expiry(url) for url in (image.signed_original_image, image.signed_thumbnail) if url
+        ]
+        expiries = [expiry for expiry in expiries if expiry is not None]
+
+        if image.signed_original_image and expiries:
+            image.signed_urls_expire_at = datetime.fromtimestamp(min(expiries), tz=dt_timezone.utc)
+            refreshed_count += 1
+        else:
+            image.signed_original_image = image.signed_thumbnail = ""
+            # Out of the next runs until `retry_delay` passed, the unsigned URLs are served meanwhile
+            image.signed_urls_expire_at = now + timedelta(seconds=lead_time + retry_delay)
+
+    Image.objects.bulk_update(images, ["signed_original_image", "signed_thumbnail", "signed_urls_expire_at"])
+    return f"Refreshed URLs of {refreshed_count} of {len(images)} images."
+
+
+@shared_task()
+def send_waifu():
+    from waifu.utils import get_random_image, refresh_expired_urls
+
     webhooks = DiscordWebhook.objects.filter(is_enabled=True)
 
-    # get random waifu from database
-    total_records = Image.objects.count()
-    random_index = random.randint(0, total_records - 1)
-    waifu = Image.objects.order_by("id")[random_index]
-    new_urls = refresh_expired_urls([waifu.original_image])
-    new_url = new_urls.get(waifu.original_image)
+    waifu = get_random_image(include_nsfw=True)
+    if waifu is None:
+        return
 
+    original_image, _ = waifu.get_image_urls()
+    new_url = refresh_expired_urls([original_image]).get(original_image)
     if not new_url:
         return
 
-    new_url = waifu.original_image
-    if "tumblr.com" not in waifu.original_image:
-        new_urls = refresh_expired_urls([waifu.original_image])
-        new_url = new_urls.get(waifu.original_image)
-
     for webhook in webhooks:
         webhook.send_image(
             new_url,
@@ -0,0 +1,136 @@
+import json
+import time
+from datetime import timedelta
+from unittest.mock import Mock, patch
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from waifu.models import Image
+from waifu.serializers import WaifuDetailSerializer
+from waifu.tasks import refresh_expiring_image_urls
+
+ORIGINAL_IMAGE = "https://cdn.discordapp.com/attachments/858938620425404426/1275631907933261897/animemoeus-waifu.jpg"
+THUMBNAIL = "https://media.discordapp.net/attachments/858938620425404426/1275631907933261897/animemoeus-waifu.jpg"
+
+
+def _signed(url: str, expires_in: int) -> str:
+    return f"{url}?ex={int(time.time()) + expires_in:x}&is=0&hm=abc"
+
+
+class TestRefreshExpiringImageURLs(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.image = Image.objects.create(
+            image_id="1275631907933261897",
+            original_image=ORIGINAL_IMAGE,
+            thumbnail=THUMBNAIL,
+            width=768,
+            height=1024,
+        )
+        self.tumblr_image = Image.objects.create(
+            image_id="626173987744104449",
+            original_image="https://64.media.tumblr.com/3a7de325951453a7a3ad41ea992d2c4c/s1280x1920/image.jpg",
+            thumbnail="https://64.media.tumblr.com/3a7de325951453a7a3ad41ea992d2c4c/s540x810/image.jpg",
+            width=843,
+            height=1199,
+        )
+
+    def _mock_response(self, mock_request, expires_in: int = 60 * 60 * 24):
+        def response(method, url, headers, data, timeout):
+            urls = json.loads(data)["attachment_urls"]
+            mock_response = Mock(ok=True)
+            mock_response.json.return_value = {
+                "refreshed_urls": [{"original": url, "refreshed": _signed(url, expires_in)} for url in urls]
+            }
+            return mock_response
+
+        mock_request.side_effect = response
+
+    @patch("discord.utils.requests.request")
+    def test_refresh_stores_signed_urls(self, mock_request):
+        self._mock_response(mock_request)
+
+        refresh_expiring_image_urls()
+
+        self.image.refresh_from_db()
+        self.assertTrue(self.image.signed_original_image.startswith(ORIGINAL_IMAGE + "?ex="))
+        self.assertTrue(self.image.signed_thumbnail.startswith(THUMBNAIL + "?ex="))
+        self.assertGreater(self.image.signed_urls_expire_at, timezone.now() + timedelta(hours=23))
+        self.assertEqual(mock_request.call_count, 1, "Should refresh the urls in a single batch")
+
+        self.tumblr_image.refresh_from_db()
+        self.assertIsNone(self.tumblr_image.signed_urls_expire_at, "Should skip non Discord images")
+
+        # Nothing expires within the lead time anymore
+        refresh_expiring_image_urls()
+        self.assertEqual(mock_request.call_count, 1)
+
+    @patch("discord.utils.requests.request")
+    def test_refresh_urls_expiring_within_lead_time(self, mock_request):
+        self._mock_response(mock_request)
+        self.image.signed_original_image = _signed(ORIGINAL_IMAGE, 60 * 30)
+        self.image.signed_thumbnail = _signed(THUMBNAIL, 60 * 30)
+        self.image.signed_urls_expire_at = timezone.now() + timedelta(minutes=30)
+        self.image.save()
+
+        refresh_expiring_image_urls(lead_time=60 * 60)
+
+        self.image.refresh_from_db()
+        self.assertGreater(self.image.signed_urls_expire_at, timezone.now() + timedelta(hours=23))
+
+    @patch("discord.utils.requests.request")
+    def test_failed_refresh_is_retried_later(self, mock_request):
+        mock_request.return_value = Mock(ok=True, json=Mock(return_value={"refreshed_urls": []}))
+
+        refresh_expiring_image_urls(lead_time=60 * 60, retry_delay=60 * 15)
+
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.signed_original_image, "")
+        self.assertLess(self.image.signed_urls_expire_at, timezone.now() + timedelta(minutes=76))
+        self.assertEqual(self.image.get_image_urls(), (ORIGINAL_IMAGE, THUMBNAIL), "Should serve the unsigned URLs")
+
+        refresh_expiring_image_urls(lead_time=60 * 60, retry_delay=60 * 15)
+        self.assertEqual(mock_request.call_count, 1, "Should not retry before the retry delay")
+
+    @patch("discord.utils.requests.request")
+    def test_failed_refreshes_are_capped_per_run(self, mock_request):
+        self._mock_response(mock_request)
+        failed_images = [
+            Image.objects.create(
+                image_id=str(i),
+                original_image=ORIGINAL_IMAGE.replace("1275631907933261897", str(i)),
+                thumbnail=THUMBNAIL,
+                width=768,
+                height=1024,
+                signed_urls_expire_at=timezone.now() - timedelta(hours=1),
+            )
+            for i in range(3)
+        ]
+
+        self.assertEqual(
+            refresh_expiring_image_urls(batch_size=3, retry_batch_size=1), "Refreshed URLs of 2 of 2 images."
+        )
+
+        self.image.refresh_from_db()
+        self.assertNotEqual(self.image.signed_original_image, "", "Should refresh the other images first")
+        refreshed = Image.objects.filter(id__in=[image.id for image in failed_images]).exclude(
+            signed_original_image=""
+        )
+        self.assertEqual(refreshed.count(), 1)
+
+    def test_serializer_serves_valid_signed_urls(self):
+        self.image.signed_original_image = _signed(ORIGINAL_IMAGE, 60 * 60)
+        self.image.signed_thumbnail = _signed(THUMBNAIL, 60 * 60)
+        self.image.signed_urls_expire_at = timezone.now() + timedelta(hours=1)
+        self.image.save()
+
+        data = WaifuDetailSerializer(self.image).data
+        self.assertEqual(data["original_image"], self.image.signed_original_image)
+        self.assertEqual(data["thumbnail"], self.image.signed_thumbnail)
+        self.assertNotIn("signed_original_image", data)
+
+        self.image.signed_urls_expire_at = timezone.now() + timedelta(minutes=1)
+        data = WaifuDetailSerializer(self.image).data
+        self.assertEqual(data["original_image"], ORIGINAL_IMAGE, "Should not serve signed urls about to expire")
@@ -3,7 +3,13 @@ from unittest.mock import Mock, patch
 from django.core.exceptions import ImproperlyConfigured
 from django.test import TestCase
 
-from waifu.utils import generate_image_embedding, refresh_expired_urls, refresh_serializer_data_urls
+from waifu.models import Image
+from waifu.utils import (
+    generate_image_embedding,
+    get_random_image,
+    refresh_expired_urls,
+    refresh_serializer_data_urls,
+)
 
 
 class TestRefreshExpiredURLS(TestCase):
@@ -117,6 +123,46 @@ class TestRefreshSerializerDataURLS(TestCase):
         self.assertIn("?refreshed=true", refreshed_serializer_data[0]["original_image"])
 
 
+class TestGetRandomImage(TestCase):
+    def _create_images(self, count: int, is_nsfw: bool = False) -> list[Image]:
+        return [
+            Image.objects.create(image_id=str(index), original_image=f"https://example.com/{index}", is_nsfw=is_nsfw)
+            for index in range(count)
+        ]
+
+    def test_no_images(self):
+        self.assertIsNone(get_random_image())
+
+    def test_random_image_is_uniform_with_gaps(self):
+        images = self._create_images(20)
+        # Leave a large gap in the ids, the image after it must not be picked more often
+        Image.objects.filter(pk__in=[image.pk for image in images[1:15]]).delete()
+
+        picks = [get_random_image().pk for _ in range(600)]
+        counts = [picks.count(pk) for pk in set(picks)]
+        self.assertEqual(len(counts), 6, "Should pick every remaining image")
+        self.assertLess(max(counts), 200)
+
+    def test_random_image_filters_nsfw(self):
+        sfw = self._create_images(1)[0]
+        self._create_images(50, is_nsfw=True)
+
+        for _ in range(10):
+            self.assertEqual(get_random_image(), sfw)
+        self.assertTrue(any(get_random_image(include_nsfw=True).is_nsfw for _ in range(10)))
+
+    def test_random_image_is_uniform_after_nsfw_runs(self):
+        # Each SFW image follows a run of NSFW images of a different length
+        sfw = []
+        for run in (0, 40, 5):
+            self._create_images(run, is_nsfw=True)
+            sfw += self._create_images(1)
+
+        picks = [get_random_image().pk for _ in range(600)]
+        counts = [picks.count(image.pk) for image in sfw]
+        self.assertGreater(min(counts), 100, f"Should pick the SFW images evenly, got {counts}")
+
+
 class TestGenerateImageEmbedding(TestCase):
     def _make_setting(self, api_key="test-api-key"):
         setting = Mock()
@@ -1,9 +1,13 @@
 from unittest.mock import patch
 
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from waifu.models import Image
+from waifu.models import Image, Setting, TelegramUser
+from waifu.views import TelegramUserWebhook
 
 
 def create_waifu_init_data():
@@ -47,6 +51,15 @@ class TestWaifuListView(TestCase):
         data = response.json().get("results")[0]
         self.assertIn("original_image", data)
 
+    def test_get_waifu_list_is_slim(self, mock_refresh):
+        data = self.client.get(reverse("waifu:index")).json().get("results")[0]
+        self.assertNotIn("embedding", data, "Should not serialize the embedding vector")
+        self.assertIn("blur_data_url", data)
+
+        data = self.client.get(reverse("waifu:index"), {"blur": "false"}).json().get("results")[0]
+        self.assertNotIn("blur_data_url", data, "Should omit the blur data when blur=false")
+        self.assertIn("original_image", data)
+
 
 @patch("waifu.views.refresh_serializer_data_urls", side_effect=lambda data: data)
 class TestWaifuDetailView(TestCase):
@@ -134,6 +147,82 @@ class TestWaifuSimilarImagesView(TestCase):
         self.assertEqual(response.status_code, 200, "Should return 200 OK")
         self.assertEqual(len(response.json().get("results")), 3)
 
+    def test_similar_images_next_pages_are_served_from_snapshot(self, mock_refresh):
+        url = reverse("waifu:similar", kwargs={"image_id": self.target.image_id})
+        response = self.client.get(url, {"count": 1})
+        self.assertEqual([item["image_id"] for item in response.json().get("results")], [self.close.image_id])
+
+        # Added after the snapshot was taken, so it must not show up on the following pages
+        Image.objects.create(
+            image_id="closest", original_image="https://example.com/closest.jpg", embedding=_embedding(1.0, 0.0)
+        )
+
+        response = self.client.get(response.json().get("next"))
+        self.assertEqual(response.status_code, 200, "Should return 200 OK")
+        self.assertEqual([item["image_id"] for item in response.json().get("results")], [self.far.image_id])
+        self.assertIsNone(response.json().get("next"))
+        self.assertIsNotNone(response.json().get("previous"))
+
+    def test_similar_images_equal_distances_are_ordered_by_id(self, mock_refresh):
+        twins = [
+            Image.objects.create(
+                image_id=f"twin-{i}",
+                original_image=f"https://example.com/twin-{i}.jpg",
+                embedding=_embedding(0.0, 1.0),
+            )
+            for i in range(3)
+        ]
+
+        url = reverse("waifu:similar", kwargs={"image_id": self.target.image_id})
+        image_ids = []
+        response = self.client.get(url, {"count": 1})
+        while True:
+            image_ids += [item["image_id"] for item in response.json().get("results")]
+            if not response.json().get("next"):
+                break
+            response = self.client.get(response.json().get("next"))
+
+        expected_ties = [image.image_id for image in sorted(twins + [self.far], key=lambda image: -image.id)]
+        self.assertEqual(image_ids, [self.close.image_id] + expected_ties)
+
+    def test_similar_images_returns_404_for_unknown_cursor(self, mock_refresh):
+        url = reverse("waifu:similar", kwargs={"image_id": self.target.image_id})
+        response = self.client.get(url, {"count": 1})
+        next_url = response.json().get("next")
+
+        response = self.client.get(url, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, 404, "Should return 404 Not Found")
+
+        response = self.client.get(next_url + "&nsfw=1")
+        self.assertEqual(response.status_code, 404, "Cursor should not be reusable with different filters")
+
+    def test_similar_images_uses_ef_search_from_settings(self, mock_refresh):
+        setting = Setting.get_solo()
+        setting.similar_images_ef_search = 100
+        setting.save()
+
+        with patch("waifu.views.set_hnsw_ef_search") as mock_set_ef_search:
+            response = self.client.get(reverse("waifu:similar", kwargs={"image_id": self.target.image_id}))
+
+        self.assertEqual(response.status_code, 200, "Should return 200 OK")
+        mock_set_ef_search.assert_called_once_with(100)
+
+    def test_similar_images_ef_search_query_param_overrides_settings(self, mock_refresh):
+        with patch("waifu.views.set_hnsw_ef_search") as mock_set_ef_search:
+            response = self.client.get(
+                reverse("waifu:similar", kwargs={"image_id": self.target.image_id}), {"ef_search": 200}
+            )
+
+        self.assertEqual(response.status_code, 200, "Should return 200 OK")
+        mock_set_ef_search.assert_called_once_with(200)
+
+    def test_similar_images_returns_400_for_invalid_ef_search(self, mock_refresh):
+        for ef_search in ("abc", 0, 1001):
+            response = self.client.get(
+                reverse("waifu:similar", kwargs={"image_id": self.target.image_id}), {"ef_search": ef_search}
+            )
+            self.assertEqual(response.status_code, 400, f"Should return 400 Bad Request for {ef_search}")
+
 
 @patch("waifu.views.refresh_serializer_data_urls", side_effect=lambda data: data)
 class TestRandomWaifuView(TestCase):
@@ -147,3 +236,66 @@ class TestRandomWaifuView(TestCase):
 
         data = response.json()
         self.assertIn("original_image", data)
+
+    def test_get_random_waifu_excludes_nsfw(self, mock_refresh):
+        Image.objects.filter(image_id="1275631907933261897").update(is_nsfw=True)
+
+        for _ in range(10):
+            response = self.client.get(reverse("waifu:random"))
+            self.assertEqual(response.json()["image_id"], "626173987744104449", "Should not return NSFW images")
+
+        image_ids = {self.client.get(reverse("waifu:random"), {"nsfw": "true"}).json()["image_id"] for _ in range(50)}
+        self.assertEqual(image_ids, {"626173987744104449", "1275631907933261897"})
+
+    def test_get_random_waifu_without_images(self, mock_refresh):
+        Image.objects.all().delete()
+        response = self.client.get(reverse("waifu:random"))
+        self.assertEqual(response.status_code, 404, "Should return 404 Not Found")
+
+
+@patch("waifu.models.TelegramUser.send_message", return_value=True)
+class TestTelegramUserWebhook(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("waifu:telegram-webhook")
+        self.update = {
+            "update_id": 10000,
+            "message": {
+                "message_id": 1365,
+                "date": 1441645532,
+                "chat": {"id": 939376599, "first_name": "Arter"},
+                "from": {"id": 939376599, "first_name": "Arter", "last_name": "Tendean", "username": "artertendean"},
+                "text": "/start",
+            },
+        }
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_new_user_is_inactive(self, mock_send_message):
+        response = self.client.post(self.url, data=self.update, content_type="application/json")
+
+        self.assertEqual(response.data, TelegramUserWebhook.INACTIVE_ACCOUNT_MESSAGE)
+        self.assertTrue(TelegramUser.objects.filter(user_id="939376599").exists())
+
+    @patch("waifu.views.PixivIllust")
+    def test_pixiv_illust(self, mock_pixiv_illust, mock_send_message):
+        TelegramUser.objects.create(user_id="939376599", first_name="Arter", is_active=True)
+        self.update["message"]["text"] = "Please https://www.pixiv.net/en/artworks/120000000 thanks"
+
+        self.client.post(self.url, data=self.update, content_type="application/json")
+
+        mock_pixiv_illust.assert_called_once_with("https://www.pixiv.net/en/artworks/120000000")
+        mock_send_message.assert_called_once_with("Trying to upload...")
+
+    def test_known_user_is_served_from_the_cache(self, mock_send_message):
+        TelegramUser.objects.create(user_id="939376599", first_name="Arter", is_active=True)
+        self.client.post(self.url, data=self.update, content_type="application/json")
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.url, data=self.update, content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        queries = [query["sql"] for query in context.captured_queries if "SAVEPOINT" not in query["sql"]]
+        self.assertEqual(queries, [], "Should not query the database for a known user")
+        mock_send_message.assert_called_with("(～￣▽￣)～")
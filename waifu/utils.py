@@ -1,28 +1,31 @@
-import json
 import logging
+import random
 from typing import Any
 
 import requests
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Max, Min
 from pixivpy3 import AppPixivAPI
 
-from .models import Setting
+from discord.utils import DiscordAttachmentURLRefresher
+
+from .models import Image, Setting
 from .tasks import update_pixiv_image_url_and_save_to_db
 
 logger = logging.getLogger(__name__)
 
 
-def refresh_expired_urls(urls: list[str]) -> dict:
+def refresh_expired_urls(urls: list[str], expiry_margin: int | None = None) -> dict:
     """
     Refresh expired Discord attachment URLs using the Discord API.
 
-    This function takes a list of expired attachment URLs and sends a POST request
-    to the Discord API to refresh them. The response contains a mapping of original
-    URLs to their refreshed counterparts.
+    URLs that are still valid, or were refreshed recently, are served without calling Discord.
+    The rest are refreshed in batches, see `DiscordAttachmentURLRefresher` for the details.
 
     Args:
         urls (list[str]): A list of expired URLs that need to be refreshed.
+        expiry_margin (int, optional): Also refresh URLs expiring within this many seconds.
 
     Returns:
         dict: A dictionary mapping the original URLs to the refreshed URLs.
@@ -37,23 +40,47 @@ def refresh_expired_urls(urls: list[str]) -> dict:
         # refreshed_urls will be a dictionary mapping original URLs to new ones.
     """
 
-    api_url = settings.DISCORD_REFRESH_URL
-    headers = {
-        "Authorization": f"Bot {settings.WAIFU_DISCORD_REFRESH_URL_BOT_TOKEN}",
-        "Content-Type": "application/json",
-    }
-    payload = json.dumps({"attachment_urls": urls})
-
-    response = requests.request("POST", api_url, headers=headers, data=payload)
-    if not response.ok:
-        raise Exception("Oh no! Failed to refresh URLs. Discord API isn’t playing nice right now.")
-
-    result = {
-        data.get("original"): data.get("refreshed")
-        for data in response.json().get("refreshed_urls")
-        if data.get("refreshed")
-    }
-    return result
+    refresher = DiscordAttachmentURLRefresher(
+        bot_token=settings.WAIFU_DISCORD_REFRESH_URL_BOT_TOKEN, expiry_margin=expiry_margin
+    )
+    return refresher.refresh(urls)
+
+
+# Number of random ids looked up per query when picking a random image
+RANDOM_IMAGE_CANDIDATES = 10
+# Number of queries of random ids before falling back to an OFFSET scan
+RANDOM_IMAGE_ATTEMPTS = 5
+
+
+def get_random_image(include_nsfw: bool = False) -> Image | None:
+    """
+    Return a random image, or None if there are no images.
+
+    Instead of an OFFSET scan (`order_by("id")[random_index]`), which gets slower as the table
+    grows, random ids are drawn between the lowest and the highest id of the pickable images and
+    looked up by primary key. Every pickable image is equally likely to be among the candidates
+    found, so picking uniformly among them is unbiased by the gaps left by deleted (or filtered out
+    NSFW) images. When the ids are so sparse that `RANDOM_IMAGE_ATTEMPTS` rounds of candidates all
+    miss, the pick falls back to an OFFSET scan, which is uniform too.
+
+    Args:
+        include_nsfw (bool): Whether NSFW images can be picked.
+    """
+
+    queryset = Image.objects.all() if include_nsfw else Image.objects.filter(is_nsfw=False)
+
+    bounds = queryset.aggregate(min_id=Min("id"), max_id=Max("id"))
+    if bounds["min_id"] is None:
+        return None
+
+    for _ in range(RANDOM_IMAGE_ATTEMPTS):
+        candidates = {random.randint(bounds["min_id"], bounds["max_id"]) for _ in range(RANDOM_IMAGE_CANDIDATES)}
+        images = list(queryset.filter(id__in=candidates))
+        if images:
+            return random.choice(images)
+
+    count = queryset.count()
+    return queryset.order_by("id")[random.randrange(count)] if count else None
 
 
 def get_waifu_embedding_api_key() -> str:
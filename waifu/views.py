@@ -1,25 +1,47 @@
-import random
-import re
-
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from pgvector.django import CosineDistance
 from rest_framework import status
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework.generics import GenericAPIView, ListAPIView, RetrieveAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from backend.utils.pgvector import HNSW_EF_SEARCH_MAX, HNSW_EF_SEARCH_MIN, set_hnsw_ef_search, set_hnsw_iterative_scan
 from backend.utils.telegram import TelegramWebhookParser
+from backend.utils.telegram_router import CommandMessage, CommandRouter
 
-from .models import Image, TelegramUser
+from .models import Image, Setting, TelegramUser
 from .pagination import WaifuListPagination, WaifuSimilarPagination
 from .serializers import WaifuDetailSerializer, WaifuListSerialzer
-from .utils import PixivIllust, refresh_serializer_data_urls
+from .utils import PixivIllust, get_random_image, refresh_serializer_data_urls
+
+
+class WaifuListMixin:
+    """
+    Shared by the list views: only load the columns used by `WaifuListSerialzer`.
+    Pass `blur=false` to omit the base64 `blur_data_url` from the results.
+    """
+
+    def include_blur_data_url(self) -> bool:
+        blur = self.request.query_params.get("blur", "true")
+        return str(blur).lower() not in {"0", "false", "f", "no", "n"}
 
+    def get_deferred_fields(self) -> list[str]:
+        deferred_fields = ["embedding"]
+        if not self.include_blur_data_url():
+            deferred_fields.append("blur_data_url")
+        return deferred_fields
 
-class WaifuListView(ListAPIView):
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["include_blur_data_url"] = self.include_blur_data_url()
+        return context
+
+
+class WaifuListView(WaifuListMixin, ListAPIView):
     serializer_class = WaifuListSerialzer
     pagination_class = WaifuListPagination
 
@@ -40,7 +62,7 @@ class WaifuListView(ListAPIView):
         nsfw = self.request.query_params.get("nsfw")
         queryset = Image.objects.all().order_by("-id") if nsfw else Image.objects.filter(is_nsfw=False).order_by("-id")
 
-        return queryset
+        return queryset.defer(*self.get_deferred_fields())
 
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
@@ -52,7 +74,7 @@ class WaifuListView(ListAPIView):
         return self.get_paginated_response(serializer_data)
 
 
-class WaifuSimilarImagesView(ListAPIView):
+class WaifuSimilarImagesView(WaifuListMixin, ListAPIView):
     serializer_class = WaifuListSerialzer
     pagination_class = WaifuSimilarPagination
 
@@ -63,26 +85,52 @@ class WaifuSimilarImagesView(ListAPIView):
 
         nsfw = self.request.query_params.get("nsfw")
         include_nsfw = str(nsfw).lower() in {"1", "true", "t", "yes", "y"}
-        queryset = Image.objects.exclude(pk=target.pk).filter(embedding__isnull=False)
+        queryset = (
+            Image.objects.exclude(pk=target.pk).filter(embedding__isnull=False).defer(*self.get_deferred_fields())
+        )
         if not include_nsfw:
             queryset = queryset.filter(is_nsfw=False)
 
-        return queryset.annotate(similarity_score=1 - CosineDistance("embedding", target.embedding)).order_by(
-            "-similarity_score"
-        )
+        # Order by the raw distance (ascending) so Postgres can use the HNSW index, the id only breaks the ties
+        # of equal distances (with an incremental sort) so the pagination snapshot is deterministic
+        return queryset.annotate(distance=CosineDistance("embedding", target.embedding)).order_by("distance", "-id")
+
+    def get_ef_search(self) -> int:
+        """
+        Return the HNSW ef_search for this request.
+        The `ef_search` query param overrides the value configured in the Waifu settings.
+        """
+
+        ef_search = self.request.query_params.get("ef_search")
+        if ef_search is None:
+            return Setting.get_solo().similar_images_ef_search
+
+        try:
+            ef_search = int(ef_search)
+        except ValueError:
+            raise ValidationError({"ef_search": "A valid integer is required."})
+
+        if not HNSW_EF_SEARCH_MIN <= ef_search <= HNSW_EF_SEARCH_MAX:
+            raise ValidationError(
+                {"ef_search": f"Ensure this value is between {HNSW_EF_SEARCH_MIN} and {HNSW_EF_SEARCH_MAX}."}
+            )
+
+        return ef_search
 
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
+        ef_search = self.get_ef_search()
 
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            serializer_data = refresh_serializer_data_urls(serializer.data)
-            return self.get_paginated_response(serializer_data)
+        # The HNSW settings are transaction scoped, so the queryset must be evaluated in the same transaction.
+        # The iterative scan lets the pagination snapshot collect more than ef_search neighbours.
+        with transaction.atomic():
+            set_hnsw_ef_search(ef_search)
+            set_hnsw_iterative_scan()
+            page = self.paginate_queryset(queryset)
 
-        serializer = self.get_serializer(queryset, many=True)
+        serializer = self.get_serializer(page, many=True)
         serializer_data = refresh_serializer_data_urls(serializer.data)
-        return Response(serializer_data)
+        return self.get_paginated_response(serializer_data)
 
 
 class WaifuDetailView(RetrieveAPIView):
@@ -100,19 +148,19 @@ class WaifuDetailView(RetrieveAPIView):
 class RandomWaifuView(GenericAPIView):
     serializer_class = WaifuDetailSerializer
 
-    def get_queryset(self):
-        # get random waifu from database
-        total_records = Image.objects.count()
+    def get_object(self):
+        nsfw = self.request.query_params.get("nsfw")
+        include_nsfw = str(nsfw).lower() in {"1", "true", "t", "yes", "y"}
 
-        # Generate a random index within the range of total_records
-        random_index = random.randint(0, total_records - 1)
+        image = get_random_image(include_nsfw=include_nsfw)
+        if image is None:
+            raise NotFound("No images available.")
 
-        # Retrieve a single random record using the generated index
-        return Image.objects.order_by("id")[random_index]
+        return image
 
     def get(self, request):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset)
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
         serializer_data = refresh_serializer_data_urls([serializer.data])[0]
         return Response(serializer_data)
 
@@ -127,41 +175,38 @@ class TelegramUserWebhook(APIView):
         if not webhook.data:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            telegram_user = TelegramUser.objects.get(user_id=webhook.data.get("user").get("id"))
-        except TelegramUser.DoesNotExist:
-            telegram_user = TelegramUser.objects.create(
-                user_id=webhook.data.get("user").get("id"),
-                first_name=webhook.data.get("user").get("first_name"),
-                last_name=webhook.data.get("user").get("last_name") or "",
-                username=webhook.data.get("user").get("username") or "",
-            )
+        telegram_user, _ = TelegramUser.get_or_create_cached(webhook.data.get("user"))
+
+        return Response(telegram_router.dispatch(webhook.data.get("text_message"), telegram_user))
+
+
+def check_banned(message: CommandMessage):
+    if message.user.is_banned:
+        message.user.send_message(TelegramUserWebhook.BANNED_ACCOUNT_MESSAGE)
+        return TelegramUserWebhook.BANNED_ACCOUNT_MESSAGE
+
+
+def check_active(message: CommandMessage):
+    if not message.user.is_active:
+        message.user.send_message(TelegramUserWebhook.INACTIVE_ACCOUNT_MESSAGE)
+        return TelegramUserWebhook.INACTIVE_ACCOUNT_MESSAGE
+
 
-        if telegram_user.is_banned:
-            telegram_user.send_message(TelegramUserWebhook.BANNED_ACCOUNT_MESSAGE)
-            return Response(TelegramUserWebhook.BANNED_ACCOUNT_MESSAGE)
+telegram_router = CommandRouter("waifu", middlewares=[check_banned, check_active])
 
-        if not telegram_user.is_active:
-            telegram_user.send_message(TelegramUserWebhook.INACTIVE_ACCOUNT_MESSAGE)
-            return Response(TelegramUserWebhook.INACTIVE_ACCOUNT_MESSAGE)
 
-        if webhook.data.get("text_message") == "/start":
-            telegram_user.send_message("(～￣▽￣)～")
+@telegram_router.command("/start")
+def handle_start_command(message: CommandMessage):
+    message.user.send_message("(～￣▽￣)～")
 
-        if "https://www.pixiv.net/" in webhook.data.get("text_message"):
-            url_pattern = re.compile(r"https://www.pixiv.net/\S+")
-            message = webhook.data.get("text_message")
-            match = url_pattern.search(message)
 
-            if match:
-                illust_link = match.group()
-            else:
-                telegram_user.send_message("Can't get the Pixiv illustation URL from the message 🥲")
+@telegram_router.match(r"https://www\.pixiv\.net/\S+", name="pixiv_illust")
+def handle_pixiv_illust(message: CommandMessage):
+    pixiv_illust = PixivIllust(message.match.group())
+    pixiv_illust.save()
+    message.user.send_message("Trying to upload...")
 
-            pixiv_illust = PixivIllust(illust_link)
-            pixiv_illust.save()
-            telegram_user.send_message("Trying to upload...")
-        else:
-            telegram_user.send_message("Unknown message 🧠")
 
-        return Response()
+@telegram_router.default()
+def handle_other_messages(message: CommandMessage):
+    message.user.send_message("Unknown message 🧠")